@@ -1,19 +1,65 @@
 import streamlit as st
-from data.note_storage import NotesStorage
-from backend.qa_engine import QAEngine
-from backend.question_generator import QuestionGenerator
-from backend.answer_evaluator import AnswerEvaluator
-from backend.flashcard_generator import FlashcardGenerator
 import os
+import tempfile
+import uuid
+
+# Characters of a note shown when its content is expanded
+NOTE_PREVIEW_CHARS = 5000
+# Notes listed per page on the Upload page
+NOTES_PAGE_SIZE = 20
+# Seconds before cached listings are reread, so notes added through the API show up
+LISTING_CACHE_TTL = 300
 
 st.set_page_config(page_title="StudySense", layout="wide")
 
-# Initialize components
-storage = NotesStorage()
-qa_engine = QAEngine()
-question_generator = QuestionGenerator()
-answer_evaluator = AnswerEvaluator()
-flashcard_generator = FlashcardGenerator()
+# Components are built once per server process and shared by every session and rerun.
+# Their modules are imported here rather than at the top, so that chromadb and the
+# embedding model are only loaded once a page needs them.
+@st.cache_resource
+def get_storage():
+    from data.note_storage import NotesStorage
+    return NotesStorage()
+
+@st.cache_resource
+def get_qa_engine():
+    from backend.qa_engine import QAEngine
+    return QAEngine(get_storage())
+
+@st.cache_resource
+def get_question_generator():
+    from backend.question_generator import QuestionGenerator
+    return QuestionGenerator(get_storage())
+
+@st.cache_resource
+def get_answer_evaluator():
+    from backend.answer_evaluator import AnswerEvaluator
+    return AnswerEvaluator(get_storage())
+
+@st.cache_resource
+def get_flashcard_generator():
+    from backend.flashcard_generator import FlashcardGenerator
+    return FlashcardGenerator(get_storage())
+
+@st.cache_data(ttl=LISTING_CACHE_TTL)
+def load_subjects():
+    return get_storage().list_subjects()
+
+@st.cache_data(ttl=LISTING_CACHE_TTL)
+def load_notes_page(subject, cursor):
+    # Metadata only; a note's text is fetched when asked for
+    return get_storage().list_notes(subject, NOTES_PAGE_SIZE, cursor, fields=["id", "file_name", "created_at", "content_length"])
+
+@st.cache_data(ttl=LISTING_CACHE_TTL)
+def load_note_preview(subject, note_id):
+    return get_storage().get_note_content(subject, note_id, 0, NOTE_PREVIEW_CHARS)
+
+def clear_listings():
+    """
+    Drop cached listings after the notes change.
+    """
+    load_subjects.clear()
+    load_notes_page.clear()
+    load_note_preview.clear()
 
 # Sidebar for navigation
 st.sidebar.title("StudySense")
@@ -24,51 +70,72 @@ if page == "Upload Notes":
     st.header("Upload Notes")
     subject = st.text_input("Subject (e.g., Math, Physics)")
     uploaded_file = st.file_uploader("Upload Note (TXT, DOCX, PDF)", type=["txt", "docx", "pdf"])
+    replace = st.checkbox("Replace notes already uploaded under this file name")
     
     if st.button("Upload") and subject and uploaded_file:
-        # Save file temporarily
-        file_path = f"temp_{uploaded_file.name}"
-        with open(file_path, "wb") as f:
+        # Save file temporarily; the extension tells the extractor how to read it
+        fd, file_path = tempfile.mkstemp(prefix="temp_", suffix=os.path.splitext(uploaded_file.name)[1])
+        with os.fdopen(fd, "wb") as f:
             f.write(uploaded_file.getbuffer())
         
         # Save to Chroma DB
         try:
-            storage.save_note_from_file(file_path, subject)
+            get_storage().save_note_from_file(file_path, subject, uploaded_file.name, replace)
+            clear_listings()
             st.success(f"Note uploaded for {subject}")
         except Exception as e:
             st.error(f"Error: {str(e)}")
         finally:
             os.remove(file_path)
     
-    # List subjects
-    subjects = storage.list_subjects()
+    # Browse one subject's notes a page at a time
     st.subheader("Available Subjects")
-    for subj in subjects:
-        with st.expander(subj):
-            notes = storage.load_notes_by_subject(subj)
-            for note in notes:
-                st.write(f"Created: {note.created_at}")
-                st.write(note.content)
+    subjects = load_subjects()
+    browse_subject = st.selectbox("Browse notes in", subjects) if subjects else None
+    if browse_subject:
+        # Cursors of the pages visited so far, so Previous can go back
+        cursors = st.session_state.setdefault(f"note_cursors_{browse_subject}", [None])
+        notes, next_cursor = load_notes_page(browse_subject, cursors[-1])
+        for note in notes:
+            st.write(f"**{note['file_name'] or 'Unknown'}** (created {note['created_at']})")
+            if st.checkbox("Show content", key=f"content_{note['id']}"):
+                st.write(load_note_preview(browse_subject, note["id"]))
+                if (note["content_length"] or 0) > NOTE_PREVIEW_CHARS:
+                    st.caption(f"Showing the first {NOTE_PREVIEW_CHARS} of {note['content_length']} characters")
+        if not notes:
+            st.write("No notes in this subject yet.")
+
+        col1, col2 = st.columns(2)
+        with col1:
+            if len(cursors) > 1 and st.button("Previous"):
+                cursors.pop()
+                st.rerun()
+        with col2:
+            if next_cursor and st.button("Next"):
+                cursors.append(next_cursor)
+                st.rerun()
 
 # Ask Questions
 elif page == "Ask Questions":
     st.header("Ask Questions")
-    subject = st.selectbox("Select Subject", storage.list_subjects())
+    subject = st.selectbox("Select Subject", load_subjects())
     question = st.text_area("Your Question")
+    # Questions in one browser session can follow up on earlier answers
+    session_id = st.session_state.setdefault("qa_session_id", str(uuid.uuid4()))
     
     if st.button("Submit Question") and subject and question:
-        answer = qa_engine.answer_question(question, subject)
+        answer = get_qa_engine().answer_question(question, subject, session_id)
         st.write("**Answer:**")
         st.write(answer)
 
 # Practice Questions
 elif page == "Practice Questions":
     st.header("Practice Questions")
-    subject = st.selectbox("Select Subject", storage.list_subjects())
+    subject = st.selectbox("Select Subject", load_subjects())
     num_questions = st.slider("Number of Questions", 1, 5, 2)
     
     if st.button("Generate Questions") and subject:
-        questions = question_generator.generate_questions(subject, num_questions)
+        questions = get_question_generator().generate_questions(subject, num_questions)
         st.session_state["questions"] = questions
         st.session_state["current_question"] = 0
         st.session_state["user_answers"] = ["" for _ in questions]
@@ -84,7 +151,7 @@ elif page == "Practice Questions":
             col1, col2 = st.columns(2)
             with col1:
                 if st.button("Submit Answer"):
-                    result = answer_evaluator.evaluate_answer(
+                    result = get_answer_evaluator().evaluate_answer(
                         question["question"], user_answer, subject
                     )
                     st.write(f"**Score:** {result['score']}")
@@ -98,11 +165,11 @@ elif page == "Practice Questions":
 # Flashcards
 elif page == "Flashcards":
     st.header("Flashcards")
-    subject = st.selectbox("Select Subject", storage.list_subjects())
+    subject = st.selectbox("Select Subject", load_subjects())
     num_flashcards = st.slider("Number of Flashcards", 1, 10, 3)
     
     if st.button("Generate Flashcards") and subject:
-        flashcards = flashcard_generator.generate_flashcards(subject, num_flashcards)
+        flashcards = get_flashcard_generator().generate_flashcards(subject, num_flashcards)
         st.session_state["flashcards"] = flashcards
         st.session_state["current_flashcard"] = 0
     
@@ -116,4 +183,4 @@ elif page == "Flashcards":
             if st.button("Next Flashcard"):
                 st.session_state["current_flashcard"] += 1
         else:
-            st.write("All flashcards reviewed! Generate new flashcards to continue.")
\ No newline at end of file
+            st.write("All flashcards reviewed! Generate new flashcards to continue.")
@@ -1,45 +1,196 @@
+import asyncio
+import statistics
+from typing import List
 from data.note_storage import NotesStorage
-from services.ollama_api import query_ollama
-import json 
+from services.ollama_api import get_async_client, StreamError, OLLAMA_MODEL, OLLAMA_MAX_PARALLEL
+from services.response_cache import ResponseCache, get_response_cache, fingerprint
+from services.structured_output import (
+    EVALUATION, StructuredOutputError, generate_structured, parse_structured, query_structured, repair_structured,
+    response_format
+)
+from utils.helpers import extract_partial_int, extract_partial_string
+
+# Sampling settings for grading; part of the response cache key
+EVALUATION_TEMPERATURE = 0.5
+EVALUATION_MAX_TOKENS = 500
+# Answers graded at once by evaluate_answers_async
+BULK_GRADING_CONCURRENCY = OLLAMA_MAX_PARALLEL
+# Keep the model (and the cached notes + question prefix) loaded for the whole grading run
+BULK_GRADING_KEEP_ALIVE = "30m"
+
 class AnswerEvaluator:
-    def __init__(self):
-        self.storage = NotesStorage()
+    def __init__(self, storage: NotesStorage = None, cache: ResponseCache = None):
+        self.storage = storage or NotesStorage()
+        self.cache = cache or get_response_cache()
+        self._template_id = fingerprint(self._build_prompt("", "", ""))
 
-    def evaluate_answer(self, question: str, user_answer: str, subject: str) -> dict:
+    def _build_prompt(self, question: str, user_answer: str, context: str) -> str:
         """
-        Evaluate a user's long-answer response against notes.
-        Returns dict with score (0-100) and feedback.
+        Build the Mistral grading prompt. The answer comes last so every answer to the same
+        question shares one prompt prefix, which Ollama reuses from its prompt cache.
         """
-        # Retrieve relevant notes
-        collection = self.storage._get_collection(subject)
-        results = collection.query(
-            query_texts=[question],
-            n_results=3
-        )
-        context = "\n".join(results["documents"][0]) if results["documents"] else ""
-        if not context:
-            return {"score": 0, "feedback": "No relevant notes found for this subject."}
-
-        # Build prompt for Mistral
-        prompt = f"""Using the following notes:
+        return f"""Using the following notes:
 {context}
 
 Evaluate the user's answer to the question: {question}
-User's answer: {user_answer}
 
 Provide:
 1. A score (0-100) based on accuracy, completeness, and relevance.
 2. Brief feedback explaining the score.
 
 Format the output as a JSON object:
-{{"score": <int>, "feedback": "<string>"}}"""
-        
-        # Query Ollama
-        response = query_ollama(prompt, temperature=0.5, max_tokens=500)
-        
-        # Parse JSON response
+{{"score": <int>, "feedback": "<string>"}}
+
+User's answer: {user_answer}"""
+
+    def _prepare(self, question: str, user_answer: str, subject: str) -> dict:
+        """
+        Retrieve context for the question and look up a cached grade for this exact answer.
+        Returns dict with result (cached or None), context and cache key.
+        """
+        # Retrieve relevant passages
+        context = self._retrieve_context(question, subject)
+        if not context:
+            return {"result": {"score": 0, "feedback": "No relevant notes found for this subject."}}
+        return self._lookup(question, user_answer, subject, context)
+
+    def _retrieve_context(self, question: str, subject: str) -> str:
+        passages = self.storage.query_passages(subject, question, n_results=3)
+        return "\n".join(passages)
+
+    def _lookup(self, question: str, user_answer: str, subject: str, context: str) -> dict:
+        """
+        Look up a cached grade for this answer given already retrieved context.
+        """
+        key = self.cache.make_key(
+            self.storage._normalize_subject(subject), self._template_id, OLLAMA_MODEL, EVALUATION_TEMPERATURE,
+            context, f"{question}\n{user_answer}"
+        )
+        return {"result": self.cache.get(key), "context": context, "key": key}
+
+    def _finish(self, prepared: dict, result) -> dict:
+        """
+        Cache a validated evaluation, or fall back to an error result when there is none.
+        """
+        if result is None:
+            return {"score": 0, "feedback": "Error: Failed to evaluate answer."}
+        self.cache.set(prepared["key"], result)
+        return result
+
+    def evaluate_answer(self, question: str, user_answer: str, subject: str) -> dict:
+        """
+        Evaluate a user's long-answer response against notes.
+        Returns dict with score (0-100) and feedback.
+        """
+        prepared = self._prepare(question, user_answer, subject)
+        if prepared["result"] is not None:
+            return prepared["result"]
+
+        # Query Ollama for a schema-constrained, validated evaluation
+        result = query_structured(
+            self._build_prompt(question, user_answer, prepared["context"]), EVALUATION,
+            temperature=EVALUATION_TEMPERATURE, max_tokens=EVALUATION_MAX_TOKENS
+        )
+        return self._finish(prepared, result)
+
+    async def evaluate_answer_async(self, question: str, user_answer: str, subject: str) -> dict:
+        """
+        Non-blocking variant of evaluate_answer for use inside the event loop.
+        """
+        prepared = await asyncio.to_thread(self._prepare, question, user_answer, subject)
+        if prepared["result"] is not None:
+            return prepared["result"]
+
+        result = await generate_structured(
+            self._build_prompt(question, user_answer, prepared["context"]), EVALUATION,
+            temperature=EVALUATION_TEMPERATURE, max_tokens=EVALUATION_MAX_TOKENS
+        )
+        return self._finish(prepared, result)
+
+    async def stream_evaluation(self, question: str, user_answer: str, subject: str):
+        """
+        Grade an answer while Ollama is still generating. Yields (event, data) tuples:
+        ("score", {"score": int}) as soon as the score is complete, ("feedback", {"feedback": str})
+        text deltas, and finally ("result", dict) with the fully parsed evaluation, or
+        ("error", {"error": str}) if Ollama fails.
+        """
+        prepared = await asyncio.to_thread(self._prepare, question, user_answer, subject)
+        if prepared["result"] is not None:
+            yield "result", prepared["result"]
+            return
+
+        buffer = ""
+        score = None
+        feedback_sent = 0
+        async for token in get_async_client().stream(
+            self._build_prompt(question, user_answer, prepared["context"]),
+            temperature=EVALUATION_TEMPERATURE, max_tokens=EVALUATION_MAX_TOKENS, format=response_format(EVALUATION)
+        ):
+            if isinstance(token, StreamError):
+                yield "error", {"error": str(token)}
+                return
+            buffer += token
+            if score is None:
+                score = extract_partial_int(buffer, "score")
+                if score is not None:
+                    yield "score", {"score": score}
+            feedback = extract_partial_string(buffer, "feedback")
+            if feedback and len(feedback) > feedback_sent:
+                yield "feedback", {"feedback": feedback[feedback_sent:]}
+                feedback_sent = len(feedback)
+
         try:
-            result = json.loads(response)
-            return result
-        except json.JSONDecodeError:
-            return {"score": 0, "feedback": "Error: Failed to evaluate answer."}
\ No newline at end of file
+            result = parse_structured(buffer, EVALUATION)
+        except StructuredOutputError as e:
+            result = await repair_structured(buffer, EVALUATION, str(e))
+        yield "result", self._finish(prepared, result)
+
+    async def evaluate_answers_async(self, question: str, user_answers: List[str], subject: str,
+                                     max_concurrency: int = BULK_GRADING_CONCURRENCY) -> dict:
+        """
+        Grade many answers to one question. Context is retrieved once, identical answers are
+        graded once, and at most max_concurrency answers are with Ollama at a time.
+        Returns dict with per-answer results (in input order) and aggregate statistics.
+        """
+        context = await asyncio.to_thread(self._retrieve_context, question, subject)
+        if not context:
+            results = [{"score": 0, "feedback": "No relevant notes found for this subject."} for _ in user_answers]
+            return {"results": results, "statistics": {**self._statistics([]), "count": len(results), "failed": len(results)}}
+
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def grade(user_answer: str) -> dict:
+            prepared = self._lookup(question, user_answer, subject, context)
+            if prepared["result"] is not None:
+                return prepared["result"]
+            async with semaphore:
+                result = await generate_structured(
+                    self._build_prompt(question, user_answer, context), EVALUATION,
+                    temperature=EVALUATION_TEMPERATURE, max_tokens=EVALUATION_MAX_TOKENS,
+                    keep_alive=BULK_GRADING_KEEP_ALIVE
+                )
+            return self._finish(prepared, result)
+
+        unique_answers = list(dict.fromkeys(user_answers))
+        grades = dict(zip(unique_answers, await asyncio.gather(*(grade(answer) for answer in unique_answers))))
+        results = [dict(grades[answer]) for answer in user_answers]
+        return {"results": results, "statistics": self._statistics(results)}
+
+    def _statistics(self, results: List[dict]) -> dict:
+        """
+        Aggregate scores; results whose feedback starts with "Error:" count as failed.
+        """
+        scores = [
+            result["score"] for result in results
+            if isinstance(result.get("score"), (int, float)) and not str(result.get("feedback", "")).startswith("Error:")
+        ]
+        return {
+            "count": len(results),
+            "graded": len(scores),
+            "failed": len(results) - len(scores),
+            "mean": statistics.fmean(scores) if scores else None,
+            "median": statistics.median(scores) if scores else None,
+            "stdev": statistics.pstdev(scores) if scores else None,
+            "min": min(scores) if scores else None,
+            "max": max(scores) if scores else None
+        }
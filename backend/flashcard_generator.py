@@ -1,25 +1,27 @@
+import asyncio
+import random
 from data.note_storage import NotesStorage
-from services.ollama_api import query_ollama
-import json
+from services.structured_output import query_structured, generate_structured, FLASHCARDS
+from utils.context_selection import CONTEXT_TOKEN_BUDGET
 
 class FlashcardGenerator:
-    def __init__(self):
-        self.storage = NotesStorage()
+    def __init__(self, storage: NotesStorage = None, context_token_budget: int = CONTEXT_TOKEN_BUDGET):
+        self.storage = storage or NotesStorage()
+        self.context_token_budget = context_token_budget
+        self._rng = random.Random()
 
-    def generate_flashcards(self, subject: str, num_flashcards: int = 3) -> list[dict]:
+    def _load_context(self, subject: str) -> str:
         """
-        Generate flashcards from notes in the specified subject.
-        Returns list of dicts with question and answer.
+        Collect a bounded, diverse slice of the subject's notes as generation context.
         """
-        # Retrieve notes
-        collection = self.storage._get_collection(subject)
-        results = collection.get()
-        context = "\n".join(results["documents"]) if results["documents"] else ""
-        if not context:
-            return []
+        passages = self.storage.sample_passages(subject, self.context_token_budget, rng=self._rng)
+        return "\n".join(passages)
 
-        # Build prompt for Mistral
-        prompt = f"""Using the following notes:
+    def _build_prompt(self, context: str, num_flashcards: int) -> str:
+        """
+        Build the Mistral prompt for flashcard generation.
+        """
+        return f"""Using the following notes:
 {context}
 
 Generate {num_flashcards} flashcards for quick review. Each flashcard should have:
@@ -30,13 +32,38 @@ Format the output as a JSON list of objects:
 [
     {{"question": "<question>", "answer": "<answer>"}}
 ]"""
-        
-        # Query Ollama
-        response = query_ollama(prompt, temperature=0.7, max_tokens=1000)
-        
-        # Parse JSON response
-        try:
-            flashcards = json.loads(response)
-            return flashcards
-        except json.JSONDecodeError:
-            return [{"error": "Failed to generate valid flashcards"}]
\ No newline at end of file
+
+    def _finish(self, flashcards) -> list[dict]:
+        """
+        Fall back to an error entry when no valid flashcards could be generated.
+        """
+        if flashcards is None:
+            return [{"error": "Failed to generate valid flashcards"}]
+        return flashcards
+
+    def generate_flashcards(self, subject: str, num_flashcards: int = 3) -> list[dict]:
+        """
+        Generate flashcards from notes in the specified subject.
+        Returns list of dicts with question and answer.
+        """
+        # Retrieve notes
+        context = self._load_context(subject)
+        if not context:
+            return []
+
+        # Query Ollama for schema-constrained, validated output
+        flashcards = query_structured(self._build_prompt(context, num_flashcards), FLASHCARDS, temperature=0.7, max_tokens=1000)
+        return self._finish(flashcards)
+
+    async def generate_flashcards_async(self, subject: str, num_flashcards: int = 3) -> list[dict]:
+        """
+        Non-blocking variant of generate_flashcards for use inside the event loop.
+        """
+        context = await asyncio.to_thread(self._load_context, subject)
+        if not context:
+            return []
+
+        flashcards = await generate_structured(
+            self._build_prompt(context, num_flashcards), FLASHCARDS, temperature=0.7, max_tokens=1000
+        )
+        return self._finish(flashcards)
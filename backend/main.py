@@ -1,16 +1,48 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, File, UploadFile, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import List
+from fastapi.responses import FileResponse, PlainTextResponse, StreamingResponse
+from starlette.background import BackgroundTask
+from pydantic import BaseModel, Field
+from typing import List, Optional
 from data.note_storage import NotesStorage
-from data.flashcard_storage import FlashcardStorage
+from data.flashcard_storage import FlashcardStorage, MAX_DUE_LIMIT
+from data import subject_archive
 from backend.qa_engine import QAEngine
 from backend.question_generator import QuestionGenerator
 from backend.answer_evaluator import AnswerEvaluator
 from backend.flashcard_generator import FlashcardGenerator
+from services.ollama_api import close_async_client, StreamError
+from services.ingestion import IngestionQueue
+from services.generation_jobs import GenerationQueue
+from services import metrics
+import asyncio
+import json
 import os
+import tempfile
+import zipfile
 
-app = FastAPI(title="StudySense API")
+# Seconds between client-disconnect checks while an LLM call is in flight
+DISCONNECT_POLL_INTERVAL = 0.5
+# Largest number of questions or flashcards one batch job may ask for
+MAX_GENERATION_COUNT = 20
+# Largest number of jobs in one batch generation request
+MAX_BATCH_JOBS = 100
+# Largest number of answers one bulk evaluation request may grade
+MAX_BULK_ANSWERS = 50
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    await generation_queue.shutdown()
+    await close_async_client()
+    await asyncio.to_thread(ingestion_queue.shutdown)
+    await asyncio.to_thread(storage.embeddings.close)
+
+app = FastAPI(title="StudySense API", lifespan=lifespan)
+
+# Label everything measured during a request with its route
+app.add_middleware(metrics.MetricsMiddleware)
 
 # Enable CORS for frontend
 app.add_middleware(
@@ -21,18 +53,70 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize components
+# Initialize components; they all share one storage, Chroma client and embedding model
 storage = NotesStorage()
 flashcard_storage = FlashcardStorage()
-qa_engine = QAEngine()
-question_generator = QuestionGenerator()
-answer_evaluator = AnswerEvaluator()
-flashcard_generator = FlashcardGenerator()
+qa_engine = QAEngine(storage)
+question_generator = QuestionGenerator(storage)
+answer_evaluator = AnswerEvaluator(storage)
+flashcard_generator = FlashcardGenerator(storage)
+ingestion_queue = IngestionQueue(storage)
+generation_queue = GenerationQueue(question_generator, flashcard_generator, flashcard_storage)
+
+# Queue depths and the session count are read when /metrics is scraped
+metrics.CallbackMetric(
+    "studysense_embedding_queue_depth", "Texts waiting for the embedding batcher.",
+    lambda: storage.embeddings.stats().get("queue_depth", 0)
+)
+metrics.CallbackMetric(
+    "studysense_ingestion_queue_depth", "Extracted files waiting to be embedded and stored.",
+    lambda: ingestion_queue.pending()
+)
+metrics.CallbackMetric(
+    "studysense_generation_queue_depth", "Batch generation jobs not yet started.",
+    lambda: generation_queue.pending()
+)
+metrics.CallbackMetric(
+    "studysense_conversation_sessions", "Conversations held in memory for follow-up questions.",
+    lambda: len(qa_engine.memory)
+)
+
+async def cancel_on_disconnect(request: Request, coro):
+    """
+    Await coro, cancelling it if the client disconnects first so Ollama stops generating.
+    """
+    task = asyncio.ensure_future(coro)
+    while True:
+        done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_INTERVAL)
+        if done:
+            return task.result()
+        if await request.is_disconnected():
+            task.cancel()
+            raise HTTPException(status_code=499, detail="Client disconnected")
+
+def sse_event(event: str, data) -> str:
+    """
+    Format one server-sent event with a JSON payload.
+    """
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def sse_response(events) -> StreamingResponse:
+    """
+    Wrap an async iterator of SSE strings. Starlette closes the iterator when the
+    client disconnects, which in turn cancels the Ollama generation.
+    """
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 # Pydantic models
 class QuestionRequest(BaseModel):
     question: str
     subject: str
+    # Questions sending the same session_id can follow up on earlier answers
+    session_id: Optional[str] = None
 
 class PracticeQuestionRequest(BaseModel):
     subject: str
@@ -43,6 +127,11 @@ class AnswerEvaluationRequest(BaseModel):
     user_answer: str
     subject: str
 
+class BulkAnswerEvaluationRequest(BaseModel):
+    question: str
+    user_answers: List[str] = Field(min_length=1, max_length=MAX_BULK_ANSWERS)
+    subject: str
+
 class FlashcardRequest(BaseModel):
     subject: str
     num_flashcards: int
@@ -52,6 +141,25 @@ class SaveFlashcardRequest(BaseModel):
     question: str
     answer: str
 
+class FlashcardItem(BaseModel):
+    question: str
+    answer: str
+
+class ImportFlashcardsRequest(BaseModel):
+    subject: str
+    flashcards: List[FlashcardItem]
+
+class ReviewRequest(BaseModel):
+    # again, hard, good or easy
+    rating: str
+
+class GenerationJob(BaseModel):
+    subject: str
+    count: int = Field(gt=0, le=MAX_GENERATION_COUNT)
+
+class BatchGenerationRequest(BaseModel):
+    jobs: List[GenerationJob] = Field(max_length=MAX_BATCH_JOBS)
+
 class NoteResponse(BaseModel):
     subject: str
     file_name: str
@@ -63,6 +171,16 @@ class FlashcardResponse(BaseModel):
     question: str
     answer: str
     created_at: str
+    due_at: Optional[str] = None
+    interval_days: float = 0.0
+    ease: Optional[float] = None
+    repetitions: int = 0
+    lapses: int = 0
+    last_reviewed_at: Optional[str] = None
+
+class DueFlashcardsResponse(BaseModel):
+    flashcards: List[FlashcardResponse]
+    due_count: int
 
 class SubjectRequest(BaseModel):
     subject: str
@@ -84,63 +202,194 @@ async def create_subject(request: SubjectRequest):
 
 @app.get("/notes/{subject}", response_model=List[NoteResponse])
 async def get_notes(subject: str):
-    notes = storage.load_notes_by_subject(subject)
-    collection = storage._get_collection(subject)
-    results = collection.get(include=["metadatas"])
-    file_names = [meta.get("file_name", "Unknown") for meta in results["metadatas"]]
+    notes, _ = await asyncio.to_thread(
+        storage.list_notes, subject, None, fields=["subject", "file_name", "created_at"]
+    )
     return [
-        {"subject": note.subject, "file_name": file_names[i], "created_at": note.created_at.isoformat()}
-        for i, note in enumerate(notes)
+        {"subject": note["subject"], "file_name": note["file_name"] or "Unknown", "created_at": note["created_at"]}
+        for note in notes
     ]
 
-@app.post("/upload")
-async def upload_note(subject: str, files: List[UploadFile] = File(...)):
-    results = []
+@app.get("/subjects/{subject}/notes", response_model=dict)
+async def list_notes(subject: str, limit: int = 50, cursor: Optional[str] = None, fields: Optional[str] = None):
+    # fields is a comma-separated projection of NOTE_FIELDS
+    if not 1 <= limit <= 1000:
+        raise HTTPException(status_code=400, detail="limit must be between 1 and 1000")
+    try:
+        notes, next_cursor = await asyncio.to_thread(
+            storage.list_notes, subject, limit, cursor, fields.split(",") if fields else None
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"notes": notes, "next_cursor": next_cursor}
+
+@app.get("/subjects/{subject}/notes/{note_id}/content", response_class=PlainTextResponse)
+async def get_note_content(subject: str, note_id: str, start: int = 0, end: Optional[int] = None):
+    # start/end select a [start, end) character range of the note
+    if start < 0 or (end is not None and end < start):
+        raise HTTPException(status_code=400, detail="Invalid range")
+    content = await asyncio.to_thread(storage.get_note_content, subject, note_id, start, end)
+    if content is None:
+        raise HTTPException(status_code=404, detail=f"Note {note_id} not found in {subject}")
+    return content
+
+@app.get("/subjects/{subject}/export")
+async def export_subject(subject: str):
+    # A zip of the subject's passages, flashcards and embeddings; see data/subject_archive.py
+    if not storage.has_subject(subject):
+        raise HTTPException(status_code=404, detail=f"Subject {subject} not found")
+    fd, archive_path = tempfile.mkstemp(prefix="export_", suffix=".zip")
+    os.close(fd)
+    try:
+        await asyncio.to_thread(subject_archive.export_subject, storage, flashcard_storage, subject, archive_path)
+    except Exception as e:
+        os.remove(archive_path)
+        raise HTTPException(status_code=500, detail=f"Failed to export subject: {str(e)}")
+    return FileResponse(
+        archive_path,
+        media_type="application/zip",
+        filename=f"{storage._normalize_subject(subject)}.studysense.zip",
+        background=BackgroundTask(os.remove, archive_path)
+    )
+
+@app.post("/subjects/{subject}/import", response_model=dict)
+async def import_subject(subject: str, file: UploadFile = File(...), replace: bool = False):
+    # Restores an archive from /export into subject without re-embedding; replace deletes the subject's current contents first
+    try:
+        return await asyncio.to_thread(subject_archive.import_subject, storage, flashcard_storage, file.file, subject, replace)
+    except (ValueError, zipfile.BadZipFile) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to import subject: {str(e)}")
+
+@app.post("/upload", response_model=dict, status_code=202)
+async def upload_note(subject: str, files: List[UploadFile] = File(...), replace: bool = False):
     for file in files:
         if not file.filename.endswith((".txt", ".docx", ".pdf")):
             raise HTTPException(status_code=400, detail=f"Unsupported file format for {file.filename}. Use txt, docx, or pdf.")
-        
-        file_path = f"temp_{file.filename}"
-        try:
-            with open(file_path, "wb") as f:
-                f.write(await file.read())
-            note = storage.save_note_from_file(file_path, subject, file.filename)
-            results.append({
-                "subject": note.subject,
-                "file_name": file.filename,
-                "created_at": note.created_at.isoformat()
-            })
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=str(e))
-        finally:
+
+    # Extraction and embedding happen in the background; the temp files are removed by the ingestion queue.
+    # With replace, each file replaces the notes already stored under its name.
+    queued = []
+    try:
+        for file in files:
+            fd, file_path = tempfile.mkstemp(prefix="temp_", suffix=os.path.splitext(file.filename)[1])
+            queued.append((file.filename, file_path))
+            with os.fdopen(fd, "wb") as f:
+                while chunk := await file.read(1024 * 1024):
+                    f.write(chunk)
+        return ingestion_queue.submit(subject, queued, replace)
+    except Exception as e:
+        for _, file_path in queued:
             if os.path.exists(file_path):
                 os.remove(file_path)
-    return results
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/jobs/{job_id}", response_model=dict)
+async def get_job(job_id: str):
+    job = ingestion_queue.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return job
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/embeddings/stats", response_model=dict)
+async def get_embedding_stats():
+    return storage.embeddings.stats()
 
 @app.post("/ask", response_model=dict)
-async def ask_question(request: QuestionRequest):
-    answer = qa_engine.answer_question(request.question, request.subject)
+async def ask_question(request: QuestionRequest, http_request: Request):
+    answer = await cancel_on_disconnect(
+        http_request, qa_engine.answer_question_async(request.question, request.subject, request.session_id)
+    )
     return {"question": request.question, "answer": answer}
 
+@app.post("/ask/stream")
+async def ask_question_stream(request: QuestionRequest):
+    async def events():
+        # Failures end the stream with an error event instead of done, since the headers are already sent
+        try:
+            async for token in qa_engine.stream_answer(request.question, request.subject, request.session_id):
+                if isinstance(token, StreamError):
+                    yield sse_event("error", {"error": str(token)})
+                    return
+                yield sse_event("token", {"token": token})
+        except Exception as e:
+            yield sse_event("error", {"error": f"Error: {str(e)}"})
+            return
+        yield sse_event("done", {"question": request.question})
+    return sse_response(events())
+
+@app.delete("/sessions/{session_id}", response_model=dict)
+async def clear_session(session_id: str):
+    removed = qa_engine.memory.clear(session_id)
+    if not removed:
+        raise HTTPException(status_code=404, detail=f"Session {session_id} not found")
+    return {"message": f"Session {session_id} cleared"}
+
 @app.post("/practice", response_model=List[dict])
-async def generate_practice_questions(request: PracticeQuestionRequest):
-    questions = question_generator.generate_questions(request.subject, request.num_questions)
+async def generate_practice_questions(request: PracticeQuestionRequest, http_request: Request):
+    questions = await cancel_on_disconnect(
+        http_request, question_generator.generate_questions_async(request.subject, request.num_questions)
+    )
     return questions
 
+@app.post("/practice/batch", response_model=dict, status_code=202)
+async def generate_practice_questions_batch(request: BatchGenerationRequest):
+    # Questions are kept on the batch; poll /batches/{id} for progress and results
+    return generation_queue.submit("practice", [(job.subject, job.count) for job in request.jobs])
+
+@app.get("/batches/{batch_id}", response_model=dict)
+async def get_batch(batch_id: str):
+    batch = generation_queue.get_batch(batch_id)
+    if batch is None:
+        raise HTTPException(status_code=404, detail=f"Batch {batch_id} not found")
+    return batch
+
 @app.post("/evaluate", response_model=dict)
-async def evaluate_answer(request: AnswerEvaluationRequest):
-    result = answer_evaluator.evaluate_answer(request.question, request.user_answer, request.subject)
+async def evaluate_answer(request: AnswerEvaluationRequest, http_request: Request):
+    result = await cancel_on_disconnect(
+        http_request, answer_evaluator.evaluate_answer_async(request.question, request.user_answer, request.subject)
+    )
     return result
 
+@app.post("/evaluate/bulk", response_model=dict)
+async def evaluate_answers_bulk(request: BulkAnswerEvaluationRequest, http_request: Request):
+    return await cancel_on_disconnect(
+        http_request, answer_evaluator.evaluate_answers_async(request.question, request.user_answers, request.subject)
+    )
+
+@app.post("/evaluate/stream")
+async def evaluate_answer_stream(request: AnswerEvaluationRequest):
+    async def events():
+        try:
+            async for event, data in answer_evaluator.stream_evaluation(request.question, request.user_answer, request.subject):
+                yield sse_event(event, data)
+        except Exception as e:
+            yield sse_event("error", {"error": f"Error: {str(e)}"})
+    return sse_response(events())
+
 @app.post("/flashcards", response_model=List[FlashcardResponse])
-async def generate_flashcards(request: FlashcardRequest):
+async def generate_flashcards(request: FlashcardRequest, http_request: Request):
     try:
-        flashcards = flashcard_generator.generate_flashcards(request.subject, request.num_flashcards)
-        saved_flashcards = flashcard_storage.save_flashcards(request.subject, flashcards)
+        flashcards = await cancel_on_disconnect(
+            http_request, flashcard_generator.generate_flashcards_async(request.subject, request.num_flashcards)
+        )
+        saved_flashcards = await asyncio.to_thread(flashcard_storage.save_flashcards, request.subject, flashcards)
         return saved_flashcards
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to generate/save flashcards: {str(e)}")
 
+@app.post("/flashcards/batch", response_model=dict, status_code=202)
+async def generate_flashcards_batch(request: BatchGenerationRequest):
+    # Each job's flashcards are saved as soon as they are generated
+    return generation_queue.submit("flashcards", [(job.subject, job.count) for job in request.jobs])
+
 @app.post("/flashcards/save", response_model=FlashcardResponse)
 async def save_flashcard(request: SaveFlashcardRequest):
     try:
@@ -152,6 +401,16 @@ async def save_flashcard(request: SaveFlashcardRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to save flashcard: {str(e)}")
 
+@app.post("/flashcards/import", response_model=List[FlashcardResponse])
+async def import_flashcards(request: ImportFlashcardsRequest):
+    try:
+        flashcards = [flashcard.model_dump() for flashcard in request.flashcards]
+        return await asyncio.to_thread(flashcard_storage.save_flashcards, request.subject, flashcards)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to import flashcards: {str(e)}")
+
 @app.get("/flashcards/{subject}", response_model=List[FlashcardResponse])
 async def get_flashcards(subject: str):
     try:
@@ -160,6 +419,28 @@ async def get_flashcards(subject: str):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to retrieve flashcards: {str(e)}")
 
+@app.get("/flashcards/{subject}/due", response_model=DueFlashcardsResponse)
+async def get_due_flashcards(subject: str, limit: int = 20):
+    if not 1 <= limit <= MAX_DUE_LIMIT:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {MAX_DUE_LIMIT}")
+    try:
+        flashcards, due_count = await asyncio.to_thread(flashcard_storage.get_due_flashcards, subject, limit)
+        return {"flashcards": flashcards, "due_count": due_count}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to retrieve due flashcards: {str(e)}")
+
+@app.post("/flashcards/{subject}/{flashcard_id}/review", response_model=FlashcardResponse)
+async def review_flashcard(subject: str, flashcard_id: str, request: ReviewRequest):
+    try:
+        flashcard = await asyncio.to_thread(flashcard_storage.record_review, subject, flashcard_id, request.rating)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to record review: {str(e)}")
+    if flashcard is None:
+        raise HTTPException(status_code=404, detail=f"Flashcard {flashcard_id} not found for subject {subject}")
+    return flashcard
+
 @app.delete("/flashcard/{subject}/{flashcard_id}", response_model=dict)
 async def delete_flashcard(subject: str, flashcard_id: str):
     try:
@@ -0,0 +1,216 @@
+import os
+import re
+import threading
+import time
+import zlib
+from collections import OrderedDict, deque
+from typing import Optional, Tuple
+from data.lexical_index import tokenize
+from utils.text_preprocessing import CHARS_PER_TOKEN, estimate_tokens
+
+# Upper bound on conversation history spliced into one prompt, in estimated tokens
+MEMORY_TOKEN_BUDGET = int(os.getenv("MEMORY_TOKEN_BUDGET", "600"))
+# Most recent turns kept word for word; older turns are folded into the rolling summary
+MEMORY_RECENT_TURNS = int(os.getenv("MEMORY_RECENT_TURNS", "4"))
+# Cap on a session's rolling summary; the oldest summary lines are dropped past it
+MEMORY_SUMMARY_TOKENS = int(os.getenv("MEMORY_SUMMARY_TOKENS", "300"))
+MEMORY_MAX_SESSIONS = int(os.getenv("MEMORY_MAX_SESSIONS", "1000"))
+# Seconds without a question after which a session is forgotten
+MEMORY_IDLE_TTL = float(os.getenv("MEMORY_IDLE_TTL", "3600"))
+# Characters of an answer kept in its summary line
+SUMMARY_ANSWER_CHARS = 160
+
+# Words too common to say whether an earlier turn is about the same thing as a new question
+_STOPWORDS = frozenset("""
+a an and are as at be because been but by can could did do does for from had has have how i if in into is it its
+me my of on or so than that the their them then there these they this to was we were what when where which who
+why will with would you your about also just more most much not only other some such tell explain please again
+""".split())
+_FIRST_SENTENCE = re.compile(r"(.+?[.!?])(?:\s|$)", re.S)
+
+_conversation_memory = None
+
+
+def _terms(text: str) -> frozenset:
+    return frozenset(term for term in tokenize(text) if len(term) > 2 and term not in _STOPWORDS)
+
+
+class _Turn:
+    """
+    One question and answer. The answer is stored zlib-compressed, since sessions mostly sit idle.
+    """
+    __slots__ = ("question", "_answer", "terms")
+
+    def __init__(self, question: str, answer: str):
+        self.question = question
+        self._answer = zlib.compress(answer.encode("utf-8"))
+        self.terms = _terms(f"{question} {answer}")
+
+    @property
+    def answer(self) -> str:
+        return zlib.decompress(self._answer).decode("utf-8")
+
+    def render(self) -> str:
+        return f"Student: {self.question}\nYou: {self.answer}"
+
+    def digest(self) -> Tuple[str, frozenset]:
+        """
+        One summary line for this turn: the question and the first sentence of the answer.
+        """
+        answer = " ".join(self.answer.split())
+        match = _FIRST_SENTENCE.match(answer)
+        gist = match.group(1) if match else answer
+        if len(gist) > SUMMARY_ANSWER_CHARS:
+            gist = gist[:SUMMARY_ANSWER_CHARS].rsplit(" ", 1)[0] + "..."
+        return f"- Asked \"{self.question}\": {gist}", self.terms
+
+
+class _Session:
+    __slots__ = ("turns", "summary", "summary_tokens", "last_used")
+
+    def __init__(self):
+        self.turns = deque()
+        # (line, terms) pairs for turns that no longer fit in turns, oldest first
+        self.summary = deque()
+        self.summary_tokens = 0
+        self.last_used = time.monotonic()
+
+
+class ConversationMemory:
+    """
+    Per-session history for follow-up questions, bounded in every direction: the last
+    recent_turns turns are kept verbatim, older ones are folded into a capped rolling summary,
+    idle sessions expire and the least recently used are evicted past max_sessions.
+    Only the parts of a session that bear on the new question are spliced into its prompt.
+    Sessions are per subject, so the same session_id can be used across subjects.
+    """
+
+    def __init__(
+        self,
+        token_budget: int = MEMORY_TOKEN_BUDGET,
+        recent_turns: int = MEMORY_RECENT_TURNS,
+        summary_tokens: int = MEMORY_SUMMARY_TOKENS,
+        max_sessions: int = MEMORY_MAX_SESSIONS,
+        idle_ttl: float = MEMORY_IDLE_TTL
+    ):
+        self.token_budget = token_budget
+        self.recent_turns = recent_turns
+        self.summary_tokens = summary_tokens
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        # (session_id, subject) -> _Session, least recently used first
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _evict_idle(self) -> None:
+        now = time.monotonic()
+        while self._sessions:
+            key, session = next(iter(self._sessions.items()))
+            if now - session.last_used <= self.idle_ttl and len(self._sessions) <= self.max_sessions:
+                break
+            del self._sessions[key]
+
+    def _get(self, session_id: str, subject: str, create: bool) -> Optional[_Session]:
+        self._evict_idle()
+        key = (session_id, subject)
+        session = self._sessions.get(key)
+        if session is None and create:
+            session = self._sessions[key] = _Session()
+            self._evict_idle()
+        if session is not None:
+            session.last_used = time.monotonic()
+            self._sessions.move_to_end(key)
+        return session
+
+    def add_turn(self, session_id: str, subject: str, question: str, answer: str) -> None:
+        """
+        Record an answered question. subject should already be normalized.
+        """
+        turn = _Turn(question, answer)
+        with self._lock:
+            session = self._get(session_id, subject, create=True)
+            session.turns.append(turn)
+            while len(session.turns) > self.recent_turns:
+                line, terms = session.turns.popleft().digest()
+                session.summary.append((line, terms))
+                session.summary_tokens += estimate_tokens(line)
+            while session.summary and session.summary_tokens > self.summary_tokens:
+                line, _ = session.summary.popleft()
+                session.summary_tokens -= estimate_tokens(line)
+
+    def recall(self, session_id: str, subject: str, question: str) -> Tuple[str, str]:
+        """
+        Return (history, previous_question) for a new question in the session: the history
+        text to splice into the prompt, within the token budget, and the question asked just
+        before, for resolving follow-ups at retrieval. Both are empty for a new session.
+
+        The previous turn is always included, since a follow-up like "and why is that?" refers
+        to it without sharing any words with it. Older turns and summary lines are included
+        only if they share terms with the question, most overlapping first.
+        """
+        with self._lock:
+            session = self._get(session_id, subject, create=False)
+            if session is None or not session.turns:
+                return "", ""
+            turns = list(session.turns)
+            summary = list(session.summary)
+
+        question_terms = _terms(question)
+        budget = self.token_budget
+        latest = turns[-1].render()
+        if estimate_tokens(latest) > budget:
+            latest = latest[:(budget - 1) * CHARS_PER_TOKEN] + "..."
+        budget -= estimate_tokens(latest)
+
+        # (overlap, position, text); positions keep the chosen items in conversation order
+        candidates = [
+            (len(question_terms & terms), position, line)
+            for position, (line, terms) in enumerate(summary)
+        ] + [
+            (len(question_terms & turn.terms), len(summary) + position, turn)
+            for position, turn in enumerate(turns[:-1])
+        ]
+        chosen = []
+        for overlap, position, item in sorted(candidates, key=lambda c: (-c[0], -c[1])):
+            if overlap == 0:
+                break
+            text = item if isinstance(item, str) else item.render()
+            cost = estimate_tokens(text)
+            if cost <= budget:
+                chosen.append((position, text))
+                budget -= cost
+
+        chosen.sort()
+        lines = [text for position, text in chosen if position < len(summary)]
+        earlier_turns = [text for position, text in chosen if position >= len(summary)]
+        parts = []
+        if lines:
+            parts.append("Earlier in the conversation:\n" + "\n".join(lines))
+        parts.extend(earlier_turns)
+        parts.append(latest)
+        return "\n\n".join(parts), turns[-1].question
+
+    def clear(self, session_id: str) -> int:
+        """
+        Forget a session in every subject. Returns the number of subject sessions removed.
+        """
+        with self._lock:
+            keys = [key for key in self._sessions if key[0] == session_id]
+            for key in keys:
+                del self._sessions[key]
+        return len(keys)
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._evict_idle()
+            return len(self._sessions)
+
+
+def get_conversation_memory() -> ConversationMemory:
+    """
+    Return the process-wide ConversationMemory, creating it on first use.
+    """
+    global _conversation_memory
+    if _conversation_memory is None:
+        _conversation_memory = ConversationMemory()
+    return _conversation_memory
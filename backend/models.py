@@ -1,8 +1,12 @@
 from pydantic import BaseModel
 from datetime import datetime
+from typing import List, Optional
 
 class Note(BaseModel):
     id: str
     subject: str
     content: str
-    created_at: datetime
\ No newline at end of file
+    created_at: datetime
+    file_name: Optional[str] = None
+    # Notes this one replaced when it was saved with replace=True
+    replaced_note_ids: List[str] = []
\ No newline at end of file
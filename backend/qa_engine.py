@@ -1,37 +1,148 @@
+import asyncio
+from backend.memory import ConversationMemory, get_conversation_memory
 from data.note_storage import NotesStorage
-from services.ollama_api import query_ollama
+from services import metrics
+from services.ollama_api import query_ollama, get_async_client, StreamError, OLLAMA_MODEL
+from services.response_cache import ResponseCache, get_response_cache, fingerprint
+
+# Sampling settings for answers; part of the response cache key
+ANSWER_TEMPERATURE = 0.5
+ANSWER_MAX_TOKENS = 200
+# Spliced into the prompt ahead of the question when the session has relevant history
+HISTORY_TEMPLATE = """Our conversation so far:
+{history}
+
+"""
 
 class QAEngine:
-    def __init__(self):
-        self.storage = NotesStorage()
+    def __init__(self, storage: NotesStorage = None, cache: ResponseCache = None, memory: ConversationMemory = None):
+        self.storage = storage or NotesStorage()
+        self.cache = cache or get_response_cache()
+        self.memory = memory or get_conversation_memory()
+        # Editing the prompt template changes this id, so stale answers are never served
+        self._template_id = fingerprint(self._build_prompt("", "") + HISTORY_TEMPLATE)
 
-    def answer_question(self, question: str, subject: str) -> str:
+    def _build_prompt(self, question: str, context: str, history: str = "") -> str:
         """
-        Answer a question using notes from the specified subject.
+        Build the Mistral prompt for answering a question from retrieved notes
+        and, for follow-up questions, the relevant part of the conversation.
         """
-        # Retrieve relevant notes
-        collection = self.storage._get_collection(subject)
-        results = collection.query(
-            query_texts=[question],
-            n_results=3  # Top 3 most relevant notes
-        )
-        
-        # Combine notes into context
-        context = "\n".join(results["documents"][0]) if results["documents"] else ""
-        if not context:
-            return "No relevant notes found for this subject."
-
-        # Build prompt for Mistral
-        prompt = f"""Using the following notes:
+        history = HISTORY_TEMPLATE.format(history=history) if history else ""
+        return f"""Using the following notes:
 {context}
 
-Answer the question: {question}
+{history}Answer the question: {question}
 Provide a concise and accurate answer based only on the notes and if the context is not enough add your own knowledge as well.
 And while evaluating dont say 'users' answers. speak like you are talking to the user directly.
 treat yourself like a professor and they are your student as well as friends.
-The answer should be shown with proper spacing and if required proper code snippets. 
+The answer should be shown with proper spacing and if required proper code snippets.
 """
-        
-        # Query Ollama
-        response = query_ollama(prompt, temperature=0.5, max_tokens=200)
-        return response
\ No newline at end of file
+
+    def _prepare(self, question: str, subject: str, session_id: str = None) -> dict:
+        """
+        Retrieve context for the question and look it up in the response cache.
+        With a session_id, relevant history from that session is added to the prompt.
+        Returns dict with answer (cached or None), context, history, cache key and query embedding.
+        """
+        normalized_subject = self.storage._normalize_subject(subject)
+        metrics.set_subject(normalized_subject)
+        history, previous_question = ("", "")
+        if session_id:
+            history, previous_question = self.memory.recall(session_id, normalized_subject, question)
+        prepared = {"answer": None, "question": question, "subject": normalized_subject, "session_id": session_id}
+
+        # A follow-up is retrieved together with the question it follows, since
+        # "and why is that?" alone matches nothing in the notes
+        retrieval_query = f"{previous_question}\n{question}" if history else question
+        embedding = self.storage.embed_query(retrieval_query)
+        if not history:
+            prepared["answer"] = self.cache.find_similar(
+                normalized_subject, self._template_id, OLLAMA_MODEL, ANSWER_TEMPERATURE, embedding
+            )
+            if prepared["answer"] is not None:
+                return prepared
+
+        # Retrieve relevant passages
+        passages = self.storage.query_passages(subject, retrieval_query, n_results=3, query_embedding=embedding)  # Top 3 most relevant passages
+
+        # Combine passages into context
+        context = "\n".join(passages)
+        if not context:
+            prepared["answer"] = "No relevant notes found for this subject."
+            return prepared
+
+        # The same question after a different conversation is a different prompt
+        key = self.cache.make_key(
+            normalized_subject, self._template_id, OLLAMA_MODEL, ANSWER_TEMPERATURE, f"{context}\n{history}", question
+        )
+        prepared.update(answer=self.cache.get(key), context=context, history=history, key=key, embedding=embedding)
+        return prepared
+
+    def _prompt(self, prepared: dict) -> str:
+        return self._build_prompt(prepared["question"], prepared["context"], prepared["history"])
+
+    def _store(self, prepared: dict, answer: str) -> None:
+        """
+        Cache a generated answer unless generation failed. Answers to follow-ups are
+        cached by exact key only, as near-duplicate lookup ignores the conversation.
+        """
+        if answer and not answer.startswith("Error:"):
+            embedding = None if prepared["history"] else prepared["embedding"]
+            self.cache.set(prepared["key"], answer, embedding=embedding)
+
+    def _remember(self, prepared: dict, answer: str) -> None:
+        """
+        Add the answered question to its session, if it has one.
+        """
+        if prepared["session_id"] and answer and not answer.startswith("Error:"):
+            self.memory.add_turn(prepared["session_id"], prepared["subject"], prepared["question"], answer)
+
+    def answer_question(self, question: str, subject: str, session_id: str = None) -> str:
+        """
+        Answer a question using notes from the specified subject. Questions sharing
+        a session_id can follow up on earlier answers.
+        """
+        prepared = self._prepare(question, subject, session_id)
+        if prepared["answer"] is None:
+            # Query Ollama
+            response = query_ollama(self._prompt(prepared), temperature=ANSWER_TEMPERATURE, max_tokens=ANSWER_MAX_TOKENS)
+            self._store(prepared, response)
+            prepared["answer"] = response
+        self._remember(prepared, prepared["answer"])
+        return prepared["answer"]
+
+    async def answer_question_async(self, question: str, subject: str, session_id: str = None) -> str:
+        """
+        Non-blocking variant of answer_question for use inside the event loop.
+        """
+        prepared = await asyncio.to_thread(self._prepare, question, subject, session_id)
+        if prepared["answer"] is None:
+            response = await get_async_client().generate(
+                self._prompt(prepared), temperature=ANSWER_TEMPERATURE, max_tokens=ANSWER_MAX_TOKENS
+            )
+            self._store(prepared, response)
+            prepared["answer"] = response
+        self._remember(prepared, prepared["answer"])
+        return prepared["answer"]
+
+    async def stream_answer(self, question: str, subject: str, session_id: str = None):
+        """
+        Yield answer tokens as Ollama generates them. If generation fails, the last item
+        is a StreamError.
+        """
+        prepared = await asyncio.to_thread(self._prepare, question, subject, session_id)
+        if prepared["answer"] is not None:
+            self._remember(prepared, prepared["answer"])
+            yield prepared["answer"]
+            return
+
+        tokens = []
+        async for token in get_async_client().stream(
+            self._prompt(prepared), temperature=ANSWER_TEMPERATURE, max_tokens=ANSWER_MAX_TOKENS
+        ):
+            tokens.append(token)
+            yield token
+        # Only reached when the stream finished; a disconnected client leaves nothing cached or remembered
+        if not any(isinstance(token, StreamError) for token in tokens):
+            self._store(prepared, "".join(tokens))
+            self._remember(prepared, "".join(tokens))
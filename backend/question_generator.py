@@ -1,25 +1,27 @@
+import asyncio
+import random
 from data.note_storage import NotesStorage
-from services.ollama_api import query_ollama
-import json
+from services.structured_output import query_structured, generate_structured, PRACTICE_QUESTIONS
+from utils.context_selection import CONTEXT_TOKEN_BUDGET
 
 class QuestionGenerator:
-    def __init__(self):
-        self.storage = NotesStorage()
+    def __init__(self, storage: NotesStorage = None, context_token_budget: int = CONTEXT_TOKEN_BUDGET):
+        self.storage = storage or NotesStorage()
+        self.context_token_budget = context_token_budget
+        self._rng = random.Random()
 
-    def generate_questions(self, subject: str, num_questions: int = 2) -> list[dict]:
+    def _load_context(self, subject: str) -> str:
         """
-        Generate open-ended, long-answer practice questions from notes in the specified subject.
-        Returns list of dicts with question and type ('long-answer').
+        Collect a bounded, diverse slice of the subject's notes as generation context.
         """
-        # Retrieve notes
-        collection = self.storage._get_collection(subject)
-        results = collection.get()
-        context = "\n".join(results["documents"]) if results["documents"] else ""
-        if not context:
-            return []
+        passages = self.storage.sample_passages(subject, self.context_token_budget, rng=self._rng)
+        return "\n".join(passages)
 
-        # Build prompt for Mistral
-        prompt = f"""Using the following notes:
+    def _build_prompt(self, context: str, num_questions: int) -> str:
+        """
+        Build the Mistral prompt for practice question generation.
+        """
+        return f"""Using the following notes:
 {context}
 
 Generate {num_questions} open-ended, long-answer practice questions that require detailed explanations or essay-style responses. For each, provide:
@@ -30,13 +32,38 @@ Format the output as a JSON list of objects. Example:
 [
     {{"question": "Explain the significance of the Pythagorean theorem in geometry.", "type": "long-answer"}}
 ]"""
-        
-        # Query Ollama
-        response = query_ollama(prompt, temperature=0.7, max_tokens=1000)
-        
-        # Parse JSON response
-        try:
-            questions = json.loads(response)
-            return questions
-        except json.JSONDecodeError:
-            return [{"error": "Failed to generate valid questions"}]
\ No newline at end of file
+
+    def _finish(self, questions) -> list[dict]:
+        """
+        Fall back to an error entry when no valid questions could be generated.
+        """
+        if questions is None:
+            return [{"error": "Failed to generate valid questions"}]
+        return questions
+
+    def generate_questions(self, subject: str, num_questions: int = 2) -> list[dict]:
+        """
+        Generate open-ended, long-answer practice questions from notes in the specified subject.
+        Returns list of dicts with question and type ('long-answer').
+        """
+        # Retrieve notes
+        context = self._load_context(subject)
+        if not context:
+            return []
+
+        # Query Ollama for schema-constrained, validated output
+        questions = query_structured(self._build_prompt(context, num_questions), PRACTICE_QUESTIONS, temperature=0.7, max_tokens=1000)
+        return self._finish(questions)
+
+    async def generate_questions_async(self, subject: str, num_questions: int = 2) -> list[dict]:
+        """
+        Non-blocking variant of generate_questions for use inside the event loop.
+        """
+        context = await asyncio.to_thread(self._load_context, subject)
+        if not context:
+            return []
+
+        questions = await generate_structured(
+            self._build_prompt(context, num_questions), PRACTICE_QUESTIONS, temperature=0.7, max_tokens=1000
+        )
+        return self._finish(questions)
@@ -0,0 +1,64 @@
+import os
+import random
+from typing import List, Tuple
+
+# Topics and vocabulary for synthetic notes; each note draws mostly from one topic
+# so retrieval has something to discriminate on
+TOPICS = {
+    "biology": ["cell", "mitochondria", "membrane", "protein", "enzyme", "dna", "ribosome", "osmosis", "organism", "gene"],
+    "physics": ["force", "energy", "momentum", "velocity", "mass", "friction", "gravity", "wave", "quantum", "field"],
+    "history": ["empire", "treaty", "revolution", "dynasty", "war", "colony", "trade", "parliament", "king", "reform"],
+    "computing": ["algorithm", "array", "pointer", "recursion", "compiler", "cache", "thread", "hash", "graph", "queue"],
+}
+FILLER = ["the", "of", "and", "is", "in", "a", "which", "that", "by", "with", "for", "as", "this", "its"]
+
+
+def generate_note(rng: random.Random, topic: str, words: int) -> str:
+    """
+    One note of roughly the given length: sentences mixing topic terms and filler, split into paragraphs.
+    """
+    vocabulary = TOPICS[topic]
+    sentences = []
+    written = 0
+    while written < words:
+        length = rng.randint(8, 20)
+        sentence = [rng.choice(vocabulary) if rng.random() < 0.4 else rng.choice(FILLER) for _ in range(length)]
+        sentences.append(" ".join(sentence).capitalize() + ".")
+        written += length
+    paragraphs = [" ".join(sentences[i:i + 6]) for i in range(0, len(sentences), 6)]
+    return f"# {topic.title()} notes\n\n" + "\n\n".join(paragraphs) + "\n"
+
+
+def generate_corpus(num_notes: int, words_per_note: int, seed: int = 0) -> List[Tuple[str, str]]:
+    """
+    Return num_notes (file_name, text) pairs cycling through TOPICS. The same seed gives the same corpus.
+    """
+    rng = random.Random(seed)
+    topics = list(TOPICS)
+    return [
+        (f"{topics[i % len(topics)]}_{i:05d}.txt", generate_note(rng, topics[i % len(topics)], words_per_note))
+        for i in range(num_notes)
+    ]
+
+
+def generate_questions(count: int, seed: int = 0) -> List[str]:
+    """
+    Distinct questions about the corpus vocabulary, so response caching does not hide LLM cost.
+    """
+    rng = random.Random(seed)
+    terms = [term for vocabulary in TOPICS.values() for term in vocabulary]
+    return [f"How does {rng.choice(terms)} relate to {rng.choice(terms)}? ({i})" for i in range(count)]
+
+
+def write_corpus(directory: str, num_notes: int, words_per_note: int, seed: int = 0) -> List[str]:
+    """
+    Write a generated corpus as .txt files and return their paths.
+    """
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for file_name, text in generate_corpus(num_notes, words_per_note, seed):
+        path = os.path.join(directory, file_name)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+        paths.append(path)
+    return paths
@@ -0,0 +1,124 @@
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Words the stand-in model "generates"
+_WORDS = ("the", "cell", "energy", "process", "because", "structure", "function", "system", "example", "result")
+
+
+class MockOllama:
+    """
+    Stand-in for Ollama's /api/generate. Each request waits latency seconds (prompt processing)
+    and then emits tokens at tokens_per_second, streamed or all at once. Requests that ask for
+    JSON get output matching what the app expects (flashcards, practice questions or a grade).
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.2, tokens_per_second: float = 30.0,
+                 max_tokens: int = 60):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.max_tokens = max_tokens
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "MockOllama":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="mock-ollama", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _handler(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.0"
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                if self.path != "/api/generate":
+                    self.send_error(404)
+                    return
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                with mock._lock:
+                    mock.requests += 1
+                mock._generate(self, body)
+
+        return Handler
+
+    def _completion(self, body: dict) -> str:
+        prompt = body.get("prompt", "")
+        rng = random.Random(prompt)
+        count = re.search(r"Generate (\d+)", prompt)
+        count = int(count.group(1)) if count else 1
+        if body.get("format") is None:
+            limit = min(body.get("options", {}).get("num_predict", self.max_tokens), self.max_tokens)
+            return " ".join(rng.choice(_WORDS) for _ in range(limit))
+        if "flashcards" in prompt:
+            return json.dumps([
+                {"question": f"What is {rng.choice(_WORDS)} {i}?", "answer": f"It is the {rng.choice(_WORDS)}."}
+                for i in range(count)
+            ])
+        if "practice questions" in prompt:
+            return json.dumps([
+                {"question": f"Explain the role of {rng.choice(_WORDS)} {i}.", "type": "long-answer"}
+                for i in range(count)
+            ])
+        return json.dumps({"score": rng.randint(0, 100), "feedback": "Covers the main points."})
+
+    def _generate(self, handler, body: dict):
+        text = self._completion(body)
+        # Split on whitespace but keep it, so the streamed pieces join back into the exact text
+        tokens = re.findall(r"\S+\s*|\s+", text)
+        time.sleep(self.latency)
+        handler.send_response(200)
+        handler.send_header("Content-Type", "application/x-ndjson" if body.get("stream") else "application/json")
+        handler.end_headers()
+        started = time.perf_counter()
+        if body.get("stream"):
+            for token in tokens:
+                time.sleep(1 / self.tokens_per_second)
+                handler.wfile.write(json.dumps({"response": token, "done": False}).encode() + b"\n")
+                handler.wfile.flush()
+            final = {"response": "", "done": True}
+        else:
+            time.sleep(len(tokens) / self.tokens_per_second)
+            final = {"response": text, "done": True}
+        final.update(eval_count=len(tokens), eval_duration=int((time.perf_counter() - started) * 1e9))
+        handler.wfile.write(json.dumps(final).encode() + b"\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a stand-in Ollama server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--latency", type=float, default=0.2, help="Seconds before the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=30.0)
+    args = parser.parse_args()
+    mock = MockOllama(args.host, args.port, args.latency, args.tokens_per_second).start()
+    print(f"Mock Ollama listening on {mock.url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        mock.stop()
+
+
+if __name__ == "__main__":
+    main()
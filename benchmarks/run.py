@@ -0,0 +1,244 @@
+"""
+Offline load benchmarks for the StudySense API.
+
+Starts a stand-in Ollama server and the API (in a scratch directory, so the checked-in
+databases are untouched), loads a synthetic corpus and drives each scenario at a fixed
+concurrency, reporting throughput, p50/p95/p99 latency and peak memory.
+
+    python -m benchmarks.run --scenarios ask,evaluate --requests 100 --concurrency 8
+    python -m benchmarks.run --notes 500 --words 2000 --fake-embeddings --output results.json
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import re
+import resource
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCENARIOS = ("upload", "ask", "practice", "evaluate", "flashcards")
+SUBJECT = "Benchmark"
+# Seconds between /jobs polls while waiting for an upload to be ingested
+JOB_POLL_INTERVAL = 0.05
+
+
+class HashingEmbedder:
+    """
+    Deterministic bag-of-words embedder with the SentenceTransformer encode() interface, for
+    runs where the real model is unavailable or should be excluded from the measurement.
+    """
+
+    def __init__(self, dimensions: int = 384):
+        self.dimensions = dimensions
+
+    def encode(self, texts, batch_size=32, **kwargs):
+        import numpy as np
+        if isinstance(texts, str):
+            texts = [texts]
+        vectors = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in re.findall(r"\w+", text.lower()):
+                vectors[row, int(hashlib.md5(word.encode()).hexdigest()[:8], 16) % self.dimensions] += 1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms == 0, 1.0, norms)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run offline load benchmarks against a stand-in Ollama.")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"Comma-separated subset of {', '.join(SCENARIOS)}")
+    parser.add_argument("--notes", type=int, default=50, help="Notes in the synthetic corpus")
+    parser.add_argument("--words", type=int, default=800, help="Words per note")
+    parser.add_argument("--requests", type=int, default=50, help="Requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.2, help="Mock Ollama seconds before the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=30.0, help="Mock Ollama generation speed")
+    parser.add_argument("--ollama-parallel", type=int, default=4, help="OLLAMA_MAX_PARALLEL for the API")
+    parser.add_argument("--fake-embeddings", action="store_true", help="Use a hashing embedder instead of SentenceTransformer")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Also write the results as JSON to this path")
+    return parser.parse_args()
+
+
+def percentile(sorted_values, q: float) -> float:
+    """
+    Nearest-rank percentile of already sorted values.
+    """
+    if not sorted_values:
+        return float("nan")
+    index = max(0, min(len(sorted_values) - 1, int(round(q / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def peak_memory_mb() -> float:
+    """
+    Peak resident memory of this process plus its finished children (extraction workers), in MiB.
+    """
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss + resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    return usage / (1024 * 1024) if sys.platform == "darwin" else usage / 1024
+
+
+async def run_load(request, total: int, concurrency: int):
+    """
+    Call request(i) for i in range(total) with at most concurrency in flight.
+    Returns (latencies of successful calls, error messages, wall time).
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, errors = [], []
+
+    async def one(i):
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await request(i)
+                latencies.append(time.perf_counter() - start)
+            except Exception as e:
+                errors.append(str(e))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total)))
+    return latencies, errors, time.perf_counter() - start
+
+
+def summarize(name: str, latencies, errors, wall: float) -> dict:
+    latencies = sorted(latencies)
+    return {
+        "scenario": name,
+        "requests": len(latencies) + len(errors),
+        "errors": len(errors),
+        "first_error": errors[0] if errors else None,
+        "throughput_rps": len(latencies) / wall if wall else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "peak_memory_mb": peak_memory_mb()
+    }
+
+
+def check(response):
+    if response.status_code >= 400:
+        raise RuntimeError(f"HTTP {response.status_code}: {response.text[:200]}")
+    return response
+
+
+def build_scenarios(client, corpus, questions, args):
+    async def upload(i):
+        file_name, text = corpus[i % len(corpus)]
+        # Vary the content so repeated uploads are not skipped as duplicates
+        files = {"files": (f"upload_{i}_{file_name}", f"{text}\nUpload {i}\n".encode("utf-8"), "text/plain")}
+        job = check(await client.post("/upload", params={"subject": f"{SUBJECT} Uploads"}, files=files)).json()
+        while job["status"] in ("queued", "processing"):
+            await asyncio.sleep(JOB_POLL_INTERVAL)
+            job = check(await client.get(f"/jobs/{job['id']}")).json()
+        if job["status"] != "completed":
+            raise RuntimeError(f"Ingestion {job['status']}: {job['files'][0]['error']}")
+
+    async def ask(i):
+        check(await client.post("/ask", json={"question": questions[i], "subject": SUBJECT}))
+
+    async def practice(i):
+        check(await client.post("/practice", json={"subject": SUBJECT, "num_questions": 3}))
+
+    async def evaluate(i):
+        check(await client.post("/evaluate", json={
+            "question": questions[i], "user_answer": f"Answer {i}: {questions[-i - 1]}", "subject": SUBJECT
+        }))
+
+    async def flashcards(i):
+        check(await client.post("/flashcards", json={"subject": SUBJECT, "num_flashcards": 3}))
+
+    return {"upload": upload, "ask": ask, "practice": practice, "evaluate": evaluate, "flashcards": flashcards}
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_api(app, port: int):
+    import uvicorn
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, name="benchmark-api", daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, thread
+
+
+async def run_scenarios(base_url: str, scenarios, corpus, questions, args):
+    import httpx
+    results = []
+    limits = httpx.Limits(max_connections=args.concurrency * 2)
+    async with httpx.AsyncClient(base_url=base_url, timeout=600, limits=limits) as client:
+        requests = build_scenarios(client, corpus, questions, args)
+        for name in scenarios:
+            latencies, errors, wall = await run_load(requests[name], args.requests, args.concurrency)
+            results.append(summarize(name, latencies, errors, wall))
+            print_result(results[-1])
+    return results
+
+
+def print_result(result: dict):
+    print(
+        f"{result['scenario']:<11} {result['requests']:>5} req {result['errors']:>4} err "
+        f"{result['throughput_rps']:>8.2f} req/s  p50 {result['p50_ms']:>8.1f} ms  "
+        f"p95 {result['p95_ms']:>8.1f} ms  p99 {result['p99_ms']:>8.1f} ms  peak {result['peak_memory_mb']:>7.1f} MiB"
+    )
+    if result["first_error"]:
+        print(f"            first error: {result['first_error']}")
+
+
+def main():
+    args = parse_args()
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = [name for name in scenarios if name not in SCENARIOS]
+    if unknown:
+        raise SystemExit(f"Unknown scenarios: {', '.join(unknown)}")
+
+    from benchmarks.corpus import generate_corpus, generate_questions
+    from benchmarks.mock_ollama import MockOllama
+
+    output = os.path.abspath(args.output) if args.output else None
+    mock = MockOllama(latency=args.latency, tokens_per_second=args.tokens_per_second).start()
+    # The API reads its settings at import time, and its databases live under the working directory
+    os.environ["OLLAMA_ENDPOINT"] = mock.url
+    os.environ["OLLAMA_MAX_PARALLEL"] = str(args.ollama_parallel)
+    workdir = tempfile.mkdtemp(prefix="studysense_bench_")
+    os.chdir(workdir)
+    sys.path.insert(0, REPO_ROOT)
+
+    if args.fake_embeddings:
+        from services.registry import set_embedding_model
+        set_embedding_model(HashingEmbedder())
+    import backend.main as api
+
+    corpus = generate_corpus(args.notes, args.words, args.seed)
+    questions = generate_questions(args.requests, args.seed)
+    start = time.perf_counter()
+    api.storage.save_notes_from_texts(SUBJECT, corpus)
+    print(f"Loaded {len(corpus)} notes x {args.words} words in {time.perf_counter() - start:.1f}s (working dir {workdir})")
+
+    port = free_port()
+    server, thread = start_api(api.app, port)
+    try:
+        results = asyncio.run(run_scenarios(f"http://127.0.0.1:{port}", scenarios, corpus, questions, args))
+    finally:
+        server.should_exit = True
+        thread.join()
+        mock.stop()
+    print(f"Mock Ollama served {mock.requests} generations")
+
+    if output:
+        with open(output, "w") as f:
+            json.dump({"settings": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+import os
+import threading
+import time
+from typing import List
+
+# Seconds before the collection index is re-read, so collections created or deleted by other processes are noticed
+COLLECTION_INDEX_TTL = float(os.getenv("COLLECTION_INDEX_TTL", "30"))
+
+
+class CollectionIndex:
+    """
+    Collection name -> handle cache for one vector client, so repeated requests skip the
+    catalog lookup. The catalog is re-read every ttl seconds and on demand, and handles can
+    be checked against it before writes, so that collections other processes create, delete
+    or recreate are noticed.
+    """
+
+    def __init__(self, client, ttl: float = COLLECTION_INDEX_TTL):
+        self.client = client
+        self.ttl = ttl
+        self._collections = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def _index(self, refresh: bool = False) -> dict:
+        """
+        Return the cached index, listing the client's collections on first use, when refresh
+        is set and once the index is older than ttl. Callers must hold _lock.
+        """
+        now = time.monotonic()
+        if self._collections is None or refresh or now - self._loaded_at > self.ttl:
+            self._collections = {collection.name: collection for collection in self.client.list_collections()}
+            self._loaded_at = now
+        return self._collections
+
+    def get(self, name: str, verify: bool = False):
+        """
+        Return the named collection, creating it if it does not exist. With verify, the cached
+        handle is checked against the catalog first, so that writes never go to a collection
+        another process has deleted or replaced.
+        """
+        with self._lock:
+            collections = self._index()
+            collection = collections.get(name)
+            if collection is not None and verify:
+                try:
+                    current = self.client.get_collection(name=name, embedding_function=None)
+                except Exception as e:
+                    if "does not exist" not in str(e):
+                        raise
+                    current = None
+                # Clients without collection ids (the local store) hand out one object per collection
+                if current is None or getattr(current, "id", current) != getattr(collection, "id", collection):
+                    collections.pop(name, None)
+                    collection = current
+                    if current is not None:
+                        collections[name] = current
+            if collection is None:
+                # Vectors always come from the embedding service, never Chroma's default embedder
+                collection = self.client.get_or_create_collection(name=name, embedding_function=None)
+                collections[name] = collection
+            return collection
+
+    def contains(self, name: str) -> bool:
+        with self._lock:
+            # A miss re-reads the catalog in case another process created the collection
+            return name in self._index() or name in self._index(refresh=True)
+
+    def names(self) -> List[str]:
+        """
+        Names of all the client's collections, always re-read so that other processes' changes are listed.
+        """
+        with self._lock:
+            return list(self._index(refresh=True))
+
+    def create(self, name: str) -> bool:
+        """
+        Create an empty collection. Returns False if it already exists.
+        """
+        with self._lock:
+            collections = self._index(refresh=True)
+            if name in collections:
+                return False
+            collections[name] = self.client.create_collection(name=name, embedding_function=None)
+            return True
+
+    def delete(self, name: str) -> None:
+        """
+        Delete a collection. Raises if it does not exist.
+        """
+        with self._lock:
+            self._index().pop(name, None)
+            self.client.delete_collection(name=name)
+
+    def forget(self, name: str, error: Exception) -> None:
+        """
+        Drop a handle when the client reports its collection no longer exists, so the next
+        call resolves it again.
+        """
+        if "does not exist" in str(error):
+            with self._lock:
+                if self._collections is not None:
+                    self._collections.pop(name, None)
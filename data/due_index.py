@@ -0,0 +1,94 @@
+import bisect
+import math
+import threading
+from typing import Dict, List, Tuple
+
+
+class _SubjectQueue:
+    """
+    One subject's flashcards as a list of (due_at, id) kept sorted by due time.
+    """
+
+    def __init__(self):
+        self.entries: List[Tuple[float, str]] = []
+        self.due_at: Dict[str, float] = {}
+
+    def set(self, card_id: str, due_at: float) -> None:
+        self.remove(card_id)
+        bisect.insort(self.entries, (due_at, card_id))
+        self.due_at[card_id] = due_at
+
+    def remove(self, card_id: str) -> None:
+        previous = self.due_at.pop(card_id, None)
+        if previous is None:
+            return
+        position = bisect.bisect_left(self.entries, (previous, card_id))
+        if position < len(self.entries) and self.entries[position] == (previous, card_id):
+            del self.entries[position]
+
+    def due(self, now: float, limit: int) -> Tuple[List[str], int]:
+        # (t,) sorts before every (t, id), so this is the first entry due strictly after now
+        end = bisect.bisect_left(self.entries, (math.nextafter(now, math.inf),))
+        return [card_id for _, card_id in self.entries[:min(end, limit)]], end
+
+
+class DueIndex:
+    """
+    In-memory index of flashcard due times keyed by normalized subject, so the next cards to
+    review are found by binary search instead of scanning and sorting the deck. Kept up to date
+    as cards are saved, reviewed and deleted; a subject that is not loaded yet is built from
+    its stored cards on first use.
+    """
+
+    def __init__(self):
+        self._subjects: Dict[str, _SubjectQueue] = {}
+        self._lock = threading.Lock()
+
+    def is_loaded(self, subject: str) -> bool:
+        with self._lock:
+            return subject in self._subjects
+
+    def build(self, subject: str, ids: List[str], due_times: List[float]) -> None:
+        """
+        Replace a subject's index with the given cards.
+        """
+        queue = _SubjectQueue()
+        queue.entries = sorted(zip(due_times, ids))
+        queue.due_at = dict(zip(ids, due_times))
+        with self._lock:
+            self._subjects[subject] = queue
+
+    def set(self, subject: str, ids: List[str], due_times: List[float]) -> None:
+        """
+        Add cards or move them to new due times. Ignored until the subject has been built,
+        since the build will include them.
+        """
+        with self._lock:
+            queue = self._subjects.get(subject)
+            if queue is None:
+                return
+            for card_id, due_at in zip(ids, due_times):
+                queue.set(card_id, due_at)
+
+    def remove(self, subject: str, ids: List[str]) -> None:
+        with self._lock:
+            queue = self._subjects.get(subject)
+            if queue is None:
+                return
+            for card_id in ids:
+                queue.remove(card_id)
+
+    def invalidate(self, subject: str) -> None:
+        """
+        Drop a subject's index so it is rebuilt from storage on next use.
+        """
+        with self._lock:
+            self._subjects.pop(subject, None)
+
+    def due(self, subject: str, now: float, limit: int) -> Tuple[List[str], int]:
+        """
+        Return (ids of up to limit cards due at or before now, most overdue first, total due count).
+        """
+        with self._lock:
+            queue = self._subjects.get(subject)
+            return queue.due(now, limit) if queue is not None else ([], 0)
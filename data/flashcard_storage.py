@@ -1,53 +1,137 @@
+import threading
+import time
 import uuid
-from datetime import datetime
-import chromadb
-from typing import List, Dict
+from datetime import datetime, timezone
+from typing import Iterator, List, Dict, Optional, Tuple
+from data.collection_index import CollectionIndex
+from data.due_index import DueIndex
+from services.embeddings import get_embedding_service
+from services.registry import get_vector_client, FLASHCARDS_DB_PATH
+from services.spaced_repetition import RATINGS, REVIEW_FIELDS, new_card_state, schedule
+
+# Largest number of due cards returned by one get_due_flashcards call
+MAX_DUE_LIMIT = 500
+# Flashcards read per export_batches batch
+EXPORT_BATCH_SIZE = 1000
+
+
+def _timestamp(iso: str) -> float:
+    """
+    Unix time of a naive UTC ISO timestamp, as stored in created_at.
+    """
+    return datetime.fromisoformat(iso).replace(tzinfo=timezone.utc).timestamp()
+
+
+def _isoformat(timestamp: float) -> Optional[str]:
+    return datetime.fromtimestamp(timestamp, timezone.utc).replace(tzinfo=None).isoformat() if timestamp else None
+
 
 class FlashcardStorage:
-    def __init__(self, db_path="./chroma_db_flashcards"):
+    def __init__(self, db_path=FLASHCARDS_DB_PATH, client=None, embeddings=None, due_index=None):
         self.db_path = db_path
-        self.client = chromadb.PersistentClient(path=db_path)
+        self.client = client or get_vector_client(db_path)
+        self.embeddings = embeddings or get_embedding_service()
+        self.due_index = due_index or DueIndex()
+        # Collection name -> handle, so repeated requests skip the Chroma catalog lookup
+        self._collections = CollectionIndex(self.client)
+        # Normalized subject -> id of the collection its due index was built from
+        self._collection_ids = {}
+        # Serializes review read-modify-writes so concurrent reviews of a card are not lost
+        self._review_lock = threading.Lock()
+
+    def _normalize_subject(self, subject: str) -> str:
+        return subject.lower().replace(' ', '_')
+
+    def _review_state(self, meta: Dict) -> Dict:
+        """
+        A card's stored review state. Cards saved before scheduling existed are new cards,
+        due since they were created.
+        """
+        state = new_card_state(_timestamp(meta["created_at"]))
+        state.update({key: meta[key] for key in REVIEW_FIELDS if key in meta})
+        return state
+
+    def _to_flashcard(self, id: str, meta: Dict) -> Dict:
+        state = self._review_state(meta)
+        return {
+            "id": id,
+            "subject": meta["subject"],
+            "question": meta["question"],
+            "answer": meta["answer"],
+            "created_at": meta["created_at"],
+            "due_at": _isoformat(state["due_at"]),
+            "interval_days": state["interval_days"],
+            "ease": state["ease"],
+            "repetitions": state["repetitions"],
+            "lapses": state["lapses"],
+            "last_reviewed_at": _isoformat(state["last_reviewed_at"])
+        }
 
-    def _get_collection(self, subject: str):
+    def _get_collection(self, subject: str, verify: bool = False):
         """
         Get or create a Chroma DB collection for flashcards in the subject.
+        With verify, the handle is checked against Chroma's catalog first, so that writes never
+        go to a collection another process has deleted or replaced.
         """
-        collection_name = f"flashcards_{subject.lower().replace(' ', '_')}"
+        normalized_subject = self._normalize_subject(subject)
         try:
-            return self.client.get_or_create_collection(name=collection_name)
+            collection = self._collections.get(f"flashcards_{normalized_subject}", verify)
         except Exception as e:
             raise Exception(f"Failed to access collection for {subject}: {str(e)}")
+        # A subject recreated by another process has a new collection, and none of the indexed cards
+        collection_id = getattr(collection, "id", collection)
+        if self._collection_ids.setdefault(normalized_subject, collection_id) != collection_id:
+            self._collection_ids[normalized_subject] = collection_id
+            self.due_index.invalidate(normalized_subject)
+        return collection
+
+    def _forget_collection(self, subject: str, error: Exception) -> None:
+        """
+        Drop the subject's handle when Chroma reports its collection no longer exists,
+        so the next call resolves it again.
+        """
+        self._collections.forget(f"flashcards_{self._normalize_subject(subject)}", error)
 
     def save_flashcards(self, subject: str, flashcards: List[Dict[str, str]]) -> List[Dict]:
         """
         Save flashcards to the subject-specific Chroma DB collection.
+        All questions are embedded in one batch and written in a single add, so either
+        every card is saved or none are.
         """
-        collection = self._get_collection(subject)
-        saved_flashcards = []
-        for flashcard in flashcards:
-            flashcard_id = str(uuid.uuid4())
-            created_at = datetime.utcnow().isoformat()
+        for i, flashcard in enumerate(flashcards):
+            if not isinstance(flashcard, dict) or not flashcard.get("question") or not flashcard.get("answer"):
+                raise ValueError(f"Flashcard {i + 1} for {subject} must have a question and an answer")
+        if not flashcards:
+            return []
+
+        collection = self._get_collection(subject, verify=True)
+        created_at = datetime.utcnow().isoformat()
+        # New cards are due straight away
+        review_state = new_card_state(_timestamp(created_at))
+        metadatas = [
+            {
+                "subject": subject,
+                "question": flashcard["question"],
+                "answer": flashcard["answer"],
+                "created_at": created_at,
+                **review_state
+            }
+            for flashcard in flashcards
+        ]
+        ids = [str(uuid.uuid4()) for _ in flashcards]
+        try:
+            questions = [meta["question"] for meta in metadatas]
+            embeddings = self.embeddings.encode(questions)
+            collection.add(documents=questions, embeddings=embeddings, metadatas=metadatas, ids=ids)
+        except Exception as e:
+            # Remove anything a partially applied write left behind
             try:
-                collection.add(
-                    documents=[flashcard["question"]],
-                    metadatas=[{
-                        "subject": subject,
-                        "question": flashcard["question"],
-                        "answer": flashcard["answer"],
-                        "created_at": created_at
-                    }],
-                    ids=[flashcard_id]
-                )
-                saved_flashcards.append({
-                    "id": flashcard_id,
-                    "subject": subject,
-                    "question": flashcard["question"],
-                    "answer": flashcard["answer"],
-                    "created_at": created_at
-                })
-            except Exception as e:
-                raise Exception(f"Failed to save flashcard for {subject}: {str(e)}")
-        return saved_flashcards
+                collection.delete(ids=ids)
+            except Exception:
+                pass
+            raise Exception(f"Failed to save flashcards for {subject}: {str(e)}")
+        self.due_index.set(self._normalize_subject(subject), ids, [review_state["due_at"]] * len(ids))
+        return [self._to_flashcard(id, meta) for id, meta in zip(ids, metadatas)]
 
     def get_flashcards(self, subject: str) -> List[Dict]:
         """
@@ -56,30 +140,117 @@ class FlashcardStorage:
         try:
             collection = self._get_collection(subject)
             results = collection.get(include=["metadatas"])
-            return [
-                {
-                    "id": id,
-                    "subject": meta["subject"],
-                    "question": meta["question"],
-                    "answer": meta["answer"],
-                    "created_at": meta["created_at"]
-                }
-                for id, meta in zip(results["ids"], results["metadatas"])
-            ]
+            return [self._to_flashcard(id, meta) for id, meta in zip(results["ids"], results["metadatas"])]
         except Exception as e:
+            self._forget_collection(subject, e)
             raise Exception(f"Failed to retrieve flashcards for {subject}: {str(e)}")
 
+    def _load_due_index(self, subject: str, collection) -> None:
+        """
+        Build the subject's due index from stored metadata, once per process.
+        """
+        normalized_subject = self._normalize_subject(subject)
+        if self.due_index.is_loaded(normalized_subject):
+            return
+        results = collection.get(include=["metadatas"])
+        self.due_index.build(
+            normalized_subject, results["ids"], [self._review_state(meta)["due_at"] for meta in results["metadatas"]]
+        )
+
+    def get_due_flashcards(self, subject: str, limit: int = 20, now: float = None) -> Tuple[List[Dict], int]:
+        """
+        Return (up to limit cards due for review, most overdue first; number of cards due).
+        Served from the due index, so only the returned cards are read from storage.
+        The index only sees reviews made in this process, so each card's stored due time is
+        checked: cards reviewed or deleted elsewhere are moved or dropped, and the page topped up.
+        The count can still include such cards beyond the returned page.
+        """
+        limit = max(0, min(limit, MAX_DUE_LIMIT))
+        now = time.time() if now is None else now
+        normalized_subject = self._normalize_subject(subject)
+        try:
+            collection = self._get_collection(subject)
+            self._load_due_index(subject, collection)
+            by_id = {}
+            while True:
+                ids, total = self.due_index.due(normalized_subject, now, limit)
+                unread = [id for id in ids if id not in by_id]
+                if not unread:
+                    break
+                results = collection.get(ids=unread, include=["metadatas"])
+                by_id.update(zip(results["ids"], results["metadatas"]))
+                stored = {id: self._review_state(by_id[id])["due_at"] for id in unread if id in by_id}
+                deleted = [id for id in unread if id not in by_id]
+                not_due = [id for id, due_at in stored.items() if due_at > now]
+                if not deleted and not not_due:
+                    break
+                self.due_index.remove(normalized_subject, deleted)
+                self.due_index.set(normalized_subject, not_due, [stored[id] for id in not_due])
+            return [self._to_flashcard(id, by_id[id]) for id in ids], total
+        except Exception as e:
+            self._forget_collection(subject, e)
+            raise Exception(f"Failed to retrieve due flashcards for {subject}: {str(e)}")
+
+    def record_review(self, subject: str, flashcard_id: str, rating: str, now: float = None) -> Optional[Dict]:
+        """
+        Reschedule a card after a review rated again, hard, good or easy.
+        Returns the updated card, or None if it does not exist.
+        """
+        if rating not in RATINGS:
+            raise ValueError(f"Unknown rating {rating!r}; expected one of {', '.join(RATINGS)}")
+        collection = self._get_collection(subject, verify=True)
+        with self._review_lock:
+            try:
+                results = collection.get(ids=[flashcard_id], include=["metadatas"])
+                if not results["ids"]:
+                    return None
+                meta = results["metadatas"][0]
+                state = schedule(self._review_state(meta), rating, now)
+                meta = {**meta, **state}
+                collection.update(ids=[flashcard_id], metadatas=[meta])
+            except Exception as e:
+                raise Exception(f"Failed to record review of flashcard {flashcard_id} for {subject}: {str(e)}")
+            self.due_index.set(self._normalize_subject(subject), [flashcard_id], [state["due_at"]])
+        return self._to_flashcard(flashcard_id, meta)
+
+    def export_batches(self, subject: str, batch_size: int = EXPORT_BATCH_SIZE) -> Iterator[dict]:
+        """
+        Yield every flashcard of the subject, with its review state and embedding,
+        as Chroma get() results of up to batch_size cards.
+        """
+        collection = self._get_collection(subject)
+        offset = 0
+        while True:
+            results = collection.get(limit=batch_size, offset=offset, include=["documents", "metadatas", "embeddings"])
+            if not results["ids"]:
+                return
+            yield results
+            offset += len(results["ids"])
+
+    def import_batch(self, subject: str, ids: List[str], documents: List[str], metadatas: List[dict], embeddings) -> None:
+        """
+        Store already embedded flashcards (from export_batches) in one write, without re-embedding.
+        Cards whose id is already stored are left as they are.
+        """
+        try:
+            collection = self._get_collection(subject, verify=True)
+            collection.add(ids=ids, documents=documents, metadatas=metadatas, embeddings=embeddings)
+        except Exception as e:
+            raise Exception(f"Failed to import flashcards for {subject}: {str(e)}")
+        self.due_index.invalidate(self._normalize_subject(subject))
+
     def delete_flashcard(self, subject: str, flashcard_id: str) -> bool:
         """
         Delete a flashcard by ID from the subject-specific collection.
         """
         try:
-            collection = self._get_collection(subject)
+            collection = self._get_collection(subject, verify=True)
             # Check if ID exists
             results = collection.get(ids=[flashcard_id], include=["metadatas"])
             if not results["ids"]:
                 return False
             collection.delete(ids=[flashcard_id])
+            self.due_index.remove(self._normalize_subject(subject), [flashcard_id])
             # Verify deletion
             results = collection.get(ids=[flashcard_id])
             return len(results["ids"]) == 0
@@ -91,8 +262,8 @@ class FlashcardStorage:
         Delete the entire subject collection from Chroma DB.
         """
         try:
-            collection_name = f"flashcards_{subject.lower().replace(' ', '_')}"
-            self.client.delete_collection(name=collection_name)
+            self.due_index.invalidate(self._normalize_subject(subject))
+            self._collections.delete(f"flashcards_{self._normalize_subject(subject)}")
             return True
         except Exception:
             # Collection may not exist
@@ -0,0 +1,154 @@
+import math
+import re
+import threading
+import time
+from collections import Counter
+from typing import Dict, List, Tuple
+
+# Standard Okapi BM25 parameters
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# Words, numbers and code-like identifiers such as np.array, CS-101 or snake_case
+_TOKEN_PATTERN = re.compile(r"[a-z0-9_]+(?:[.\-][a-z0-9_]+)*")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lowercase text and split it into index terms.
+    """
+    return _TOKEN_PATTERN.findall(text.lower())
+
+
+class _SubjectIndex:
+    """
+    Inverted index with BM25 scoring for one subject's passages.
+    """
+
+    def __init__(self):
+        self.postings: Dict[str, Dict[str, int]] = {}
+        self.terms: Dict[str, List[str]] = {}
+        self.lengths: Dict[str, int] = {}
+        self.total_length = 0
+
+    def add(self, doc_id: str, text: str) -> None:
+        if doc_id in self.lengths:
+            self.remove(doc_id)
+        terms = Counter(tokenize(text))
+        for term, count in terms.items():
+            self.postings.setdefault(term, {})[doc_id] = count
+        self.terms[doc_id] = list(terms)
+        self.lengths[doc_id] = sum(terms.values())
+        self.total_length += self.lengths[doc_id]
+
+    def remove(self, doc_id: str) -> None:
+        length = self.lengths.pop(doc_id, None)
+        if length is None:
+            return
+        self.total_length -= length
+        for term in self.terms.pop(doc_id):
+            docs = self.postings[term]
+            docs.pop(doc_id, None)
+            if not docs:
+                del self.postings[term]
+
+    def search(self, query: str, limit: int) -> List[Tuple[str, float]]:
+        if not self.lengths:
+            return []
+        num_docs = len(self.lengths)
+        average_length = self.total_length / num_docs or 1.0
+        scores: Dict[str, float] = {}
+        for term in set(tokenize(query)):
+            docs = self.postings.get(term)
+            if not docs:
+                continue
+            idf = math.log(1 + (num_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+            for doc_id, count in docs.items():
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[doc_id] / average_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * count * (BM25_K1 + 1) / (count + norm)
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:limit]
+
+
+class LexicalIndex:
+    """
+    In-memory BM25 indexes keyed by normalized subject. Kept up to date as passages are
+    added and removed; a subject that is not loaded yet is built from its stored passages
+    on first search. Each index carries the version of storage it reflects (such as the
+    collection's row count) and its build time, so callers can tell when other processes
+    have changed the passages and the index must be rebuilt.
+    """
+
+    def __init__(self):
+        self._subjects: Dict[str, _SubjectIndex] = {}
+        # Subject -> (version, monotonic build time)
+        self._versions: Dict[str, Tuple[object, float]] = {}
+        self._lock = threading.Lock()
+
+    def is_loaded(self, subject: str) -> bool:
+        with self._lock:
+            return subject in self._subjects
+
+    def is_current(self, subject: str, version, max_age: float) -> bool:
+        """
+        Whether the subject is loaded, at version, and built less than max_age seconds ago.
+        """
+        with self._lock:
+            if subject not in self._subjects:
+                return False
+            built_version, built_at = self._versions[subject]
+            return built_version == version and time.monotonic() - built_at <= max_age
+
+    def build(self, subject: str, ids: List[str], documents: List[str], version=None) -> None:
+        """
+        Replace a subject's index with the given passages, read from storage at version.
+        """
+        index = _SubjectIndex()
+        for doc_id, text in zip(ids, documents):
+            index.add(doc_id, text)
+        with self._lock:
+            self._subjects[subject] = index
+            self._versions[subject] = (version, time.monotonic())
+
+    def set_version(self, subject: str, version) -> None:
+        """
+        Record that the subject's index reflects storage at version, after the caller's own
+        writes were applied to both.
+        """
+        with self._lock:
+            if subject in self._subjects:
+                self._versions[subject] = (version, self._versions[subject][1])
+
+    def add(self, subject: str, ids: List[str], documents: List[str]) -> None:
+        """
+        Index new passages. Ignored until the subject has been built, since the build will include them.
+        """
+        with self._lock:
+            index = self._subjects.get(subject)
+            if index is None:
+                return
+            for doc_id, text in zip(ids, documents):
+                index.add(doc_id, text)
+
+    def remove(self, subject: str, ids: List[str]) -> None:
+        with self._lock:
+            index = self._subjects.get(subject)
+            if index is None:
+                return
+            for doc_id in ids:
+                index.remove(doc_id)
+
+    def invalidate(self, subject: str) -> None:
+        """
+        Drop a subject's index so it is rebuilt from storage on next use.
+        """
+        with self._lock:
+            self._subjects.pop(subject, None)
+            self._versions.pop(subject, None)
+
+    def search(self, subject: str, query: str, limit: int = 10) -> List[Tuple[str, float]]:
+        """
+        Return up to limit (passage id, BM25 score) pairs, best first.
+        """
+        with self._lock:
+            index = self._subjects.get(subject)
+            return index.search(query, limit) if index is not None else []
@@ -0,0 +1,126 @@
+import bisect
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+
+class _SubjectNotes:
+    """
+    One subject's notes as a list of (created_ts, note_id) kept sorted, plus the id of each note's first passage.
+    """
+
+    def __init__(self):
+        self.entries: List[Tuple[float, str]] = []
+        self.created_ts: Dict[str, float] = {}
+        self.first_passages: Dict[str, str] = {}
+
+    def add(self, created_ts: float, note_id: str, passage_id: str) -> None:
+        self.remove(note_id)
+        bisect.insort(self.entries, (created_ts, note_id))
+        self.created_ts[note_id] = created_ts
+        self.first_passages[note_id] = passage_id
+
+    def remove(self, note_id: str) -> None:
+        created_ts = self.created_ts.pop(note_id, None)
+        if created_ts is None:
+            return
+        del self.first_passages[note_id]
+        position = bisect.bisect_left(self.entries, (created_ts, note_id))
+        if position < len(self.entries) and self.entries[position] == (created_ts, note_id):
+            del self.entries[position]
+
+    def page(self, after: Optional[Tuple[float, str]], limit: Optional[int]) -> Tuple[List[Tuple[float, str, str]], bool]:
+        start = bisect.bisect_right(self.entries, after) if after is not None else 0
+        end = len(self.entries) if limit is None else min(start + limit, len(self.entries))
+        page = [(created_ts, note_id, self.first_passages[note_id]) for created_ts, note_id in self.entries[start:end]]
+        return page, end < len(self.entries)
+
+
+class NoteIndex:
+    """
+    In-memory index of note creation times keyed by normalized subject, so a page of notes
+    is found by binary search instead of reading and sorting every note after the cursor.
+    Kept up to date as notes are saved and replaced; a subject that is not loaded yet is
+    built from its stored first passages on first use. Like LexicalIndex, each index carries
+    the version of storage it reflects and its build time, so callers can rebuild it once
+    other processes have changed the subject.
+    """
+
+    def __init__(self):
+        self._subjects: Dict[str, _SubjectNotes] = {}
+        # Subject -> (version, monotonic build time)
+        self._versions: Dict[str, Tuple[object, float]] = {}
+        self._lock = threading.Lock()
+
+    def is_loaded(self, subject: str) -> bool:
+        with self._lock:
+            return subject in self._subjects
+
+    def is_current(self, subject: str, version, max_age: float) -> bool:
+        """
+        Whether the subject is loaded, at version, and built less than max_age seconds ago.
+        """
+        with self._lock:
+            if subject not in self._subjects:
+                return False
+            built_version, built_at = self._versions[subject]
+            return built_version == version and time.monotonic() - built_at <= max_age
+
+    def build(self, subject: str, notes: List[Tuple[float, str, str]], version=None) -> None:
+        """
+        Replace a subject's index with the given (created_ts, note_id, first passage id) entries,
+        read from storage at version.
+        """
+        index = _SubjectNotes()
+        index.entries = sorted((created_ts, note_id) for created_ts, note_id, _ in notes)
+        index.created_ts = {note_id: created_ts for created_ts, note_id, _ in notes}
+        index.first_passages = {note_id: passage_id for _, note_id, passage_id in notes}
+        with self._lock:
+            self._subjects[subject] = index
+            self._versions[subject] = (version, time.monotonic())
+
+    def set_version(self, subject: str, version) -> None:
+        """
+        Record that the subject's index reflects storage at version, after the caller's own
+        writes were applied to both.
+        """
+        with self._lock:
+            if subject in self._subjects:
+                self._versions[subject] = (version, self._versions[subject][1])
+
+    def add(self, subject: str, notes: List[Tuple[float, str, str]]) -> None:
+        """
+        Add (created_ts, note_id, first passage id) entries. Ignored until the subject has been
+        built, since the build will include them.
+        """
+        with self._lock:
+            index = self._subjects.get(subject)
+            if index is None:
+                return
+            for created_ts, note_id, passage_id in notes:
+                index.add(created_ts, note_id, passage_id)
+
+    def remove(self, subject: str, note_ids: List[str]) -> None:
+        with self._lock:
+            index = self._subjects.get(subject)
+            if index is None:
+                return
+            for note_id in note_ids:
+                index.remove(note_id)
+
+    def invalidate(self, subject: str) -> None:
+        """
+        Drop a subject's index so it is rebuilt from storage on next use.
+        """
+        with self._lock:
+            self._subjects.pop(subject, None)
+            self._versions.pop(subject, None)
+
+    def page(self, subject: str, after: Optional[Tuple[float, str]], limit: Optional[int]) -> Tuple[List[Tuple[float, str, str]], bool]:
+        """
+        Return (up to limit (created_ts, note_id, first passage id) entries ordered after the
+        (created_ts, note_id) key after, whether more entries follow). limit=None returns all of them.
+        """
+        with self._lock:
+            index = self._subjects.get(subject)
+            return index.page(after, limit) if index is not None else ([], False)
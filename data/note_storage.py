@@ -1,17 +1,77 @@
+import hashlib
 import os
 import uuid
-from datetime import datetime
-from typing import List
-import chromadb
-from sentence_transformers import SentenceTransformer
+from datetime import datetime, timezone
+from typing import Iterable, Iterator, List, Optional, Tuple
 from backend.models import Note
+from data.collection_index import CollectionIndex
+from data.lexical_index import LexicalIndex
+from data.note_index import NoteIndex
+from services import metrics
+from services.embeddings import get_embedding_service
+from services.registry import get_vector_client, get_cross_encoder, NOTES_DB_PATH
+from services.response_cache import get_response_cache
 from services.text_extract import extract_text_from_file
+from utils.text_preprocessing import chunk_text, iter_chunks, merge_chunks, CHARS_PER_TOKEN
+from utils.context_selection import reciprocal_rank_fusion, select_diverse_passages
+from utils.helpers import content_hash
+
+# Candidates taken from each of the dense and lexical rankings before fusion
+RETRIEVAL_CANDIDATES = 20
+# Optional sentence-transformers cross-encoder (e.g. cross-encoder/ms-marco-MiniLM-L-6-v2) used to rerank fused results
+RERANKER_MODEL = os.getenv("RERANKER_MODEL", "")
+# Fused candidates scored by the cross-encoder
+RERANK_CANDIDATES = 10
+# Passages buffered before each embed-and-write when saving from a block stream
+STREAM_FLUSH_CHUNKS = 256
+# Note fields available to list_notes; all of them live on each note's first passage
+NOTE_FIELDS = ("id", "subject", "file_name", "created_at", "chunk_count", "content_length", "content_hash")
+# Notes returned per list_notes page when no limit is given
+NOTES_PAGE_SIZE = 50
+# Passages read per export_batches batch
+EXPORT_BATCH_SIZE = 1000
+# Seconds before a subject's BM25 index is rebuilt, so passages replaced by other processes are
+# picked up even when the collection's row count did not change
+LEXICAL_INDEX_TTL = float(os.getenv("LEXICAL_INDEX_TTL", "60"))
+# Seconds before a subject's list_notes index is rebuilt, for the same reason
+NOTE_INDEX_TTL = float(os.getenv("NOTE_INDEX_TTL", "60"))
+# Most passages sample_passages reads; larger subjects are sampled in SAMPLE_WINDOWS windows spread across the collection
+SAMPLE_POOL_SIZE = 2000
+SAMPLE_WINDOWS = 8
+
+def _timestamp(created_at: datetime) -> float:
+    """
+    Unix time of a naive UTC datetime, as stored in created_at.
+    """
+    return created_at.replace(tzinfo=timezone.utc).timestamp()
+
 
 class NotesStorage:
-    def __init__(self, db_path="./chroma_db"):
+    def __init__(self, db_path=NOTES_DB_PATH, client=None, embeddings=None, response_cache=None, lexical_index=None, reranker=None,
+                 note_index=None):
         self.db_path = db_path
-        self.client = chromadb.PersistentClient(path=db_path)
-        self.embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
+        self.client = client or get_vector_client(db_path)
+        # Every passage and query vector comes from this service, never from Chroma's default embedder
+        self.embeddings = embeddings or get_embedding_service()
+        self.lexical_index = lexical_index or LexicalIndex()
+        # Notes in (created_ts, id) order, so list_notes pages cost O(limit)
+        self.note_index = note_index or NoteIndex()
+        self._reranker = reranker
+        # Cached LLM answers depend on the notes, so they are dropped whenever a subject changes
+        self.response_cache = response_cache or get_response_cache()
+        # Collection name -> handle, re-read from Chroma every COLLECTION_INDEX_TTL seconds and kept in sync on create/delete
+        self._collections = CollectionIndex(self.client)
+        # Collections whose pre-chunking notes have been given first-passage metadata in this process
+        self._upgraded_collections = set()
+
+    @property
+    def reranker(self):
+        """
+        Shared CrossEncoder when RERANKER_MODEL is set, otherwise None.
+        """
+        if self._reranker is None and RERANKER_MODEL:
+            self._reranker = get_cross_encoder(RERANKER_MODEL)
+        return self._reranker
 
     def _normalize_subject(self, subject: str) -> str:
         """
@@ -19,106 +79,611 @@ class NotesStorage:
         """
         return subject.lower().replace(' ', '_')
 
-    def _get_collection(self, subject: str):
+    def _get_collection(self, subject: str, verify: bool = False):
         """
         Get or create a Chroma DB collection for notes in the subject.
         Ensures no duplicate collections are created for equivalent subject names.
+        With verify, the handle is checked against Chroma's catalog first, so that writes never
+        go to a collection another process has deleted or replaced.
         """
         normalized_subject = self._normalize_subject(subject)
-        collection_name = f"notes_{normalized_subject}"
-        
-        # Check if a collection with the same normalized name already exists
-        existing_collections = self.client.list_collections()
-        for collection in existing_collections:
-            if collection.name == collection_name:
-                return collection
-        
+        metrics.set_subject(normalized_subject)
         try:
-            return self.client.get_or_create_collection(name=collection_name)
+            return self._collections.get(f"notes_{normalized_subject}", verify)
         except Exception as e:
             raise Exception(f"Failed to access collection for {subject}: {str(e)}")
 
+    def _forget_collection(self, subject: str, error: Exception) -> None:
+        """
+        Drop the subject's handle when Chroma reports its collection no longer exists,
+        so the next call resolves it again.
+        """
+        self._collections.forget(f"notes_{self._normalize_subject(subject)}", error)
+
+    def has_subject(self, subject: str) -> bool:
+        return self._collections.contains(f"notes_{self._normalize_subject(subject)}")
+
     def create_subject(self, subject: str) -> None:
         """
         Create a new subject by initializing an empty collection in Chroma DB.
         Raises ValueError if the subject already exists.
         """
         normalized_subject = self._normalize_subject(subject)
-        collection_name = f"notes_{normalized_subject}"
-        
-        # Check for existing collections to prevent duplicates
-        existing_collections = self.client.list_collections()
-        for collection in existing_collections:
-            existing_subject = collection.name.replace("notes_", "")
-            if existing_subject == normalized_subject:
-                raise ValueError(f"Subject '{subject}' already exists as '{existing_subject.replace('_', ' ').title()}'")
-        
         try:
-            # Create an empty collection for the subject
-            self.client.create_collection(name=collection_name)
+            created = self._collections.create(f"notes_{normalized_subject}")
         except Exception as e:
             raise Exception(f"Failed to create subject '{subject}': {str(e)}")
+        if not created:
+            raise ValueError(f"Subject '{subject}' already exists as '{normalized_subject.replace('_', ' ').title()}'")
 
-    def save_note_from_file(self, file_path: str, subject: str, file_name: str) -> Note:
+    def save_note_from_file(self, file_path: str, subject: str, file_name: str, replace: bool = False) -> Note:
         """
         Save a note extracted from a file to the Chroma DB.
         Validates that the subject doesn't conflict with existing subjects.
+        With replace, the notes already stored under file_name are replaced.
         """
         try:
-            # Normalize subject to check for conflicts
-            normalized_subject = self._normalize_subject(subject)
-            existing_collections = self.client.list_collections()
-            for collection in existing_collections:
-                existing_subject = collection.name.replace("notes_", "")
-                if existing_subject == normalized_subject:
-                    # Allow saving if the subject matches exactly after normalization
-                    if collection.name == f"notes_{normalized_subject}":
-                        break
-                    raise Exception(f"Subject '{subject}' conflicts with existing subject '{existing_subject.replace('_', ' ').title()}'")
-
             text = extract_text_from_file(file_path)
-            embedding = self.embedding_model.encode(text).tolist()
-            note_id = str(uuid.uuid4())
+        except Exception as e:
+            raise Exception(f"Failed to save note from {file_name}: {str(e)}")
+        return self.save_notes_from_texts(subject, [(file_name, text)], replace)[0]
+
+    def _chunk_metadata(self, subject: str, file_name: str, created_at: datetime, note_id: str, index: int, chunk: dict,
+                        pending: bool = False) -> dict:
+        """
+        Metadata stored with every passage of a note. Pending passages belong to a note that
+        is still being written, and are left out of retrieval and listings.
+        """
+        return {
+            "subject": subject,
+            "file_name": file_name,
+            "created_at": created_at.isoformat(),
+            # Numeric copy of created_at, the sort key of list_notes cursors
+            "created_ts": _timestamp(created_at),
+            "note_id": note_id,
+            "chunk_index": index,
+            "start_offset": chunk["start"],
+            "end_offset": chunk["end"],
+            "chunk_hash": content_hash(chunk["text"]),
+            "pending": pending
+        }
+
+    def _find_duplicate(self, collection, text_hash: str, subject: str, text: str = "") -> Optional[Note]:
+        """
+        Return the stored note whose full text hashes to text_hash, if any.
+        """
+        results = collection.get(where={"content_hash": text_hash}, limit=1, include=["metadatas"])
+        if not results["ids"]:
+            return None
+        meta = results["metadatas"][0]
+        return Note(
+            id=meta.get("note_id", results["ids"][0]),
+            subject=subject,
+            content=text,
+            created_at=datetime.fromisoformat(meta["created_at"]),
+            file_name=meta.get("file_name")
+        )
+
+    def _previous_version(self, collection, file_name: str, replace: bool) -> dict:
+        """
+        With replace, return the ids of the notes already stored under file_name, their passage
+        ids, and their embeddings keyed by chunk hash, so a re-uploaded file only embeds the
+        passages that changed. Without replace nothing is replaced and every passage is embedded.
+        """
+        if not replace:
+            return {"note_ids": [], "ids": [], "embeddings": {}}
+        results = collection.get(where={"file_name": file_name}, include=["metadatas", "embeddings"])
+        note_ids, ids, embeddings = [], [], {}
+        for id, meta, embedding in zip(results["ids"], results["metadatas"], results["embeddings"] if results["ids"] else []):
+            # A note still being streamed in is not a stored version yet
+            if meta.get("pending"):
+                continue
+            ids.append(id)
+            note_id = meta.get("note_id", id)
+            if note_id not in note_ids:
+                note_ids.append(note_id)
+            if meta.get("chunk_hash"):
+                embeddings[meta["chunk_hash"]] = list(embedding)
+        return {"note_ids": note_ids, "ids": ids, "embeddings": embeddings}
+
+    def _stored_embeddings(self, collection, hashes: List[str]) -> dict:
+        """
+        Return the stored embeddings of passages whose chunk hash is in hashes, keyed by hash.
+        """
+        embeddings = {}
+        for start in range(0, len(hashes), STREAM_FLUSH_CHUNKS):
+            results = collection.get(where={"chunk_hash": {"$in": hashes[start:start + STREAM_FLUSH_CHUNKS]}},
+                                     include=["metadatas", "embeddings"])
+            for meta, embedding in zip(results["metadatas"], results["embeddings"] if results["ids"] else []):
+                embeddings[meta["chunk_hash"]] = list(embedding)
+        return embeddings
+
+    def _embed(self, collection, documents: List[str], known: dict) -> List[List[float]]:
+        """
+        Embed documents, reusing embeddings from known (chunk hash -> embedding) and from
+        identical passages already stored in the collection where possible.
+        """
+        hashes = [content_hash(document) for document in documents]
+        unknown = list(dict.fromkeys(text_hash for text_hash in hashes if text_hash not in known))
+        if unknown:
+            known = {**known, **self._stored_embeddings(collection, unknown)}
+        missing = [i for i, text_hash in enumerate(hashes) if text_hash not in known]
+        embeddings = [known.get(text_hash) for text_hash in hashes]
+        if missing:
+            encoded = self.embeddings.encode([documents[i] for i in missing])
+            for i, embedding in zip(missing, encoded):
+                embeddings[i] = embedding
+        return embeddings
+
+    def save_notes_from_texts(self, subject: str, texts: List[Tuple[str, str]], replace: bool = False) -> List[Note]:
+        """
+        Save several already-extracted notes to the subject in one write.
+        texts is a list of (file_name, text); passages from all notes are embedded together.
+        A text identical to a stored note is skipped and the stored note returned instead.
+        With replace, each note replaces the notes already stored under its file_name
+        (listed in its replaced_note_ids), re-embedding only the passages that changed.
+        """
+        file_names = ", ".join(file_name for file_name, _ in texts)
+        try:
+            normalized_subject = self._normalize_subject(subject)
+            collection = self._get_collection(subject, verify=True)
             created_at = datetime.utcnow()
-            collection = self._get_collection(subject)
-            collection.add(
-                documents=[text],
-                embeddings=[embedding],
-                metadatas=[{"subject": subject, "file_name": file_name, "created_at": created_at.isoformat()}],
-                ids=[note_id]
-            )
-            return Note(id=note_id, subject=subject, content=text, created_at=created_at)
+            notes = []
+            seen = {}
+            known_embeddings = {}
+            replaced_ids = []
+            replaced_note_ids, new_notes = [], []
+            documents, metadatas, ids = [], [], []
+            for file_name, text in texts:
+                text_hash = content_hash(text)
+                duplicate = seen.get(text_hash) or self._find_duplicate(collection, text_hash, subject, text)
+                if duplicate is not None:
+                    seen[text_hash] = duplicate
+                    notes.append(duplicate)
+                    continue
+
+                chunks = chunk_text(text)
+                if not chunks:
+                    raise ValueError(f"No text could be extracted from {file_name}")
+                previous = self._previous_version(collection, file_name, replace)
+                replaced_ids.extend(previous["ids"])
+                replaced_note_ids.extend(previous["note_ids"])
+                known_embeddings.update(previous["embeddings"])
+
+                note_id = str(uuid.uuid4())
+                for i, chunk in enumerate(chunks):
+                    documents.append(chunk["text"])
+                    metadatas.append(self._chunk_metadata(subject, file_name, created_at, note_id, i, chunk))
+                    ids.append(f"{note_id}:{i}")
+                # The first passage carries the note-level fields: the hash for duplicate lookups, plus size for listings
+                metadatas[-len(chunks)].update(content_hash=text_hash, chunk_count=len(chunks), content_length=len(text))
+                note = Note(id=note_id, subject=subject, content=text, created_at=created_at, file_name=file_name,
+                            replaced_note_ids=previous["note_ids"])
+                seen[text_hash] = note
+                notes.append(note)
+                new_notes.append((_timestamp(created_at), note_id, f"{note_id}:0"))
+
+            if documents:
+                # Embed every passage in batches; the model truncates long inputs so whole files can't be embedded
+                embeddings = self._embed(collection, documents, known_embeddings)
+                collection.add(documents=documents, embeddings=embeddings, metadatas=metadatas, ids=ids)
+                self.lexical_index.add(normalized_subject, ids, documents)
+                self.note_index.add(normalized_subject, new_notes)
+                # The new versions are stored, so the ones they replace can go
+                if replaced_ids:
+                    collection.delete(ids=replaced_ids)
+                    self.lexical_index.remove(normalized_subject, replaced_ids)
+                    self.note_index.remove(normalized_subject, replaced_note_ids)
+                self._sync_index_versions(collection, normalized_subject)
+                self.response_cache.invalidate_subject(normalized_subject)
+            return notes
         except Exception as e:
+            raise Exception(f"Failed to save note from {file_names}: {str(e)}")
+
+    def save_note_from_blocks(self, subject: str, file_name: str, blocks: Iterable[str], replace: bool = False) -> dict:
+        """
+        Save one note from a stream of text blocks (see services.text_extract.iter_text_blocks).
+        Passages are embedded and written every STREAM_FLUSH_CHUNKS chunks as the blocks arrive,
+        so the full text is never held in memory. Passages already stored anywhere in the subject
+        are not embedded again. Until the whole note is written its passages are pending, hidden
+        from retrieval and listings; if anything fails, the passages already written are removed.
+        Duplicates and replace are handled as in save_notes_from_texts.
+        Returns the note's id, subject, file_name, created_at, chunk count and replaced_note_ids.
+        """
+        note_id = str(uuid.uuid4())
+        created_at = datetime.utcnow()
+        collection = self._get_collection(subject, verify=True)
+        written = 0
+        try:
+            previous = self._previous_version(collection, file_name, replace)
+            hasher = hashlib.sha256()
+            position = 0
+            pending = []
+            for chunk in iter_chunks(blocks):
+                # Hash the text without the overlapping regions so it matches content_hash(full text)
+                hasher.update(chunk["text"][max(position - chunk["start"], 0):].encode("utf-8"))
+                position = chunk["end"]
+                pending.append(chunk)
+                if len(pending) >= STREAM_FLUSH_CHUNKS:
+                    self._add_chunks(collection, subject, file_name, created_at, note_id, written, pending, previous["embeddings"])
+                    written += len(pending)
+                    pending = []
+            if pending:
+                self._add_chunks(collection, subject, file_name, created_at, note_id, written, pending, previous["embeddings"])
+                written += len(pending)
+            if written == 0:
+                raise ValueError("No text could be extracted from the file")
+
+            text_hash = hasher.hexdigest()
+            duplicate = self._find_duplicate(collection, text_hash, subject)
+            if duplicate is not None:
+                collection.delete(where={"note_id": note_id})
+                self._sync_index_versions(collection, self._normalize_subject(subject))
+                return {"id": duplicate.id, "subject": subject, "file_name": duplicate.file_name, "created_at": duplicate.created_at, "chunks": written,
+                        "replaced_note_ids": []}
+            self._publish_chunks(collection, subject, note_id, written,
+                                 {"content_hash": text_hash, "chunk_count": written, "content_length": position})
+            self.note_index.add(self._normalize_subject(subject), [(_timestamp(created_at), note_id, f"{note_id}:0")])
+            if previous["ids"]:
+                collection.delete(ids=previous["ids"])
+                self.lexical_index.remove(self._normalize_subject(subject), previous["ids"])
+                self.note_index.remove(self._normalize_subject(subject), previous["note_ids"])
+            self._sync_index_versions(collection, self._normalize_subject(subject))
+        except Exception as e:
+            if written:
+                try:
+                    collection.delete(where={"note_id": note_id})
+                except Exception:
+                    pass
+                self.lexical_index.invalidate(self._normalize_subject(subject))
+                self.note_index.invalidate(self._normalize_subject(subject))
             raise Exception(f"Failed to save note from {file_name}: {str(e)}")
+        self.response_cache.invalidate_subject(self._normalize_subject(subject))
+        return {"id": note_id, "subject": subject, "file_name": file_name, "created_at": created_at, "chunks": written,
+                "replaced_note_ids": previous["note_ids"]}
+
+    def _add_chunks(self, collection, subject: str, file_name: str, created_at: datetime, note_id: str, first_index: int, chunks: List[dict], known_embeddings: dict) -> None:
+        """
+        Embed and store a run of consecutive passages belonging to one note, as pending.
+        """
+        documents = [chunk["text"] for chunk in chunks]
+        collection.add(
+            documents=documents,
+            embeddings=self._embed(collection, documents, known_embeddings),
+            metadatas=[
+                self._chunk_metadata(subject, file_name, created_at, note_id, first_index + i, chunk, pending=True)
+                for i, chunk in enumerate(chunks)
+            ],
+            ids=[f"{note_id}:{first_index + i}" for i in range(len(chunks))]
+        )
+        # Pending passages are not searchable yet, but they change the collection's row count
+        self._sync_index_versions(collection, self._normalize_subject(subject))
+
+    def _publish_chunks(self, collection, subject: str, note_id: str, count: int, note_fields: dict) -> None:
+        """
+        Clear the pending flag on a streamed note's passages, give the first passage the
+        note-level note_fields, and add the passages to the subject's BM25 index.
+        """
+        normalized_subject = self._normalize_subject(subject)
+        for start in range(0, count, EXPORT_BATCH_SIZE):
+            ids = [f"{note_id}:{i}" for i in range(start, min(start + EXPORT_BATCH_SIZE, count))]
+            # Metadata updates merge into the stored passage metadata
+            metadatas = [{"pending": False} for _ in ids]
+            if start == 0:
+                metadatas[0].update(note_fields)
+            collection.update(ids=ids, metadatas=metadatas)
+            if self.lexical_index.is_loaded(normalized_subject):
+                results = collection.get(ids=ids, include=["documents"])
+                self.lexical_index.add(normalized_subject, results["ids"], results["documents"])
 
     def load_notes_by_subject(self, subject: str) -> List[Note]:
         """
         Load all notes for a given subject from Chroma DB.
+        Passages belonging to the same note are merged back into the original text.
         """
         try:
             collection = self._get_collection(subject)
-            results = collection.get(include=["documents", "metadatas"])
-            notes = []
+            self._upgrade_legacy_notes(collection)
+            results = collection.get(where={"pending": False}, include=["documents", "metadatas"])
+            grouped = {}
             for id, doc, meta in zip(results["ids"], results["documents"], results["metadatas"]):
+                # Notes saved before chunking are stored as a single document without a note_id
+                note_id = meta.get("note_id", id)
+                grouped.setdefault(note_id, {"meta": meta, "chunks": []})["chunks"].append({
+                    "text": doc,
+                    "start": meta.get("start_offset", 0),
+                    "end": meta.get("end_offset", len(doc))
+                })
+            notes = []
+            for note_id, entry in grouped.items():
+                meta = entry["meta"]
                 notes.append(
                     Note(
-                        id=id,
+                        id=note_id,
                         subject=meta["subject"],
-                        content=doc,
-                        created_at=datetime.fromisoformat(meta["created_at"])
+                        content=merge_chunks(entry["chunks"]),
+                        created_at=datetime.fromisoformat(meta["created_at"]),
+                        file_name=meta.get("file_name")
                     )
                 )
             return notes
         except Exception as e:
+            self._forget_collection(subject, e)
             raise Exception(f"Failed to load notes for {subject}: {str(e)}")
 
+    def _upgrade_legacy_notes(self, collection) -> None:
+        """
+        Give notes saved before chunking (one document, no note_id) the first-passage metadata
+        that list_notes filters on, first passages saved before created_ts existed their
+        sort key, and passages saved before the pending flag existed pending=False, which reads
+        filter on. Scans the collection's metadata once per process.
+        """
+        if collection.name in self._upgraded_collections:
+            return
+        results = collection.get(include=["metadatas"])
+        unmarked = [id for id, meta in zip(results["ids"], results["metadatas"]) if "pending" not in (meta or {})]
+        for start in range(0, len(unmarked), EXPORT_BATCH_SIZE):
+            ids = unmarked[start:start + EXPORT_BATCH_SIZE]
+            # Metadata updates merge into the stored passage metadata
+            collection.update(ids=ids, metadatas=[{"pending": False} for _ in ids])
+        legacy_ids = [id for id, meta in zip(results["ids"], results["metadatas"]) if "chunk_index" not in (meta or {})]
+        unsorted = [
+            (id, meta) for id, meta in zip(results["ids"], results["metadatas"])
+            if (meta or {}).get("chunk_index") == 0 and "created_ts" not in meta
+        ]
+        if unsorted:
+            collection.update(
+                ids=[id for id, _ in unsorted],
+                metadatas=[{**meta, "created_ts": _timestamp(datetime.fromisoformat(meta["created_at"]))} for _, meta in unsorted]
+            )
+        if legacy_ids:
+            legacy = collection.get(ids=legacy_ids, include=["documents", "metadatas"])
+            collection.update(
+                ids=legacy["ids"],
+                metadatas=[
+                    {**(meta or {}), "note_id": id, "chunk_index": 0, "chunk_count": 1, "content_length": len(doc),
+                     "start_offset": 0, "end_offset": len(doc),
+                     "created_ts": _timestamp(datetime.fromisoformat(meta["created_at"]))}
+                    for id, doc, meta in zip(legacy["ids"], legacy["documents"], legacy["metadatas"])
+                ]
+            )
+        self._upgraded_collections.add(collection.name)
+
+    def list_notes(self, subject: str, limit: Optional[int] = NOTES_PAGE_SIZE, cursor: Optional[str] = None,
+                   fields: Optional[List[str]] = None) -> Tuple[List[dict], Optional[str]]:
+        """
+        List a page of a subject's notes, oldest first, from metadata only; note text is never read.
+        fields selects which of NOTE_FIELDS to return (all by default). Pass the returned
+        cursor back to get the next page; it is None after the last page, and limit=None
+        returns every note in one page. The cursor is the (created_ts, note id) of the last
+        note listed, so notes added or replaced between pages are neither skipped nor repeated.
+        Pages are sliced from the subject's note index, so each costs O(limit) reads once the
+        index is built.
+        """
+        fields = list(fields or NOTE_FIELDS)
+        unknown = [field for field in fields if field not in NOTE_FIELDS]
+        if unknown:
+            raise ValueError(f"Unknown note fields: {', '.join(unknown)}")
+        try:
+            after = None
+            if cursor:
+                created_ts, note_id = cursor.split(":", 1)
+                after = (float(created_ts), note_id)
+        except ValueError:
+            raise ValueError(f"Invalid cursor: {cursor}")
+        normalized_subject = self._normalize_subject(subject)
+        try:
+            collection = self._get_collection(subject)
+            self._upgrade_legacy_notes(collection)
+            count = collection.count()
+            if not self.note_index.is_current(normalized_subject, count, NOTE_INDEX_TTL):
+                results = collection.get(where={"$and": [{"chunk_index": 0}, {"pending": False}]}, include=["metadatas"])
+                self.note_index.build(
+                    normalized_subject,
+                    [(meta["created_ts"], meta.get("note_id", id), id) for id, meta in zip(results["ids"], results["metadatas"])],
+                    version=count
+                )
+            entries, more = self.note_index.page(normalized_subject, after, limit)
+            results = collection.get(ids=[passage_id for _, _, passage_id in entries], include=["metadatas"]) if entries else None
+        except Exception as e:
+            self._forget_collection(subject, e)
+            raise Exception(f"Failed to list notes for {subject}: {str(e)}")
+        metadatas = dict(zip(results["ids"], results["metadatas"])) if results else {}
+        # Notes deleted by another process since the index was built are skipped
+        page = [{**metadatas[passage_id], "id": note_id} for _, note_id, passage_id in entries if passage_id in metadatas]
+        next_cursor = f"{entries[-1][0]!r}:{entries[-1][1]}" if more else None
+        return [{field: note.get(field) for field in fields} for note in page], next_cursor
+
+    def get_note_content(self, subject: str, note_id: str, start: int = 0, end: Optional[int] = None) -> Optional[str]:
+        """
+        Return a note's text, or the [start, end) character range of it, reading only the
+        passages that overlap the range. Returns None if the note does not exist.
+        """
+        try:
+            collection = self._get_collection(subject)
+            self._upgrade_legacy_notes(collection)
+            conditions = [{"note_id": note_id}, {"end_offset": {"$gt": start}}]
+            if end is not None:
+                conditions.append({"start_offset": {"$lt": end}})
+            results = collection.get(where={"$and": conditions}, include=["documents", "metadatas"])
+        except Exception as e:
+            self._forget_collection(subject, e)
+            raise Exception(f"Failed to load note {note_id} for {subject}: {str(e)}")
+        if not results["ids"]:
+            exists = collection.get(where={"note_id": note_id}, limit=1, include=[])
+            return "" if exists["ids"] else None
+        chunks = [
+            {"text": doc, "start": meta["start_offset"], "end": meta["end_offset"]}
+            for doc, meta in zip(results["documents"], results["metadatas"])
+        ]
+        chunks.sort(key=lambda chunk: chunk["start"])
+        first = chunks[0]["start"]
+        text = merge_chunks(chunks)
+        return text[max(start - first, 0):None if end is None else max(end - first, 0)]
+
+    def embed_query(self, query: str) -> List[float]:
+        """
+        Encode a search query with the same model used for stored passages.
+        Repeated queries are served from the embedding service's cache.
+        """
+        return self.embeddings.encode_query(query)
+
+    def _sync_index_versions(self, collection, normalized_subject: str) -> None:
+        """
+        After this process's own writes, which were applied to the BM25 and note indexes as well,
+        record the collection's new row count so the indexes are not taken to be stale.
+        """
+        if self.lexical_index.is_loaded(normalized_subject) or self.note_index.is_loaded(normalized_subject):
+            count = collection.count()
+            self.lexical_index.set_version(normalized_subject, count)
+            self.note_index.set_version(normalized_subject, count)
+
+    def _lexical_search(self, subject: str, collection, query: str, limit: int, count: int) -> List[str]:
+        """
+        Return the ids of the best BM25 matches. The subject's index is built from storage on
+        first use, and rebuilt when the collection's row count (count) no longer matches the one
+        it was built or last synced at, meaning another process changed the passages, or once it
+        is older than LEXICAL_INDEX_TTL.
+        """
+        normalized_subject = self._normalize_subject(subject)
+        if not self.lexical_index.is_current(normalized_subject, count, LEXICAL_INDEX_TTL):
+            results = collection.get(where={"pending": False}, include=["documents"])
+            self.lexical_index.build(normalized_subject, results["ids"], results["documents"], version=count)
+        return [doc_id for doc_id, _ in self.lexical_index.search(normalized_subject, query, limit)]
+
+    def query_passages(self, subject: str, query: str, n_results: int = 3, query_embedding: List[float] = None) -> List[str]:
+        """
+        Return the passages in the subject most relevant to the query.
+        Dense (embedding) and lexical (BM25) rankings are merged with reciprocal rank fusion,
+        then optionally reranked by a cross-encoder. Identical passages are returned once.
+        Pass query_embedding to reuse an embedding the caller already computed.
+        """
+        try:
+            with metrics.span("retrieval"):
+                collection = self._get_collection(subject)
+                self._upgrade_legacy_notes(collection)
+                count = collection.count()
+                if count == 0:
+                    return []
+                if query_embedding is None:
+                    query_embedding = self.embed_query(query)
+                candidates = min(max(RETRIEVAL_CANDIDATES, n_results * 2), count)
+                dense = collection.query(
+                    query_embeddings=[query_embedding],
+                    n_results=candidates,
+                    where={"pending": False},
+                    include=["documents"]
+                )
+                documents = dict(zip(dense["ids"][0], dense["documents"][0]))
+                lexical_ids = self._lexical_search(subject, collection, query, candidates, count)
+                ranked = reciprocal_rank_fusion([dense["ids"][0], lexical_ids])
+
+                missing = [doc_id for doc_id in ranked if doc_id not in documents]
+                if missing:
+                    fetched = collection.get(ids=missing, include=["documents"])
+                    documents.update(zip(fetched["ids"], fetched["documents"]))
+                ranked = [doc_id for doc_id in ranked if doc_id in documents]
+
+                if self.reranker is not None:
+                    head = ranked[:RERANK_CANDIDATES]
+                    with metrics.span("rerank"):
+                        scores = self.reranker.predict([(query, documents[doc_id]) for doc_id in head])
+                    ranked = [doc_id for _, doc_id in sorted(zip(scores, head), key=lambda pair: pair[0], reverse=True)] + ranked[RERANK_CANDIDATES:]
+
+                passages = []
+                for doc_id in ranked:
+                    if documents[doc_id] not in passages:
+                        passages.append(documents[doc_id])
+                    if len(passages) == n_results:
+                        break
+                return passages
+        except Exception as e:
+            self._forget_collection(subject, e)
+            raise Exception(f"Failed to query notes for {subject}: {str(e)}")
+
+    def sample_passages(self, subject: str, token_budget: int, rng=None) -> List[str]:
+        """
+        Return a diverse, representative set of passages from the subject that fits in token_budget.
+        """
+        try:
+            with metrics.span("retrieval"):
+                collection = self._get_collection(subject)
+                self._upgrade_legacy_notes(collection)
+                documents, embeddings = self._sample_pool(collection, rng)
+                if not documents:
+                    return []
+                indices = select_diverse_passages(documents, embeddings, token_budget, rng=rng)
+                if not indices:
+                    # Every passage is larger than the budget (e.g. whole files saved before chunking)
+                    return [documents[0][:token_budget * CHARS_PER_TOKEN]]
+                return [documents[i] for i in indices]
+        except Exception as e:
+            self._forget_collection(subject, e)
+            raise Exception(f"Failed to sample notes for {subject}: {str(e)}")
+
+    def _sample_pool(self, collection, rng=None) -> Tuple[List[str], list]:
+        """
+        Read at most SAMPLE_POOL_SIZE passages and their embeddings to choose a sample from.
+        A larger subject is read as SAMPLE_WINDOWS windows, one from each equal slice of the
+        collection, placed at random within the slice when rng is given.
+        """
+        count = collection.count()
+        if count <= SAMPLE_POOL_SIZE:
+            results = collection.get(where={"pending": False}, include=["documents", "embeddings"])
+            return results["documents"] or [], results["embeddings"]
+        window = SAMPLE_POOL_SIZE // SAMPLE_WINDOWS
+        stride = count // SAMPLE_WINDOWS
+        documents, embeddings = [], []
+        for start in range(0, stride * SAMPLE_WINDOWS, stride):
+            offset = start + (rng.randrange(stride - window + 1) if rng is not None else 0)
+            results = collection.get(where={"pending": False}, limit=window, offset=offset, include=["documents", "embeddings"])
+            documents.extend(results["documents"])
+            embeddings.extend(results["embeddings"])
+        return documents, embeddings
+
+    def export_batches(self, subject: str, batch_size: int = EXPORT_BATCH_SIZE) -> Iterator[dict]:
+        """
+        Yield every stored passage of the subject, with its metadata and embedding,
+        as Chroma get() results of up to batch_size passages. Notes still being written are left out.
+        """
+        collection = self._get_collection(subject)
+        self._upgrade_legacy_notes(collection)
+        offset = 0
+        while True:
+            results = collection.get(where={"pending": False}, limit=batch_size, offset=offset,
+                                     include=["documents", "metadatas", "embeddings"])
+            if not results["ids"]:
+                return
+            yield results
+            offset += len(results["ids"])
+
+    def import_batch(self, subject: str, ids: List[str], documents: List[str], metadatas: List[dict], embeddings) -> None:
+        """
+        Store already embedded passages (from export_batches) in one write, without re-embedding.
+        Passages whose id is already stored are left as they are.
+        """
+        normalized_subject = self._normalize_subject(subject)
+        try:
+            collection = self._get_collection(subject, verify=True)
+            # Archives written before the pending flag existed hold only finished notes
+            metadatas = [{"pending": False, **(metadata or {})} for metadata in metadatas]
+            collection.add(ids=ids, documents=documents, metadatas=metadatas, embeddings=embeddings)
+        except Exception as e:
+            raise Exception(f"Failed to import passages for {subject}: {str(e)}")
+        # Imported notes may predate chunking, and the BM25 index is rebuilt with them on next search
+        self._upgraded_collections.discard(collection.name)
+        self.lexical_index.invalidate(normalized_subject)
+        self.note_index.invalidate(normalized_subject)
+        self.response_cache.invalidate_subject(normalized_subject)
+
     def list_subjects(self) -> List[str]:
         """
         List all unique subjects in the Chroma DB.
         """
         try:
-            collections = self.client.list_collections()
-            subjects = list(set(c.name.replace("notes_", "").replace("_", " ").title() for c in collections))
+            # Always re-read, so subjects added by other workers or the Streamlit app are listed
+            names = self._collections.names()
+            subjects = list(set(name.replace("notes_", "").replace("_", " ").title() for name in names))
             return sorted(subjects)
         except Exception as e:
             raise Exception(f"Failed to list subjects: {str(e)}")
@@ -127,9 +692,12 @@ class NotesStorage:
         """
         Delete the entire subject collection from Chroma DB.
         """
+        normalized_subject = self._normalize_subject(subject)
+        self.response_cache.invalidate_subject(normalized_subject)
+        self.lexical_index.invalidate(normalized_subject)
+        self.note_index.invalidate(normalized_subject)
         try:
-            collection_name = f"notes_{self._normalize_subject(subject)}"
-            self.client.delete_collection(name=collection_name)
+            self._collections.delete(f"notes_{normalized_subject}")
             return True
         except Exception:
             # Collection may not exist
@@ -0,0 +1,193 @@
+"""
+Subject snapshots: one zip archive holding a subject's passages and flashcards together
+with their embeddings, so a subject can be moved or restored without re-embedding.
+
+    manifest.json     format, version, subject, embedding model, dimensions, counts
+    passages.jsonl    one {"id", "document", "metadata"} per line
+    passages.npy      passage embeddings, one row per line of passages.jsonl
+    flashcards.jsonl  as passages.jsonl
+    flashcards.npy    as passages.npy
+
+Records are compressed; embeddings are stored uncompressed (floats barely compress) in
+ARCHIVE_DTYPE. Both directions work a batch at a time, so neither holds a whole subject in memory.
+"""
+import io
+import itertools
+import json
+import shutil
+import tempfile
+import zipfile
+import zlib
+from datetime import datetime
+from typing import Iterator, Tuple
+import numpy as np
+
+ARCHIVE_FORMAT = "studysense-subject"
+ARCHIVE_VERSION = 1
+# Precision of stored embeddings; float16 halves the archive and does not change retrieval results
+ARCHIVE_DTYPE = "float16"
+# Records written to or read from storage per batch
+ARCHIVE_BATCH_SIZE = 1000
+SECTIONS = ("passages", "flashcards")
+
+
+def _write_section(archive: zipfile.ZipFile, name: str, batches, dtype: str) -> Tuple[int, int]:
+    """
+    Write one storage's export_batches() as <name>.jsonl and <name>.npy. Returns (rows, dimensions).
+    Embeddings are spooled to a temporary file, since the .npy header needs the final row count.
+    """
+    rows, dimensions = 0, 0
+    with tempfile.TemporaryFile() as vectors:
+        with archive.open(f"{name}.jsonl", "w", force_zip64=True) as member, io.TextIOWrapper(member, encoding="utf-8") as records:
+            for batch in batches:
+                for record_id, document, metadata in zip(batch["ids"], batch["documents"], batch["metadatas"]):
+                    records.write(json.dumps({"id": record_id, "document": document, "metadata": metadata or {}}) + "\n")
+                embeddings = np.asarray(batch["embeddings"], dtype=np.float32)
+                dimensions = embeddings.shape[1]
+                vectors.write(embeddings.astype(dtype).tobytes())
+                rows += len(batch["ids"])
+        vectors.seek(0)
+        # Embeddings need no compression, and storing them lets import read rows straight off the member
+        with archive.open(zipfile.ZipInfo(f"{name}.npy", date_time=datetime.now().timetuple()[:6]), "w", force_zip64=True) as member:
+            header = {"descr": np.lib.format.dtype_to_descr(np.dtype(dtype)), "fortran_order": False, "shape": (rows, dimensions)}
+            np.lib.format.write_array_header_1_0(member, header)
+            shutil.copyfileobj(vectors, member)
+    return rows, dimensions
+
+
+def export_subject(notes_storage, flashcard_storage, subject: str, path: str, dtype: str = ARCHIVE_DTYPE) -> dict:
+    """
+    Write the subject's passages, flashcards and their embeddings to a zip archive at path.
+    Returns the archive's manifest.
+    """
+    with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        passages, passage_dimensions = _write_section(archive, "passages", notes_storage.export_batches(subject, ARCHIVE_BATCH_SIZE), dtype)
+        flashcards, flashcard_dimensions = _write_section(archive, "flashcards", flashcard_storage.export_batches(subject, ARCHIVE_BATCH_SIZE), dtype)
+        manifest = {
+            "format": ARCHIVE_FORMAT,
+            "version": ARCHIVE_VERSION,
+            "subject": subject,
+            "exported_at": datetime.utcnow().isoformat(),
+            "embedding_model": notes_storage.embeddings.model_name,
+            "dimensions": passage_dimensions or flashcard_dimensions,
+            "dtype": dtype,
+            "passages": passages,
+            "flashcards": flashcards
+        }
+        archive.writestr("manifest.json", json.dumps(manifest, indent=2))
+    return manifest
+
+
+def _read_header(vectors, name: str) -> Tuple[tuple, np.dtype]:
+    """
+    Read a section's .npy header, returning (shape, dtype) of its (rows, dimensions) embeddings.
+    """
+    version = np.lib.format.read_magic(vectors)
+    if version == (1, 0):
+        shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(vectors)
+    else:
+        shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(vectors)
+    if fortran_order or len(shape) != 2:
+        raise ValueError(f"Unexpected embedding layout in {name}.npy")
+    return shape, dtype
+
+
+def _read_section(archive: zipfile.ZipFile, name: str, batch_size: int) -> Iterator[Tuple[list, list, list, np.ndarray]]:
+    """
+    Yield (ids, documents, metadatas, float32 embeddings) batches from one section of an archive.
+    """
+    with archive.open(f"{name}.jsonl") as member, io.TextIOWrapper(member, encoding="utf-8") as records, \
+            archive.open(f"{name}.npy") as vectors:
+        shape, dtype = _read_header(vectors, name)
+        row_bytes = shape[1] * dtype.itemsize
+        read = 0
+        while True:
+            lines = list(itertools.islice(records, batch_size))
+            if not lines:
+                break
+            try:
+                entries = [json.loads(line) for line in lines]
+                if not all(isinstance(entry, dict) and {"id", "document", "metadata"} <= entry.keys() for entry in entries):
+                    raise ValueError
+            except ValueError:
+                raise ValueError(f"{name}.jsonl has a malformed record")
+            data = vectors.read(len(entries) * row_bytes)
+            if len(data) != len(entries) * row_bytes:
+                raise ValueError(f"{name}.npy has fewer embeddings than {name}.jsonl has records")
+            read += len(entries)
+            embeddings = np.frombuffer(data, dtype=dtype).reshape(len(entries), shape[1]).astype(np.float32)
+            yield (
+                [entry["id"] for entry in entries],
+                [entry["document"] for entry in entries],
+                [entry["metadata"] for entry in entries],
+                embeddings
+            )
+        if read != shape[0]:
+            raise ValueError(f"{name}.jsonl has {read} records but {name}.npy has {shape[0]} embeddings")
+
+
+def _check_manifest(archive: zipfile.ZipFile) -> dict:
+    try:
+        manifest = json.loads(archive.read("manifest.json"))
+    except KeyError:
+        raise ValueError("Not a subject archive: manifest.json is missing")
+    if manifest.get("format") != ARCHIVE_FORMAT:
+        raise ValueError("Not a subject archive")
+    if manifest.get("version") != ARCHIVE_VERSION:
+        raise ValueError(f"Unsupported subject archive version: {manifest.get('version')}")
+    return manifest
+
+
+def _check_sections(archive: zipfile.ZipFile, manifest: dict) -> None:
+    """
+    Read both sections through once, so that a truncated or corrupt archive is rejected
+    before anything is deleted or written. Raises ValueError.
+    """
+    for name in SECTIONS:
+        try:
+            with archive.open(f"{name}.npy") as vectors:
+                shape, _ = _read_header(vectors, name)
+            if shape[0] != manifest.get(name):
+                raise ValueError(f"{name}.npy has {shape[0]} embeddings but the manifest lists {manifest.get(name)}")
+            if shape[0] and shape[1] != manifest.get("dimensions"):
+                raise ValueError(f"{name}.npy has {shape[1]} dimensions but the manifest lists {manifest.get('dimensions')}")
+            for _ in _read_section(archive, name, ARCHIVE_BATCH_SIZE):
+                pass
+        except KeyError:
+            raise ValueError(f"Not a subject archive: {name} is missing")
+        except (zipfile.BadZipFile, EOFError, zlib.error, UnicodeDecodeError) as e:
+            raise ValueError(f"Corrupt {name} section: {e}")
+
+
+def import_subject(notes_storage, flashcard_storage, file, subject: str = None, replace: bool = False) -> dict:
+    """
+    Load an archive written by export_subject (a path or a seekable binary file) into subject,
+    or into the subject it was exported from. Embeddings are stored as they are, so the
+    archive must come from the same embedding model. Records already present (same id) are
+    kept; with replace, the subject's existing notes and flashcards are deleted first.
+    The whole archive is checked before anything is changed.
+    Returns the subject and the number of notes, passages and flashcards imported.
+    """
+    with zipfile.ZipFile(file) as archive:
+        manifest = _check_manifest(archive)
+        model_name = notes_storage.embeddings.model_name
+        if manifest["embedding_model"] != model_name:
+            raise ValueError(
+                f"Archive embeddings come from {manifest['embedding_model']}, but this server uses {model_name}"
+            )
+        _check_sections(archive, manifest)
+        subject = subject or manifest["subject"]
+        if replace:
+            notes_storage.delete_subject(subject)
+            flashcard_storage.delete_subject(subject)
+
+        counts = {"notes": 0, "passages": 0, "flashcards": 0}
+        for section, storage in zip(SECTIONS, (notes_storage, flashcard_storage)):
+            for ids, documents, metadatas, embeddings in _read_section(archive, section, ARCHIVE_BATCH_SIZE):
+                # Imported under another name, the records take on the new subject
+                metadatas = [{**(metadata or {}), "subject": subject} for metadata in metadatas]
+                storage.import_batch(subject, ids, documents, metadatas, embeddings)
+                counts[section] += len(ids)
+                if section == "passages":
+                    counts["notes"] += sum(1 for metadata in metadatas if metadata.get("chunk_index", 0) == 0)
+    return {"subject": subject, **counts}
@@ -0,0 +1,608 @@
+import fcntl
+import itertools
+import json
+import os
+import re
+import shutil
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Protocol, Sequence, Tuple
+import numpy as np
+
+# Storage precision of local embeddings: "float16" (half of float32, near-lossless for cosine
+# search) or "int8" (a quarter, with one float32 scale per vector). Fixed per collection when created.
+LOCAL_VECTOR_DTYPE = os.getenv("LOCAL_VECTOR_DTYPE", "float16")
+# Collections are searched exactly up to this many vectors; larger ones get an in-memory HNSW index
+LOCAL_ANN_THRESHOLD = int(os.getenv("LOCAL_ANN_THRESHOLD", "20000"))
+# Collections whose records are held in memory at once; the least recently used are unloaded
+LOCAL_MAX_OPEN_COLLECTIONS = int(os.getenv("LOCAL_MAX_OPEN_COLLECTIONS", "64"))
+# Deleted or replaced vectors tolerated before a collection's files are rewritten without them
+COMPACT_MIN_DEAD_ROWS = 1024
+# Rows scored per matrix product in exact search, bounding the float32 copy of a large collection
+EXACT_SEARCH_BLOCK = 8192
+# hnswlib build and search parameters
+ANN_M = 16
+ANN_EF_CONSTRUCTION = 200
+ANN_EF_SEARCH = 64
+
+# Same rule as Chroma, so a subject name valid on one backend is valid on the other
+_COLLECTION_NAME = re.compile(r"^[a-zA-Z0-9][a-zA-Z0-9._-]{1,61}[a-zA-Z0-9]$")
+_OPERATORS = {
+    "$eq": lambda value, operand: value == operand,
+    "$ne": lambda value, operand: value != operand,
+    "$gt": lambda value, operand: value > operand,
+    "$gte": lambda value, operand: value >= operand,
+    "$lt": lambda value, operand: value < operand,
+    "$lte": lambda value, operand: value <= operand,
+    "$in": lambda value, operand: value in operand,
+    "$nin": lambda value, operand: value not in operand,
+}
+
+
+class VectorCollection(Protocol):
+    """
+    The part of Chroma's Collection API that NotesStorage and FlashcardStorage use.
+    Collections are created without an embedding function, so embeddings are always passed in.
+    """
+    name: str
+
+    def add(self, ids: List[str], embeddings, metadatas: List[dict] = None, documents: List[str] = None) -> None: ...
+
+    def get(self, ids: List[str] = None, where: dict = None, limit: int = None, offset: int = None,
+            include: Sequence[str] = ("metadatas", "documents")) -> dict: ...
+
+    def update(self, ids: List[str], embeddings=None, metadatas: List[dict] = None, documents: List[str] = None) -> None: ...
+
+    def delete(self, ids: List[str] = None, where: dict = None) -> None: ...
+
+    def count(self) -> int: ...
+
+    def query(self, query_embeddings, n_results: int = 10, where: dict = None,
+              include: Sequence[str] = ("metadatas", "documents", "distances")) -> dict: ...
+
+
+class VectorClient(Protocol):
+    """
+    The part of Chroma's client API the storages use. chromadb.PersistentClient and
+    LocalVectorClient both provide it; services.registry.get_vector_client picks one.
+    """
+
+    def list_collections(self) -> Sequence[VectorCollection]: ...
+
+    def create_collection(self, name: str, embedding_function=None) -> VectorCollection: ...
+
+    def get_or_create_collection(self, name: str, embedding_function=None) -> VectorCollection: ...
+
+    def delete_collection(self, name: str) -> None: ...
+
+
+def _matches(metadata: dict, where: dict) -> bool:
+    """
+    Evaluate a Chroma-style where filter ($and, $or and the comparison operators) against metadata.
+    A condition on a key the metadata lacks never matches.
+    """
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(_matches(metadata, clause) for clause in condition):
+                return False
+        elif key == "$or":
+            if not any(_matches(metadata, clause) for clause in condition):
+                return False
+        elif key not in metadata:
+            return False
+        elif isinstance(condition, dict):
+            for operator, operand in condition.items():
+                if operator not in _OPERATORS:
+                    raise ValueError(f"Unsupported where operator: {operator}")
+                if not _OPERATORS[operator](metadata[key], operand):
+                    return False
+        elif metadata[key] != condition:
+            return False
+    return True
+
+
+def _normalize(vectors) -> np.ndarray:
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1.0, norms)
+
+
+class LocalCollection:
+    """
+    One collection stored as three files in its own directory:
+
+    - vectors.<gen>.bin: unit-length embeddings as raw float16 or int8 rows, memory-mapped for search
+    - scales.<gen>.bin: one float32 per row for int8 collections
+    - records.<gen>.jsonl: an append-only log of adds, updates and deletes (id, row, document, metadata)
+
+    meta.json names the current generation; compaction writes the next generation and then
+    switches meta.json, so a crash leaves either the old or the new files in use. Records
+    are replayed into memory when the collection is first used and dropped again when the
+    client unloads it. Search is by cosine similarity; distances are 1 - similarity.
+    Row numbers are assigned in memory, so only the client holding the store's lock may write.
+    """
+
+    def __init__(self, client: "LocalVectorClient", name: str, path: str):
+        self.name = name
+        self._client = client
+        self._path = path
+        self._lock = threading.RLock()
+        self._dropped = False
+        self._unload()
+
+    def _unload(self) -> None:
+        self._loaded = False
+        # id -> [row, document, metadata], in insertion order
+        self._records: Optional[OrderedDict] = None
+        self._meta = None
+        self._rows = 0
+        self._vectors = None
+        self._scales = None
+        self._live = None
+        self._ann = None
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self._path, name)
+
+    def _data_file(self, kind: str, generation: int = None) -> str:
+        generation = self._meta["generation"] if generation is None else generation
+        extension = "jsonl" if kind == "records" else "bin"
+        return self._file(f"{kind}.{generation}.{extension}")
+
+    def _row_bytes(self) -> int:
+        return self._meta["dim"] * np.dtype(self._meta["dtype"]).itemsize
+
+    def _load(self) -> None:
+        """
+        Replay the record log if the collection is not in memory. Callers must hold _lock.
+        """
+        if self._dropped:
+            raise ValueError(f"Collection {self.name} does not exist.")
+        if not self._loaded:
+            self._records = OrderedDict()
+            meta_path = self._file("meta.json")
+            if os.path.exists(meta_path):
+                with open(meta_path) as f:
+                    self._meta = json.load(f)
+                self._replay()
+                self._rows = self._recover_rows()
+            self._loaded = True
+        self._client._touch(self)
+
+    def _recover_rows(self) -> int:
+        """
+        Number of complete vector rows on disk. A write cut short by a crash is truncated
+        away so that later appends stay aligned.
+        """
+        paths = [(self._data_file("vectors"), self._row_bytes())]
+        if self._meta["dtype"] == "int8":
+            paths.append((self._data_file("scales"), np.dtype(np.float32).itemsize))
+        rows = min(os.path.getsize(path) // size if os.path.exists(path) else 0 for path, size in paths)
+        for path, size in paths:
+            if os.path.exists(path) and os.path.getsize(path) != rows * size:
+                os.truncate(path, rows * size)
+        return rows
+
+    def _replay(self) -> None:
+        path = self._data_file("records")
+        if not os.path.exists(path):
+            return
+        with open(path, "rb") as f:
+            intact = 0
+            for line in f:
+                try:
+                    if not line.endswith(b"\n"):
+                        raise ValueError("Incomplete record")
+                    entry = json.loads(line)
+                except ValueError:
+                    # A write cut short by a crash; drop it so later appends start on a fresh line
+                    os.truncate(path, intact)
+                    break
+                intact += len(line)
+                op, record_id = entry["op"], entry["id"]
+                if op == "add":
+                    self._records[record_id] = [entry["row"], entry.get("document"), entry.get("metadata") or {}]
+                elif op == "update" and record_id in self._records:
+                    record = self._records[record_id]
+                    record[0] = entry.get("row", record[0])
+                    record[1] = entry.get("document", record[1])
+                    record[2] = entry.get("metadata", record[2])
+                elif op == "delete":
+                    self._records.pop(record_id, None)
+
+    def _write_meta(self, meta: dict) -> None:
+        temporary = self._file("meta.json.tmp")
+        with open(temporary, "w") as f:
+            json.dump(meta, f)
+        os.replace(temporary, self._file("meta.json"))
+        self._meta = meta
+
+    def _log(self, entries: List[dict]) -> None:
+        with open(self._data_file("records"), "a", encoding="utf-8") as f:
+            f.write("".join(json.dumps(entry, separators=(",", ":")) + "\n" for entry in entries))
+
+    def _changed(self) -> None:
+        self._live = None
+
+    def _matrix(self) -> np.ndarray:
+        """
+        The memory-mapped vector rows (including dead ones), remapped after appends.
+        """
+        if self._vectors is None or len(self._vectors) != self._rows:
+            if self._rows == 0:
+                return np.zeros((0, self._meta["dim"] if self._meta else 0), dtype=np.float32)
+            self._vectors = np.memmap(self._data_file("vectors"), dtype=self._meta["dtype"], mode="r", shape=(self._rows, self._meta["dim"]))
+            if self._meta["dtype"] == "int8":
+                self._scales = np.memmap(self._data_file("scales"), dtype=np.float32, mode="r", shape=(self._rows,))
+        return self._vectors
+
+    def _decode(self, rows: np.ndarray) -> np.ndarray:
+        """
+        float32 vectors for the given row numbers.
+        """
+        vectors = np.asarray(self._matrix()[rows], dtype=np.float32)
+        if self._meta["dtype"] == "int8":
+            vectors *= np.asarray(self._scales[rows])[:, None]
+        return vectors
+
+    def _append_vectors(self, vectors: np.ndarray) -> int:
+        """
+        Quantize and append unit vectors. Returns the row number of the first one.
+        """
+        if self._meta is None:
+            os.makedirs(self._path, exist_ok=True)
+            self._write_meta({"dim": int(vectors.shape[1]), "dtype": self._client.dtype, "generation": 0})
+        if vectors.shape[1] != self._meta["dim"]:
+            raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match collection dimensionality {self._meta['dim']}")
+        if self._meta["dtype"] == "int8":
+            scales = np.abs(vectors).max(axis=1) / 127
+            scales[scales == 0] = 1.0
+            with open(self._data_file("scales"), "ab") as f:
+                f.write(scales.astype(np.float32).tobytes())
+            data = np.round(vectors / scales[:, None]).astype(np.int8)
+        else:
+            data = vectors.astype(np.float16)
+        with open(self._data_file("vectors"), "ab") as f:
+            f.write(data.tobytes())
+        first = self._rows
+        self._rows += len(vectors)
+        if self._ann is not None:
+            self._ann_add(np.arange(first, self._rows), vectors)
+        return first
+
+    def _live_rows(self) -> Tuple[List[str], np.ndarray]:
+        """
+        (ids, row numbers) of every record, cached until the next write.
+        """
+        if self._live is None:
+            ids = list(self._records)
+            self._live = (ids, np.fromiter((self._records[record_id][0] for record_id in ids), dtype=np.int64, count=len(ids)))
+        return self._live
+
+    def _result(self, items: List[Tuple[str, list]], include: Sequence[str]) -> dict:
+        return {
+            "ids": [record_id for record_id, _ in items],
+            "documents": [record[1] for _, record in items] if "documents" in include else None,
+            "metadatas": [dict(record[2]) for _, record in items] if "metadatas" in include else None,
+            "embeddings": list(self._decode(np.array([record[0] for _, record in items], dtype=np.int64)))
+            if "embeddings" in include and items else ([] if "embeddings" in include else None)
+        }
+
+    def add(self, ids: List[str], embeddings=None, metadatas: List[dict] = None, documents: List[str] = None) -> None:
+        if embeddings is None:
+            raise ValueError("LocalCollection has no embedding function; embeddings are required")
+        vectors = _normalize(embeddings)
+        if len(vectors) != len(ids):
+            raise ValueError("Number of embeddings does not match number of ids")
+        with self._lock:
+            self._load()
+            # Like Chroma, adding an id that already exists is ignored
+            new, seen = [], set()
+            for i, record_id in enumerate(ids):
+                if record_id not in self._records and record_id not in seen:
+                    new.append(i)
+                    seen.add(record_id)
+            if not new:
+                return
+            first = self._append_vectors(vectors[new])
+            entries = []
+            for row, i in enumerate(new, start=first):
+                document = documents[i] if documents is not None else None
+                metadata = dict(metadatas[i] or {}) if metadatas is not None else {}
+                entries.append({"op": "add", "id": ids[i], "row": row, "document": document, "metadata": metadata})
+                self._records[ids[i]] = [row, document, metadata]
+            self._log(entries)
+            self._changed()
+
+    def get(self, ids: List[str] = None, where: dict = None, limit: int = None, offset: int = None,
+            include: Sequence[str] = ("metadatas", "documents")) -> dict:
+        with self._lock:
+            self._load()
+            if ids is not None:
+                items = ((record_id, self._records[record_id]) for record_id in ids if record_id in self._records)
+            else:
+                items = iter(self._records.items())
+            if where:
+                items = (item for item in items if _matches(item[1][2], where))
+            start = offset or 0
+            items = list(itertools.islice(items, start, None if limit is None else start + limit))
+            return self._result(items, include)
+
+    def update(self, ids: List[str], embeddings=None, metadatas: List[dict] = None, documents: List[str] = None) -> None:
+        vectors = _normalize(embeddings) if embeddings is not None else None
+        with self._lock:
+            self._load()
+            # Like Chroma, ids that do not exist are skipped
+            present = [i for i, record_id in enumerate(ids) if record_id in self._records]
+            if not present:
+                return
+            first = self._append_vectors(vectors[present]) if vectors is not None else None
+            entries, replaced = [], []
+            for n, i in enumerate(present):
+                record = self._records[ids[i]]
+                entry = {"op": "update", "id": ids[i]}
+                if first is not None:
+                    replaced.append(record[0])
+                    record[0] = entry["row"] = first + n
+                if documents is not None:
+                    record[1] = entry["document"] = documents[i]
+                if metadatas is not None and metadatas[i] is not None:
+                    # Keys are merged into the stored metadata; a None value removes the key
+                    merged = {**record[2], **metadatas[i]}
+                    record[2] = entry["metadata"] = {key: value for key, value in merged.items() if value is not None}
+                entries.append(entry)
+            self._log(entries)
+            self._ann_remove(replaced)
+            self._changed()
+            self._maybe_compact()
+
+    def delete(self, ids: List[str] = None, where: dict = None) -> None:
+        if ids is None and where is None:
+            raise ValueError("delete needs ids or where")
+        with self._lock:
+            self._load()
+            targets = self.get(ids=ids, where=where, include=[])["ids"]
+            if not targets:
+                return
+            self._ann_remove([self._records[record_id][0] for record_id in targets])
+            for record_id in targets:
+                del self._records[record_id]
+            self._log([{"op": "delete", "id": record_id} for record_id in targets])
+            self._changed()
+            self._maybe_compact()
+
+    def count(self) -> int:
+        with self._lock:
+            self._load()
+            return len(self._records)
+
+    def query(self, query_embeddings, n_results: int = 10, where: dict = None,
+              include: Sequence[str] = ("metadatas", "documents", "distances")) -> dict:
+        queries = _normalize(query_embeddings)
+        results = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        with self._lock:
+            self._load()
+            ids, rows = self._live_rows()
+            if where:
+                keep = [i for i, record_id in enumerate(ids) if _matches(self._records[record_id][2], where)]
+                ids, rows = [ids[i] for i in keep], rows[keep]
+            for query in queries:
+                if not where and len(ids) > self._client.ann_threshold and self._ann_index() is not None:
+                    matches = self._ann_search(query, min(n_results, len(ids)))
+                else:
+                    matches = self._exact_search(query, ids, rows, n_results)
+                items = [(record_id, self._records[record_id]) for record_id, _ in matches]
+                found = self._result(items, include)
+                results["ids"].append(found["ids"])
+                results["documents"].append(found["documents"])
+                results["metadatas"].append(found["metadatas"])
+                results["distances"].append([1.0 - score for _, score in matches])
+        for key in ("documents", "metadatas", "distances"):
+            if key not in include:
+                results[key] = None
+        results["embeddings"] = None
+        return results
+
+    def _exact_search(self, query: np.ndarray, ids: List[str], rows: np.ndarray, n_results: int) -> List[Tuple[str, float]]:
+        """
+        Score every row against the query, a block at a time, and return the best (id, similarity) pairs.
+        """
+        if not ids or n_results <= 0:
+            return []
+        scores = np.empty(len(rows), dtype=np.float32)
+        for start in range(0, len(rows), EXACT_SEARCH_BLOCK):
+            block = rows[start:start + EXACT_SEARCH_BLOCK]
+            scores[start:start + len(block)] = self._decode(block) @ query
+        k = min(n_results, len(rows))
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best], kind="stable")]
+        return [(ids[i], float(scores[i])) for i in best]
+
+    def _ann_index(self):
+        """
+        Build the HNSW index over the live rows on first use. None if hnswlib is unavailable.
+        """
+        if self._ann is None:
+            try:
+                import hnswlib
+            except ImportError:
+                return None
+            _, rows = self._live_rows()
+            index = hnswlib.Index(space="ip", dim=self._meta["dim"])
+            index.init_index(max_elements=max(2 * len(rows), 1024), ef_construction=ANN_EF_CONSTRUCTION, M=ANN_M)
+            for start in range(0, len(rows), EXACT_SEARCH_BLOCK):
+                block = rows[start:start + EXACT_SEARCH_BLOCK]
+                index.add_items(self._decode(block), block)
+            index.set_ef(ANN_EF_SEARCH)
+            self._ann = index
+        return self._ann
+
+    def _ann_add(self, rows: np.ndarray, vectors: np.ndarray) -> None:
+        needed = self._ann.get_current_count() + len(rows)
+        if needed > self._ann.get_max_elements():
+            self._ann.resize_index(2 * needed)
+        self._ann.add_items(vectors, rows)
+
+    def _ann_remove(self, rows: List[int]) -> None:
+        if self._ann is not None:
+            for row in rows:
+                self._ann.mark_deleted(int(row))
+
+    def _ann_search(self, query: np.ndarray, k: int) -> List[Tuple[str, float]]:
+        ids, rows = self._live_rows()
+        row_ids = dict(zip(rows.tolist(), ids))
+        self._ann.set_ef(max(ANN_EF_SEARCH, k))
+        labels, distances = self._ann.knn_query(query, k=k)
+        # The "ip" space reports 1 - inner product
+        return [(row_ids[int(label)], 1.0 - float(distance)) for label, distance in zip(labels[0], distances[0])]
+
+    def _maybe_compact(self) -> None:
+        """
+        Rewrite the collection without dead rows once they outnumber the live ones.
+        """
+        dead = self._rows - len(self._records)
+        if dead < max(COMPACT_MIN_DEAD_ROWS, len(self._records)):
+            return
+        generation = self._meta["generation"] + 1
+        ids, rows = self._live_rows()
+        with open(self._data_file("vectors", generation), "wb") as f:
+            for start in range(0, len(rows), EXACT_SEARCH_BLOCK):
+                f.write(np.asarray(self._matrix()[rows[start:start + EXACT_SEARCH_BLOCK]]).tobytes())
+        if self._meta["dtype"] == "int8":
+            with open(self._data_file("scales", generation), "wb") as f:
+                f.write(np.asarray(self._scales[rows]).tobytes())
+        with open(self._data_file("records", generation), "w", encoding="utf-8") as f:
+            for row, record_id in enumerate(ids):
+                _, document, metadata = self._records[record_id]
+                f.write(json.dumps({"op": "add", "id": record_id, "row": row, "document": document, "metadata": metadata},
+                                   separators=(",", ":")) + "\n")
+        previous = self._meta["generation"]
+        self._write_meta({**self._meta, "generation": generation})
+        for kind in ("vectors", "scales", "records"):
+            try:
+                os.remove(self._data_file(kind, previous))
+            except FileNotFoundError:
+                pass
+        for row, record_id in enumerate(ids):
+            self._records[record_id][0] = row
+        self._rows = len(ids)
+        self._vectors = self._scales = self._ann = None
+        self._changed()
+
+    def _drop(self) -> None:
+        with self._lock:
+            self._dropped = True
+            self._unload()
+
+
+class LocalVectorClient:
+    """
+    Embedded alternative to chromadb.PersistentClient for stores with many small subjects.
+    Each collection is a directory under path holding memory-mapped float16 or int8 vectors
+    (see LocalCollection). Collections cost nothing until used, and at most max_open are held
+    in memory. Search is exact and vectorized up to ann_threshold vectors, and uses an
+    in-memory HNSW index (hnswlib, which Chroma already depends on) above it.
+
+    A store belongs to one client at a time: the client holds an exclusive lock on
+    <path>/.lock until close(), and opening a store locked by another process raises
+    RuntimeError. Run the API with a single worker process on this backend.
+    """
+
+    def __init__(self, path: str, dtype: str = LOCAL_VECTOR_DTYPE, ann_threshold: int = LOCAL_ANN_THRESHOLD,
+                 max_open: int = LOCAL_MAX_OPEN_COLLECTIONS):
+        if dtype not in ("float16", "int8"):
+            raise ValueError(f"Unsupported local vector dtype: {dtype}")
+        self.path = path
+        self.dtype = dtype
+        self.ann_threshold = ann_threshold
+        self.max_open = max_open
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+        self._lock_file = open(os.path.join(path, ".lock"), "a")
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self._lock_file.close()
+            raise RuntimeError(
+                f"Local vector store {path} is already open in another process or client; "
+                "only one process at a time may open it"
+            )
+        self._collections: Dict[str, LocalCollection] = {
+            entry.name: LocalCollection(self, entry.name, entry.path)
+            for entry in os.scandir(path) if entry.is_dir()
+        }
+        # Loaded collections, least recently used first
+        self._open = OrderedDict()
+
+    def close(self) -> None:
+        """
+        Unload every collection and release the store's lock.
+        """
+        with self._lock:
+            collections = list(self._collections.values())
+            self._collections.clear()
+            self._open.clear()
+        for collection in collections:
+            collection._drop()
+        if not self._lock_file.closed:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+            self._lock_file.close()
+
+    def _touch(self, collection: LocalCollection) -> None:
+        """
+        Mark a collection as recently used and unload the least recently used beyond max_open.
+        Collections busy in another thread are skipped rather than waited on.
+        """
+        with self._lock:
+            self._open[collection.name] = collection
+            self._open.move_to_end(collection.name)
+            victims = list(self._open.values())[:max(len(self._open) - self.max_open, 0)]
+        for victim in victims:
+            if victim is not collection and victim._lock.acquire(blocking=False):
+                try:
+                    victim._unload()
+                    with self._lock:
+                        if self._open.get(victim.name) is victim:
+                            del self._open[victim.name]
+                finally:
+                    victim._lock.release()
+
+    def list_collections(self) -> List[LocalCollection]:
+        with self._lock:
+            return list(self._collections.values())
+
+    def get_collection(self, name: str, embedding_function=None) -> LocalCollection:
+        with self._lock:
+            if name not in self._collections:
+                raise ValueError(f"Collection {name} does not exist.")
+            return self._collections[name]
+
+    def _create(self, name: str) -> LocalCollection:
+        """
+        Callers must hold _lock.
+        """
+        if not _COLLECTION_NAME.match(name) or ".." in name:
+            raise ValueError(f"Invalid collection name: {name}")
+        path = os.path.join(self.path, name)
+        os.makedirs(path, exist_ok=True)
+        collection = self._collections[name] = LocalCollection(self, name, path)
+        return collection
+
+    def create_collection(self, name: str, embedding_function=None) -> LocalCollection:
+        with self._lock:
+            if name in self._collections:
+                raise ValueError(f"Collection {name} already exists.")
+            return self._create(name)
+
+    def get_or_create_collection(self, name: str, embedding_function=None) -> LocalCollection:
+        with self._lock:
+            return self._collections.get(name) or self._create(name)
+
+    def delete_collection(self, name: str) -> None:
+        with self._lock:
+            collection = self._collections.pop(name, None)
+            self._open.pop(name, None)
+        if collection is None:
+            raise ValueError(f"Collection {name} does not exist.")
+        collection._drop()
+        shutil.rmtree(collection._path, ignore_errors=True)
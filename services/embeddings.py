@@ -0,0 +1,289 @@
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import List
+from services import metrics
+from services.registry import EMBEDDING_MODEL_NAME, get_embedding_model
+
+# "torch" (SentenceTransformer), "torch-int8" (dynamically quantized Linear layers)
+# or "onnx" (onnxruntime MiniLM bundled with chromadb, all-MiniLM-L6-v2 only)
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+# Texts encoded per forward pass
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))
+# Query embeddings kept in the LRU cache
+QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "4096"))
+# Milliseconds the batcher waits for more concurrent requests before encoding; 0 encodes on the caller's thread
+EMBEDDING_BATCH_WINDOW_MS = float(os.getenv("EMBEDDING_BATCH_WINDOW_MS", "5"))
+# Most texts in one micro-batch; a full batch is encoded without waiting out the window, and
+# larger requests are split into slices of this size
+EMBEDDING_MAX_BATCH = int(os.getenv("EMBEDDING_MAX_BATCH", "64"))
+
+_embedding_service = None
+_service_lock = threading.Lock()
+
+
+class _OnnxMiniLM:
+    """
+    Adapts chromadb's onnxruntime MiniLM to the SentenceTransformer encode() interface.
+    """
+
+    def __init__(self):
+        from chromadb.utils.embedding_functions import ONNXMiniLM_L6_V2
+        self._function = ONNXMiniLM_L6_V2(preferred_providers=["CPUExecutionProvider"])
+
+    def encode(self, texts, batch_size=EMBEDDING_BATCH_SIZE, **kwargs):
+        import numpy as np
+        vectors = []
+        for start in range(0, len(texts), batch_size):
+            vectors.extend(self._function(texts[start:start + batch_size]))
+        return np.array(vectors, dtype=np.float32)
+
+
+class _EncodeRequest:
+    """
+    One submit() call: its texts, the embeddings computed so far and the future they resolve.
+    """
+
+    def __init__(self, texts: List[str], future: Future, queued_at: float, labels: dict):
+        self.texts = texts
+        self.future = future
+        self.queued_at = queued_at
+        self.labels = labels
+        self.embeddings = []
+
+    @property
+    def remaining(self) -> int:
+        return len(self.texts) - len(self.embeddings)
+
+
+class EmbeddingBatcher:
+    """
+    Coalesces concurrent encode requests into micro-batches run on one dedicated thread.
+    Each request waits at most window_ms for others to join, so a burst of single-question
+    encodes costs one forward pass instead of one each. A batch holds at most max_batch
+    texts: larger requests are encoded a slice at a time and go back to the end of the
+    queue between slices, so queries submitted during a big ingest wait for one slice at most.
+    """
+
+    def __init__(self, encode_fn, window_ms: float = EMBEDDING_BATCH_WINDOW_MS, max_batch: int = EMBEDDING_MAX_BATCH):
+        self._encode = encode_fn
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self._requests = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        # Metrics
+        self.queued_texts = 0
+        self.batches = 0
+        self.batched_texts = 0
+        self.last_batch_size = 0
+        self.max_batch_size = 0
+
+    def submit(self, texts: List[str]) -> Future:
+        """
+        Queue texts for encoding. The future resolves to their embeddings, in order.
+        """
+        future = Future()
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+                self._thread.start()
+            self.queued_texts += len(texts)
+        # Carry the caller's metric labels to the batching thread for its queue-wait span
+        self._requests.put(_EncodeRequest(list(texts), future, time.perf_counter(), metrics.current_labels()))
+        return future
+
+    def encode(self, texts: List[str]) -> List[List[float]]:
+        return self.submit(texts).result()
+
+    def _run(self):
+        while True:
+            request = self._requests.get()
+            if request is None:
+                # Requests requeued after close() was called are finished first
+                if self._requests.empty():
+                    return
+                self._requests.put(None)
+                continue
+            batch = [(request, min(request.remaining, self.max_batch))]
+            size = batch[0][1]
+            deadline = time.monotonic() + self.window
+            stopping = False
+            while size < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    request = self._requests.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if request is None:
+                    stopping = True
+                    break
+                count = min(request.remaining, self.max_batch - size)
+                batch.append((request, count))
+                size += count
+            self._process(batch, size)
+            # Unfinished requests rejoin the queue behind whatever arrived meanwhile
+            for request, _ in batch:
+                if request.remaining and not request.future.done():
+                    self._requests.put(request)
+            if stopping:
+                self._requests.put(None)
+
+    def _process(self, batch, size: int):
+        with self._lock:
+            self.queued_texts -= size
+            self.batches += 1
+            self.batched_texts += size
+            self.last_batch_size = size
+            self.max_batch_size = max(self.max_batch_size, size)
+        metrics.EMBEDDING_BATCH_SIZE.observe(size)
+        started_at = time.perf_counter()
+        for request, _ in batch:
+            if not request.embeddings:
+                metrics.STAGE_SECONDS.observe(started_at - request.queued_at, stage="embedding_queue_wait", **request.labels)
+        texts = []
+        for request, count in batch:
+            start = len(request.embeddings)
+            texts.extend(request.texts[start:start + count])
+        try:
+            embeddings = self._encode(texts)
+        except Exception as e:
+            with self._lock:
+                self.queued_texts -= sum(request.remaining - count for request, count in batch)
+            for request, _ in batch:
+                request.future.set_exception(e)
+            return
+        offset = 0
+        for request, count in batch:
+            request.embeddings.extend(embeddings[offset:offset + count])
+            offset += count
+            if not request.remaining:
+                request.future.set_result(request.embeddings)
+
+    def stats(self) -> dict:
+        """
+        Queue depth (texts waiting) and batch-size metrics.
+        """
+        with self._lock:
+            return {
+                "queue_depth": self.queued_texts,
+                "batches": self.batches,
+                "batched_texts": self.batched_texts,
+                "average_batch_size": self.batched_texts / self.batches if self.batches else 0.0,
+                "last_batch_size": self.last_batch_size,
+                "max_batch_size": self.max_batch_size
+            }
+
+    def close(self):
+        """
+        Stop the batching thread after it finishes the requests already queued.
+        """
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._requests.put(None)
+            thread.join()
+
+
+class EmbeddingService:
+    """
+    The one place text is turned into vectors, for stored passages, flashcards and queries alike,
+    so query and document vectors always come from the same model.
+    """
+
+    def __init__(self, model_name=EMBEDDING_MODEL_NAME, backend=EMBEDDING_BACKEND, batch_size=EMBEDDING_BATCH_SIZE,
+                 cache_size=QUERY_EMBEDDING_CACHE_SIZE, batch_window_ms=EMBEDDING_BATCH_WINDOW_MS, model=None):
+        self.model_name = model_name
+        self.backend = backend
+        self.batch_size = batch_size
+        self.cache_size = cache_size
+        self._model = model
+        self._model_lock = threading.Lock()
+        self._query_cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        # Concurrent callers share forward passes through the batcher unless batching is disabled
+        self.batcher = EmbeddingBatcher(self._encode, batch_window_ms) if batch_window_ms > 0 else None
+
+    @property
+    def model(self):
+        """
+        Encoder for the configured backend, loaded on first use.
+        """
+        with self._model_lock:
+            if self._model is None:
+                self._model = self._load_model()
+            return self._model
+
+    def _load_model(self):
+        if self.backend == "torch":
+            return get_embedding_model(self.model_name)
+        if self.backend == "torch-int8":
+            import torch
+            from sentence_transformers import SentenceTransformer
+            # Loaded privately because quantization rewrites the model in place
+            model = SentenceTransformer(self.model_name, device="cpu")
+            return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+        if self.backend == "onnx":
+            if self.model_name != "all-MiniLM-L6-v2":
+                raise ValueError(f"The onnx embedding backend only supports all-MiniLM-L6-v2, not {self.model_name}")
+            return _OnnxMiniLM()
+        raise ValueError(f"Unknown embedding backend: {self.backend}")
+
+    def _encode(self, texts: List[str]) -> List[List[float]]:
+        return self.model.encode(texts, batch_size=self.batch_size).tolist()
+
+    def encode(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed a batch of documents.
+        """
+        if not texts:
+            return []
+        with metrics.span("embedding"):
+            if self.batcher is not None:
+                return self.batcher.encode(texts)
+            return self._encode(list(texts))
+
+    def encode_query(self, text: str) -> List[float]:
+        """
+        Embed a search query, serving repeated queries from an LRU cache.
+        """
+        with self._cache_lock:
+            embedding = self._query_cache.get(text)
+            if embedding is not None:
+                self._query_cache.move_to_end(text)
+                return embedding
+        embedding = self.encode([text])[0]
+        with self._cache_lock:
+            self._query_cache[text] = embedding
+            while len(self._query_cache) > self.cache_size:
+                self._query_cache.popitem(last=False)
+        return embedding
+
+    def stats(self) -> dict:
+        """
+        Batcher metrics plus query cache size.
+        """
+        stats = self.batcher.stats() if self.batcher is not None else {}
+        with self._cache_lock:
+            stats["query_cache_size"] = len(self._query_cache)
+        return stats
+
+    def close(self):
+        if self.batcher is not None:
+            self.batcher.close()
+
+
+def get_embedding_service() -> EmbeddingService:
+    """
+    Return the process-wide EmbeddingService, creating it on first use.
+    """
+    global _embedding_service
+    with _service_lock:
+        if _embedding_service is None:
+            _embedding_service = EmbeddingService()
+        return _embedding_service
@@ -0,0 +1,202 @@
+import asyncio
+import contextvars
+import json
+import os
+import uuid
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import List, Tuple
+from services import metrics
+from services.ollama_api import OLLAMA_MAX_PARALLEL
+
+# Finished batches kept for /batches/{id} lookups
+MAX_FINISHED_BATCHES = 1000
+# Batch status is also written here, so that any worker process can answer /batches/{id}
+GENERATION_BATCHES_DIR = os.getenv("GENERATION_BATCHES_DIR", "./generation_batches")
+
+
+class GenerationQueue:
+    """
+    Background practice-question and flashcard generation for many subjects at once.
+    Jobs from every submitted batch share max_parallel workers, one per Ollama slot.
+    Workers take jobs round-robin across batches, so a large batch cannot starve
+    a small one submitted after it. Generated flashcards are saved through FlashcardStorage.
+    Batch status is mirrored to one JSON file per batch in batches_dir, so a batch can be
+    looked up from any process sharing the directory, not only the one running it.
+    """
+
+    def __init__(self, question_generator, flashcard_generator, flashcard_storage, max_parallel: int = OLLAMA_MAX_PARALLEL,
+                 batches_dir: str = GENERATION_BATCHES_DIR):
+        self.question_generator = question_generator
+        self.flashcard_generator = flashcard_generator
+        self.flashcard_storage = flashcard_storage
+        self.max_parallel = max_parallel
+        self.batches_dir = batches_dir
+        os.makedirs(batches_dir, exist_ok=True)
+        self._batches = OrderedDict()
+        # Batch id -> indices of its jobs not yet started, in submission order
+        self._pending = OrderedDict()
+        self._ready = None
+        self._workers = []
+
+    def submit(self, kind: str, jobs: List[Tuple[str, int]]) -> dict:
+        """
+        Queue generation jobs. kind is "practice" or "flashcards"; jobs is a list of
+        (subject, count). Must be called from the event loop. Returns the new batch's status.
+        """
+        if kind not in ("practice", "flashcards"):
+            raise ValueError(f"Unknown generation kind: {kind}")
+        batch_id = str(uuid.uuid4())
+        self._batches[batch_id] = {
+            "id": batch_id,
+            "kind": kind,
+            "status": "queued",
+            "created_at": datetime.utcnow().isoformat(),
+            "finished_at": None,
+            "jobs": [
+                {"subject": subject, "count": count, "status": "queued", "result": None, "error": None}
+                for subject, count in jobs
+            ]
+        }
+        self._save_batch(self._batches[batch_id])
+        self._trim_batches()
+        if jobs:
+            self._pending[batch_id] = deque(range(len(jobs)))
+            self._start_workers()
+            self._ready.set()
+        else:
+            self._finish(self._batches[batch_id])
+        return self.get_batch(batch_id)
+
+    def get_batch(self, batch_id: str):
+        """
+        Return a snapshot of a batch's status, or None if it is unknown.
+        Batches submitted to other processes are read from batches_dir.
+        """
+        batch = self._batches.get(batch_id)
+        if batch is not None:
+            return {**batch, "jobs": [dict(job) for job in batch["jobs"]]}
+        try:
+            # Batch ids are UUIDs; anything else must not become a path
+            uuid.UUID(batch_id)
+            with open(self._batch_path(batch_id), encoding="utf-8") as f:
+                return json.load(f)
+        except (ValueError, OSError):
+            return None
+
+    def _batch_path(self, batch_id: str) -> str:
+        return os.path.join(self.batches_dir, f"{batch_id}.json")
+
+    def _save_batch(self, batch: dict):
+        """
+        Write a batch's status to batches_dir.
+        """
+        path = self._batch_path(batch["id"])
+        try:
+            with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+                json.dump(batch, f)
+            os.replace(f"{path}.tmp", path)
+        except OSError:
+            # The in-memory status is still served by this process
+            pass
+
+    def pending(self) -> int:
+        """
+        Number of jobs waiting for a worker.
+        """
+        return sum(len(indices) for indices in self._pending.values())
+
+    async def shutdown(self):
+        """
+        Cancel running workers; queued jobs are dropped.
+        """
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def _start_workers(self):
+        if self._workers:
+            return
+        self._ready = asyncio.Event()
+        # A fresh context each, so workers don't keep the labels of the request that started them
+        self._workers = [
+            asyncio.create_task(self._work(), context=contextvars.Context()) for _ in range(self.max_parallel)
+        ]
+
+    def _next_job(self):
+        """
+        Pop the next job from the batch at the front of the rotation, then move that batch to the back.
+        """
+        if not self._pending:
+            return None
+        batch_id, indices = next(iter(self._pending.items()))
+        index = indices.popleft()
+        if indices:
+            self._pending.move_to_end(batch_id)
+        else:
+            del self._pending[batch_id]
+        return batch_id, index
+
+    async def _work(self):
+        while True:
+            item = self._next_job()
+            if item is None:
+                self._ready.clear()
+                await self._ready.wait()
+                continue
+            await self._run_job(*item)
+
+    async def _run_job(self, batch_id: str, index: int):
+        batch = self._batches.get(batch_id)
+        if batch is None:
+            return
+        job = batch["jobs"][index]
+        with metrics.labels(f"batch:{batch['kind']}", job["subject"]):
+            self._set_job(batch, index, status="processing")
+            try:
+                if batch["kind"] == "practice":
+                    result = await self.question_generator.generate_questions_async(job["subject"], job["count"])
+                else:
+                    result = await self.flashcard_generator.generate_flashcards_async(job["subject"], job["count"])
+                if not result:
+                    raise ValueError(f"No notes found for {job['subject']}")
+                if isinstance(result[0], dict) and result[0].get("error"):
+                    raise ValueError(result[0]["error"])
+                if batch["kind"] == "flashcards":
+                    result = await asyncio.to_thread(self.flashcard_storage.save_flashcards, job["subject"], result)
+                self._set_job(batch, index, status="completed", result=result)
+            except asyncio.CancelledError:
+                self._set_job(batch, index, status="failed", error="Cancelled")
+                raise
+            except Exception as e:
+                self._set_job(batch, index, status="failed", error=str(e))
+
+    def _set_job(self, batch: dict, index: int, **fields):
+        batch["jobs"][index].update(fields)
+        statuses = [job["status"] for job in batch["jobs"]]
+        if all(status in ("completed", "failed") for status in statuses):
+            self._finish(batch)
+        else:
+            batch["status"] = "processing"
+            self._save_batch(batch)
+
+    def _finish(self, batch: dict):
+        statuses = [job["status"] for job in batch["jobs"]]
+        if statuses and all(status == "failed" for status in statuses):
+            batch["status"] = "failed"
+        elif "failed" in statuses:
+            batch["status"] = "completed_with_errors"
+        else:
+            batch["status"] = "completed"
+        batch["finished_at"] = datetime.utcnow().isoformat()
+        self._save_batch(batch)
+
+    def _trim_batches(self):
+        finished = [batch_id for batch_id, batch in self._batches.items() if batch["finished_at"] is not None]
+        for batch_id in finished[:max(len(finished) - MAX_FINISHED_BATCHES, 0)]:
+            del self._batches[batch_id]
+            try:
+                os.remove(self._batch_path(batch_id))
+            except OSError:
+                pass
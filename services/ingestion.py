@@ -0,0 +1,244 @@
+import json
+import multiprocessing
+import os
+import queue
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from typing import List, Tuple
+from services.text_extract import extract_text_from_file, iter_text_blocks, iter_pdf_pages_parallel
+
+# Extraction processes; PDF/DOCX parsing is CPU-bound so this scales with cores
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", str(os.cpu_count() or 2)))
+# Maximum number of extracted files whose passages are embedded in one batch
+INGEST_BATCH_FILES = int(os.getenv("INGEST_BATCH_FILES", "16"))
+# Files larger than this are streamed page by page instead of being extracted whole
+STREAM_INGEST_BYTES = int(os.getenv("STREAM_INGEST_BYTES", str(8 * 1024 * 1024)))
+# Finished jobs kept for /jobs/{id} lookups
+MAX_FINISHED_JOBS = 1000
+# Job status is also written here, so that any worker process can answer /jobs/{id}
+INGEST_JOBS_DIR = os.getenv("INGEST_JOBS_DIR", "./ingest_jobs")
+
+
+class IngestionQueue:
+    """
+    Background note ingestion. Text is extracted in a process pool, then a single
+    writer thread embeds the passages of every file extracted so far in one batch
+    and stores them through NotesStorage. Large files skip the batch path: their
+    pages are extracted in parallel and embedded as they arrive, bounding memory.
+    Job status is mirrored to one JSON file per job in jobs_dir, so a job can be looked
+    up from any process sharing the directory, not only the one running it.
+    """
+
+    def __init__(self, storage, max_workers: int = INGEST_WORKERS, batch_files: int = INGEST_BATCH_FILES,
+                 jobs_dir: str = INGEST_JOBS_DIR):
+        self.storage = storage
+        self.batch_files = batch_files
+        self.max_workers = max_workers
+        self.jobs_dir = jobs_dir
+        os.makedirs(jobs_dir, exist_ok=True)
+        self._extractors = self._create_pool()
+        self._extracted = queue.Queue()
+        self._streamer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ingestion-streamer")
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._writer = threading.Thread(target=self._write_loop, name="ingestion-writer", daemon=True)
+        self._writer.start()
+
+    def _create_pool(self):
+        # Spawned workers only import the extractors, not torch or chromadb
+        return ProcessPoolExecutor(max_workers=self.max_workers, mp_context=multiprocessing.get_context("spawn"))
+
+    def _extract(self, path: str):
+        try:
+            return self._extractors.submit(extract_text_from_file, path)
+        except BrokenProcessPool:
+            # A crashed worker (e.g. a malformed PDF) breaks the whole pool; start a fresh one
+            self._extractors = self._create_pool()
+            return self._extractors.submit(extract_text_from_file, path)
+
+    def submit(self, subject: str, files: List[Tuple[str, str]], replace: bool = False) -> dict:
+        """
+        Queue files for ingestion. files is a list of (file_name, temp_path); temp files
+        are deleted once processed. With replace, each file replaces the notes already stored
+        under its name (reported per file as replaced_note_ids). Returns the new job's status.
+        """
+        job_id = str(uuid.uuid4())
+        job = {
+            "id": job_id,
+            "subject": subject,
+            "replace": replace,
+            "status": "queued",
+            "created_at": datetime.utcnow().isoformat(),
+            "finished_at": None,
+            "files": [
+                {"file_name": file_name, "status": "queued", "note_id": None, "created_at": None, "replaced_note_ids": [], "error": None}
+                for file_name, _ in files
+            ]
+        }
+        with self._lock:
+            self._jobs[job_id] = job
+            self._save_job(job)
+            self._trim_jobs()
+        for index, (file_name, path) in enumerate(files):
+            if os.path.getsize(path) > STREAM_INGEST_BYTES:
+                self._streamer.submit(self._stream_file, job_id, index, subject, file_name, path, replace)
+                continue
+            future = self._extract(path)
+            future.add_done_callback(
+                lambda f, index=index, path=path: self._extracted.put((job_id, index, path, f))
+            )
+        return self.get_job(job_id)
+
+    def get_job(self, job_id: str):
+        """
+        Return a snapshot of a job's status, or None if it is unknown.
+        Jobs submitted to other processes are read from jobs_dir.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                return {**job, "files": [dict(entry) for entry in job["files"]]}
+        try:
+            # Job ids are UUIDs; anything else must not become a path
+            uuid.UUID(job_id)
+            with open(self._job_path(job_id), encoding="utf-8") as f:
+                return json.load(f)
+        except (ValueError, OSError):
+            return None
+
+    def _job_path(self, job_id: str) -> str:
+        return os.path.join(self.jobs_dir, f"{job_id}.json")
+
+    def _save_job(self, job: dict):
+        """
+        Write a job's status to jobs_dir. Callers must hold _lock.
+        """
+        path = self._job_path(job["id"])
+        try:
+            with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+                json.dump(job, f)
+            os.replace(f"{path}.tmp", path)
+        except OSError:
+            # The in-memory status is still served by this process
+            pass
+
+    def pending(self) -> int:
+        """
+        Number of extracted files waiting for the writer thread.
+        """
+        return self._extracted.qsize()
+
+    def shutdown(self):
+        """
+        Stop accepting work and wait for running extractions to finish.
+        """
+        self._streamer.shutdown(wait=True, cancel_futures=True)
+        self._extractors.shutdown(wait=True, cancel_futures=True)
+        self._extracted.put(None)
+        self._writer.join()
+
+    def _trim_jobs(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job["finished_at"] is not None]
+        for job_id in finished[:max(len(finished) - MAX_FINISHED_JOBS, 0)]:
+            del self._jobs[job_id]
+            try:
+                os.remove(self._job_path(job_id))
+            except OSError:
+                pass
+
+    def _set_file(self, job_id: str, index: int, **fields):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            job["files"][index].update(fields)
+            statuses = [entry["status"] for entry in job["files"]]
+            if all(status in ("completed", "failed") for status in statuses):
+                if all(status == "failed" for status in statuses):
+                    job["status"] = "failed"
+                elif "failed" in statuses:
+                    job["status"] = "completed_with_errors"
+                else:
+                    job["status"] = "completed"
+                job["finished_at"] = datetime.utcnow().isoformat()
+            else:
+                job["status"] = "processing"
+            self._save_job(job)
+
+    def _stream_file(self, job_id: str, index: int, subject: str, file_name: str, path: str, replace: bool):
+        try:
+            self._set_file(job_id, index, status="processing")
+            if path.lower().endswith(".pdf"):
+                blocks = iter_pdf_pages_parallel(path, self._extractors)
+            else:
+                blocks = iter_text_blocks(path)
+            note = self.storage.save_note_from_blocks(subject, file_name, blocks, replace)
+            self._set_file(job_id, index, status="completed", note_id=note["id"], created_at=note["created_at"].isoformat(),
+                           replaced_note_ids=note["replaced_note_ids"])
+        except Exception as e:
+            self._set_file(job_id, index, status="failed", error=str(e))
+        finally:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _write_loop(self):
+        while True:
+            item = self._extracted.get()
+            if item is None:
+                return
+            batch = [item]
+            # Drain whatever else has been extracted so it shares one embedding pass
+            while len(batch) < self.batch_files:
+                try:
+                    item = self._extracted.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._extracted.put(None)
+                    break
+                batch.append(item)
+            self._write_batch(batch)
+
+    def _write_batch(self, batch):
+        by_subject = {}
+        for job_id, index, path, future in batch:
+            try:
+                text = future.result()
+                if not text.strip():
+                    raise ValueError("No text could be extracted from the file")
+                with self._lock:
+                    job = self._jobs[job_id]
+                    subject, replace, file_name = job["subject"], job["replace"], job["files"][index]["file_name"]
+                by_subject.setdefault((subject, replace), []).append((job_id, index, file_name, text))
+                self._set_file(job_id, index, status="processing")
+            except Exception as e:
+                self._set_file(job_id, index, status="failed", error=str(e))
+            finally:
+                if os.path.exists(path):
+                    os.remove(path)
+
+        for (subject, replace), entries in by_subject.items():
+            self._save_entries(subject, replace, entries)
+
+    def _save_entries(self, subject: str, replace: bool, entries):
+        """
+        Save extracted files in one write. If that fails and the batch holds several files,
+        possibly from other jobs, each is retried alone so the error lands only on the file that caused it.
+        """
+        try:
+            notes = self.storage.save_notes_from_texts(subject, [(file_name, text) for _, _, file_name, text in entries], replace)
+        except Exception as e:
+            if len(entries) > 1:
+                for entry in entries:
+                    self._save_entries(subject, replace, [entry])
+                return
+            job_id, index, _, _ = entries[0]
+            self._set_file(job_id, index, status="failed", error=str(e))
+            return
+        for (job_id, index, _, _), note in zip(entries, notes):
+            self._set_file(job_id, index, status="completed", note_id=note.id, created_at=note.created_at.isoformat(),
+                           replaced_note_ids=note.replaced_note_ids)
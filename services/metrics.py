@@ -0,0 +1,253 @@
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, Tuple
+
+# Latency buckets in seconds, from sub-millisecond cache hits to multi-minute generations
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+TOKENS_PER_SECOND_BUCKETS = (1, 2, 5, 10, 15, 20, 30, 50, 75, 100, 200)
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+# Route and subject of the request being handled; a dict so that code running in
+# to_thread or streaming tasks (which copy the context) can fill in the subject
+_request_labels: ContextVar = ContextVar("request_labels", default=None)
+_metrics = []
+_registry_lock = threading.Lock()
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_labels(names: Iterable[str], values: Iterable[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        with _registry_lock:
+            _metrics.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self) -> str:
+        return f"# HELP {self.name} {self.help}\n# TYPE {self.name} {self.kind}\n" + "".join(self._samples())
+
+    def _samples(self):
+        return []
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, help, labelnames)
+        self._values = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for key, value in values.items():
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {value:g}\n"
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+        # Label values -> [per-bucket counts, sum, count]
+        self._values = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    def _samples(self):
+        with self._lock:
+            values = {key: (list(entry[0]), entry[1], entry[2]) for key, entry in self._values.items()}
+        for key, (counts, total, count) in values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, 'le="%g"' % bound)
+                yield f"{self.name}_bucket{labels} {cumulative}\n"
+            labels = _format_labels(self.labelnames, key, 'le="+Inf"')
+            yield f"{self.name}_bucket{labels} {count}\n"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, key)} {total:g}\n"
+            yield f"{self.name}_count{_format_labels(self.labelnames, key)} {count}\n"
+
+
+class CallbackMetric(_Metric):
+    """
+    A gauge or counter whose value is read from fn when metrics are rendered,
+    for state that is already tracked elsewhere (cache hit counts, queue depths).
+    """
+
+    def __init__(self, name: str, help: str, fn: Callable[[], float], kind: str = "gauge"):
+        super().__init__(name, help)
+        self.kind = kind
+        self.fn = fn
+
+    def _samples(self):
+        try:
+            value = self.fn()
+        except Exception:
+            return
+        yield f"{self.name} {value:g}\n"
+
+
+def render() -> str:
+    """
+    All metrics in the Prometheus text exposition format.
+    """
+    with _registry_lock:
+        metrics = list(_metrics)
+    return "".join(metric.render() for metric in metrics)
+
+
+REQUESTS = Counter("studysense_http_requests_total", "HTTP requests handled.", ("route", "method", "status"))
+REQUEST_SECONDS = Histogram(
+    "studysense_http_request_duration_seconds", "Time to handle an HTTP request, including streamed bodies.",
+    ("route", "method", "subject")
+)
+STAGE_SECONDS = Histogram(
+    "studysense_stage_duration_seconds",
+    "Time spent in one stage of a request (retrieval, embedding, llm_queue_wait, llm_ttft, llm_generation, ...).",
+    ("stage", "route", "subject")
+)
+LLM_TOKENS_PER_SECOND = Histogram(
+    "studysense_llm_tokens_per_second", "Ollama generation speed as reported by eval_count/eval_duration.",
+    ("route", "subject"), buckets=TOKENS_PER_SECOND_BUCKETS
+)
+LLM_ERRORS = Counter("studysense_llm_errors_total", "Ollama calls that returned an error.", ("route", "subject"))
+CACHE_LOOKUPS = Counter(
+    "studysense_response_cache_lookups_total", "Response cache lookups by result (hit, similar_hit, miss).",
+    ("route", "subject", "result")
+)
+EMBEDDING_BATCH_SIZE = Histogram(
+    "studysense_embedding_batch_size", "Texts encoded per embedding micro-batch.", buckets=BATCH_SIZE_BUCKETS
+)
+
+
+def current_labels() -> Dict[str, str]:
+    labels = _request_labels.get()
+    return {"route": labels["route"], "subject": labels["subject"]} if labels else {"route": "background", "subject": ""}
+
+
+def set_subject(subject: str) -> None:
+    """
+    Attach the subject to the current request's metrics. A no-op outside requests.
+    """
+    labels = _request_labels.get()
+    if labels is not None and not labels["subject"]:
+        labels["subject"] = subject.lower().replace(' ', '_')
+
+
+@contextmanager
+def labels(route: str, subject: str = ""):
+    """
+    Label everything measured in the enclosed block, for work done outside a request.
+    """
+    token = _request_labels.set({"route": route, "subject": subject.lower().replace(' ', '_')})
+    try:
+        yield
+    finally:
+        _request_labels.reset(token)
+
+
+def observe_stage(stage: str, seconds: float) -> None:
+    STAGE_SECONDS.observe(seconds, stage=stage, **current_labels())
+
+
+def observe_generation(result: dict) -> None:
+    """
+    Record tokens/sec from the timing fields of an Ollama /api/generate response.
+    """
+    eval_count, eval_duration = result.get("eval_count"), result.get("eval_duration")
+    if eval_count and eval_duration:
+        LLM_TOKENS_PER_SECOND.observe(eval_count / (eval_duration / 1e9), **current_labels())
+
+
+def count_llm_error() -> None:
+    LLM_ERRORS.inc(**current_labels())
+
+
+@contextmanager
+def span(stage: str):
+    """
+    Time the enclosed block as one stage of the current request.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - start)
+
+
+def _route_template(scope) -> str:
+    from starlette.routing import Match
+    app = scope.get("app")
+    for route in getattr(getattr(app, "router", None), "routes", []):
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return getattr(route, "path", "unmatched")
+    return "unmatched"
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware that labels everything measured during a request with its route template
+    (so /ask/stream and /notes/{subject} are one series each) and records request count and duration.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        labels = {"route": _route_template(scope), "subject": ""}
+        token = _request_labels.set(labels)
+        status = {"code": 500}
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            REQUESTS.inc(route=labels["route"], method=scope["method"], status=status["code"])
+            REQUEST_SECONDS.observe(elapsed, route=labels["route"], method=scope["method"], subject=labels["subject"])
+            _request_labels.reset(token)
@@ -1,52 +1,223 @@
+import asyncio
+import os
+import time
 import requests
 import json
+import httpx
+from services import metrics
 from requests.adapters import HTTPAdapter
 from requests.packages.urllib3.util.retry import Retry
 
-# Hardcoded Ollama endpoint and model
-OLLAMA_ENDPOINT = "http://localhost:11434"
-OLLAMA_MODEL = "mistral:latest"
+# Ollama endpoint and model, overridable from the environment
+OLLAMA_ENDPOINT = os.getenv("OLLAMA_ENDPOINT", "http://localhost:11434")
+OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "mistral:latest")
+# Match the Ollama server's OLLAMA_NUM_PARALLEL so extra requests wait here instead of in its queue
+OLLAMA_MAX_PARALLEL = int(os.getenv("OLLAMA_MAX_PARALLEL", "4"))
+# Seconds to wait for a full response (or, when streaming, for the next token)
+OLLAMA_TIMEOUT = float(os.getenv("OLLAMA_TIMEOUT", "120"))
 
-def query_ollama(prompt, temperature=0.7, max_tokens=500):
+_session = None
+_async_client = None
+
+
+class StreamError(str):
+    """
+    The "Error: ..." message AsyncOllamaClient.stream yields last when generation fails,
+    so consumers can tell it apart from answer text.
+    """
+
+
+def _build_payload(prompt, temperature, max_tokens, stream, model=OLLAMA_MODEL, keep_alive=None, format=None):
+    """
+    Build an /api/generate request body. Sampling settings belong under "options".
+    keep_alive (e.g. "30m") overrides how long Ollama keeps the model and its prompt cache loaded.
+    format is "json" or a JSON schema dict to constrain the output.
+    """
+    payload = {
+        "model": model,
+        "prompt": prompt,
+        "options": {
+            "temperature": temperature,
+            "num_predict": max_tokens
+        },
+        "stream": stream
+    }
+    if keep_alive is not None:
+        payload["keep_alive"] = keep_alive
+    if format is not None:
+        payload["format"] = format
+    return payload
+
+
+def _get_session():
+    """
+    Return the module-wide requests.Session so connections are pooled across calls.
+    """
+    global _session
+    if _session is None:
+        session = requests.Session()
+        retries = Retry(total=3, backoff_factor=1, status_forcelist=[429, 500, 502, 503, 504])
+        session.mount("http://", HTTPAdapter(max_retries=retries, pool_maxsize=OLLAMA_MAX_PARALLEL))
+        _session = session
+    return _session
+
+
+def query_ollama(prompt, temperature=0.7, max_tokens=500, format=None):
     """
     Send a prompt to the Ollama local API and return the response.
-    
+    Blocking; use AsyncOllamaClient from async code.
+
     Args:
         prompt (str): The input prompt for the model.
         temperature (float): Controls randomness (0.0–1.0). Default: 0.7.
         max_tokens (int): Maximum tokens in the response. Default: 500.
-    
+        format (str | dict): "json" or a JSON schema to constrain the output. Default: None.
+
     Returns:
         str: The generated text or an error message.
     """
+    start = time.perf_counter()
     try:
-        # Set up retry strategy
-        session = requests.Session()
-        retries = Retry(total=3, backoff_factor=1, status_forcelist=[429, 500, 502, 503, 504])
-        session.mount("http://", HTTPAdapter(max_retries=retries))
-        
-        # Prepare the payload
-        payload = {
-            "model": OLLAMA_MODEL,
-            "prompt": prompt,
-            "temperature": temperature,
-            "max_tokens": max_tokens,
-            "stream": False
-        }
-        
+        payload = _build_payload(prompt, temperature, max_tokens, stream=False, format=format)
+
         # Send POST request to Ollama API
-        response = session.post(f"{OLLAMA_ENDPOINT}/api/generate", json=payload, timeout=30)
+        response = _get_session().post(f"{OLLAMA_ENDPOINT}/api/generate", json=payload, timeout=OLLAMA_TIMEOUT)
         response.raise_for_status()
-        
+
         # Parse the response
         result = response.json()
+        metrics.observe_stage("llm_generation", time.perf_counter() - start)
+        metrics.observe_generation(result)
         return result.get("response", "No response text found")
-    
+
     except requests.exceptions.ConnectionError:
-        return "Error: Ollama server is not running or unreachable"
+        error = "Error: Ollama server is not running or unreachable"
     except requests.exceptions.Timeout:
-        return "Error: Request to Ollama timed out after 30 seconds"
+        error = f"Error: Request to Ollama timed out after {OLLAMA_TIMEOUT:g} seconds"
     except requests.exceptions.HTTPError as e:
-        return f"Error: HTTP error occurred: {str(e)}"
+        error = f"Error: HTTP error occurred: {str(e)}"
     except Exception as e:
-        return f"Error: An unexpected error occurred: {str(e)}"
\ No newline at end of file
+        error = f"Error: An unexpected error occurred: {str(e)}"
+    metrics.count_llm_error()
+    return error
+
+
+class AsyncOllamaClient:
+    """
+    Async Ollama client with a persistent connection pool and a cap on concurrent generations.
+    Errors are returned (or yielded, when streaming) as "Error: ..." strings like query_ollama.
+    """
+
+    def __init__(self, endpoint=OLLAMA_ENDPOINT, model=OLLAMA_MODEL, max_parallel=OLLAMA_MAX_PARALLEL, timeout=OLLAMA_TIMEOUT):
+        self.endpoint = endpoint
+        self.model = model
+        self.timeout = timeout
+        self._semaphore = asyncio.Semaphore(max_parallel)
+        transport = httpx.AsyncHTTPTransport(
+            retries=3,
+            limits=httpx.Limits(max_connections=max_parallel * 2, max_keepalive_connections=max_parallel)
+        )
+        self._client = httpx.AsyncClient(
+            base_url=endpoint,
+            transport=transport,
+            timeout=httpx.Timeout(timeout, connect=5.0)
+        )
+
+    async def generate(self, prompt, temperature=0.7, max_tokens=500, keep_alive=None, format=None) -> str:
+        """
+        Return the full completion for prompt once generation has finished.
+        """
+        payload = _build_payload(
+            prompt, temperature, max_tokens, stream=False, model=self.model, keep_alive=keep_alive, format=format
+        )
+        try:
+            queued_at = time.perf_counter()
+            async with self._semaphore:
+                start = time.perf_counter()
+                metrics.observe_stage("llm_queue_wait", start - queued_at)
+                response = await self._client.post("/api/generate", json=payload)
+            response.raise_for_status()
+            result = response.json()
+            metrics.observe_stage("llm_generation", time.perf_counter() - start)
+            metrics.observe_generation(result)
+            return result.get("response", "No response text found")
+        except httpx.ConnectError:
+            error = "Error: Ollama server is not running or unreachable"
+        except httpx.TimeoutException:
+            error = f"Error: Request to Ollama timed out after {self.timeout:g} seconds"
+        except httpx.HTTPStatusError as e:
+            error = f"Error: HTTP error occurred: {str(e)}"
+        except Exception as e:
+            error = f"Error: An unexpected error occurred: {str(e)}"
+        metrics.count_llm_error()
+        return error
+
+    async def stream(self, prompt, temperature=0.7, max_tokens=500, format=None):
+        """
+        Yield response tokens as Ollama produces them.
+        Closing the generator (e.g. when the HTTP client disconnects) closes the
+        connection, which makes Ollama stop generating. On failure the last item is a StreamError.
+        """
+        payload = _build_payload(prompt, temperature, max_tokens, stream=True, model=self.model, format=format)
+        queued_at = time.perf_counter()
+        async with self._semaphore:
+            start = time.perf_counter()
+            metrics.observe_stage("llm_queue_wait", start - queued_at)
+            first_token = True
+            error = None
+            try:
+                async with self._client.stream("POST", "/api/generate", json=payload) as response:
+                    response.raise_for_status()
+                    async for line in response.aiter_lines():
+                        if not line:
+                            continue
+                        chunk = json.loads(line)
+                        if chunk.get("error"):
+                            error = f"Error: {chunk['error']}"
+                            break
+                        if chunk.get("response"):
+                            if first_token:
+                                metrics.observe_stage("llm_ttft", time.perf_counter() - start)
+                                first_token = False
+                            yield chunk["response"]
+                        if chunk.get("done"):
+                            metrics.observe_stage("llm_generation", time.perf_counter() - start)
+                            metrics.observe_generation(chunk)
+                            return
+            except httpx.ConnectError:
+                error = "Error: Ollama server is not running or unreachable"
+            except httpx.TimeoutException:
+                error = f"Error: Ollama produced no output for {self.timeout:g} seconds"
+            except httpx.HTTPStatusError as e:
+                error = f"Error: HTTP error occurred: {str(e)}"
+            except Exception as e:
+                error = f"Error: An unexpected error occurred: {str(e)}"
+            if error is not None:
+                metrics.count_llm_error()
+                yield StreamError(error)
+
+    async def aclose(self):
+        """
+        Close pooled connections.
+        """
+        await self._client.aclose()
+
+
+def get_async_client() -> AsyncOllamaClient:
+    """
+    Return the process-wide AsyncOllamaClient, creating it on first use.
+    """
+    global _async_client
+    if _async_client is None:
+        _async_client = AsyncOllamaClient()
+    return _async_client
+
+
+async def close_async_client():
+    """
+    Close the process-wide AsyncOllamaClient if one was created.
+    """
+    global _async_client
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
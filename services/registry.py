@@ -0,0 +1,92 @@
+import os
+import threading
+
+# Defaults shared by every component in the process
+EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
+NOTES_DB_PATH = "./chroma_db"
+FLASHCARDS_DB_PATH = "./chroma_db_flashcards"
+# Vector store behind NotesStorage and FlashcardStorage: "chroma", or "local" for
+# data.vector_store.LocalVectorClient (memory-mapped float16/int8 vectors, kept under <db path>/local,
+# which one process at a time may open)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma")
+LOCAL_STORE_DIR = "local"
+
+_lock = threading.Lock()
+_embedding_models = {}
+_cross_encoders = {}
+_chroma_clients = {}
+_local_clients = {}
+
+
+def get_embedding_model(model_name: str = EMBEDDING_MODEL_NAME):
+    """
+    Return the process-wide SentenceTransformer for model_name, loading it on first use.
+    """
+    with _lock:
+        if model_name not in _embedding_models:
+            # Imported lazily so processes that never embed don't pay for torch
+            from sentence_transformers import SentenceTransformer
+            _embedding_models[model_name] = SentenceTransformer(model_name)
+        return _embedding_models[model_name]
+
+
+def set_embedding_model(model, model_name: str = EMBEDDING_MODEL_NAME) -> None:
+    """
+    Use an already constructed model (anything with a SentenceTransformer-style encode) for model_name.
+    """
+    with _lock:
+        _embedding_models[model_name] = model
+
+
+def get_cross_encoder(model_name: str):
+    """
+    Return the process-wide sentence-transformers CrossEncoder for model_name, loading it on first use.
+    """
+    with _lock:
+        if model_name not in _cross_encoders:
+            from sentence_transformers import CrossEncoder
+            _cross_encoders[model_name] = CrossEncoder(model_name)
+        return _cross_encoders[model_name]
+
+
+def get_chroma_client(db_path: str):
+    """
+    Return the process-wide Chroma PersistentClient for db_path, creating it on first use.
+    """
+    key = os.path.abspath(db_path)
+    with _lock:
+        if key not in _chroma_clients:
+            import chromadb
+            _chroma_clients[key] = chromadb.PersistentClient(path=db_path)
+        return _chroma_clients[key]
+
+
+def get_vector_client(db_path: str, backend: str = None):
+    """
+    Return the process-wide vector store client for db_path on the configured backend.
+    """
+    backend = backend or VECTOR_BACKEND
+    if backend == "chroma":
+        return get_chroma_client(db_path)
+    if backend != "local":
+        raise ValueError(f"Unknown vector backend: {backend}")
+    key = os.path.abspath(db_path)
+    with _lock:
+        if key not in _local_clients:
+            from data.vector_store import LocalVectorClient
+            _local_clients[key] = LocalVectorClient(os.path.join(db_path, LOCAL_STORE_DIR))
+        return _local_clients[key]
+
+
+def reset():
+    """
+    Drop every cached model and client. Intended for tests and worker shutdown.
+    Local stores are closed so that their locks are released.
+    """
+    with _lock:
+        _embedding_models.clear()
+        _cross_encoders.clear()
+        _chroma_clients.clear()
+        for client in _local_clients.values():
+            client.close()
+        _local_clients.clear()
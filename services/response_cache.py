@@ -0,0 +1,127 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+import numpy as np
+from services import metrics
+
+# Cache sizing, overridable from the environment
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "2048"))
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "86400"))
+# Cosine similarity above which a previously answered question counts as the same question; 0 disables
+RESPONSE_CACHE_SIMILARITY = float(os.getenv("RESPONSE_CACHE_SIMILARITY", "0"))
+
+_response_cache = None
+
+
+def fingerprint(text: str) -> str:
+    """
+    Short stable hash used for contexts and prompt templates in cache keys.
+    """
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+class ResponseCache:
+    """
+    In-memory LRU/TTL cache for LLM responses, with optional near-duplicate lookup by
+    question embedding. Entries are grouped by subject so note changes can invalidate them.
+    """
+
+    def __init__(self, max_entries=RESPONSE_CACHE_SIZE, ttl=RESPONSE_CACHE_TTL, similarity_threshold=RESPONSE_CACHE_SIMILARITY):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def make_key(self, subject: str, template: str, model: str, temperature: float, context: str, text: str) -> tuple:
+        """
+        Build the cache key for a generation. subject should already be normalized.
+        """
+        return (subject, template, model, temperature, fingerprint(context), " ".join(text.lower().split()))
+
+    def _expired(self, entry: dict) -> bool:
+        return time.monotonic() - entry["stored_at"] > self.ttl
+
+    def get(self, key: tuple):
+        """
+        Return the cached response for key, or None.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or self._expired(entry):
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                metrics.CACHE_LOOKUPS.inc(result="miss", **metrics.current_labels())
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            metrics.CACHE_LOOKUPS.inc(result="hit", **metrics.current_labels())
+            return entry["value"]
+
+    def find_similar(self, subject: str, template: str, model: str, temperature: float, embedding) -> Optional[object]:
+        """
+        Return the response to the most similar cached question in the same subject and
+        prompt scope, if its cosine similarity reaches the threshold. Disabled when the threshold is 0.
+        """
+        if not self.similarity_threshold or embedding is None:
+            return None
+        query = np.asarray(embedding, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        with self._lock:
+            candidates = [
+                (key, entry) for key, entry in self._entries.items()
+                if key[:4] == (subject, template, model, temperature)
+                and entry["embedding"] is not None and not self._expired(entry)
+            ]
+            if not candidates:
+                return None
+            similarities = np.stack([entry["embedding"] for _, entry in candidates]) @ query
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.similarity_threshold:
+                return None
+            key, entry = candidates[best]
+            self._entries.move_to_end(key)
+            self.hits += 1
+            metrics.CACHE_LOOKUPS.inc(result="similar_hit", **metrics.current_labels())
+            return entry["value"]
+
+    def set(self, key: tuple, value, embedding=None) -> None:
+        """
+        Store a response, evicting the least recently used entries beyond max_entries.
+        """
+        if embedding is not None:
+            embedding = np.asarray(embedding, dtype=np.float32)
+            embedding = embedding / (np.linalg.norm(embedding) or 1.0)
+        with self._lock:
+            self._entries[key] = {"value": value, "embedding": embedding, "stored_at": time.monotonic()}
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate_subject(self, subject: str) -> None:
+        """
+        Drop every entry for a normalized subject name.
+        """
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == subject]:
+                del self._entries[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+def get_response_cache() -> ResponseCache:
+    """
+    Return the process-wide ResponseCache, creating it on first use.
+    """
+    global _response_cache
+    if _response_cache is None:
+        _response_cache = ResponseCache()
+    return _response_cache
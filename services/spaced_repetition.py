@@ -0,0 +1,71 @@
+import time
+from typing import Dict
+
+# Review outcomes, Anki-style, and the SM-2 response quality (0-5) each stands for
+RATINGS = {"again": 1, "hard": 3, "good": 4, "easy": 5}
+# SM-2 starting ease factor and the floor it never drops below
+DEFAULT_EASE = 2.5
+MIN_EASE = 1.3
+# Intervals in days after the first and second successful reviews
+FIRST_INTERVAL = 1.0
+SECOND_INTERVAL = 6.0
+# Interval multiplier for "easy" on top of the ease factor, and for "hard" in place of it
+EASY_BONUS = 1.3
+HARD_FACTOR = 1.2
+# A forgotten card comes back in the same study session rather than tomorrow
+RELEARN_DELAY_SECONDS = 10 * 60
+SECONDS_PER_DAY = 86400
+
+# Review fields stored alongside each flashcard
+REVIEW_FIELDS = ("due_at", "interval_days", "ease", "repetitions", "lapses", "last_reviewed_at")
+
+
+def new_card_state(now: float = None) -> Dict:
+    """
+    Review state for a card that has never been reviewed: due immediately.
+    """
+    return {
+        "due_at": time.time() if now is None else now,
+        "interval_days": 0.0,
+        "ease": DEFAULT_EASE,
+        "repetitions": 0,
+        "lapses": 0,
+        "last_reviewed_at": 0.0
+    }
+
+
+def schedule(state: Dict, rating: str, now: float = None) -> Dict:
+    """
+    Apply one review to a card's state with the SM-2 algorithm and return the new state.
+    Timestamps are Unix seconds so that they can be compared and indexed numerically.
+    """
+    if rating not in RATINGS:
+        raise ValueError(f"Unknown rating {rating!r}; expected one of {', '.join(RATINGS)}")
+    now = time.time() if now is None else now
+    quality = RATINGS[rating]
+    state = {**new_card_state(now), **{key: state[key] for key in REVIEW_FIELDS if key in state}}
+
+    ease = state["ease"] + 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02)
+    state["ease"] = max(MIN_EASE, round(ease, 4))
+    state["last_reviewed_at"] = now
+    if quality < 3:
+        state["repetitions"] = 0
+        state["lapses"] += 1
+        state["interval_days"] = 0.0
+        state["due_at"] = now + RELEARN_DELAY_SECONDS
+        return state
+
+    if state["repetitions"] == 0:
+        interval = FIRST_INTERVAL
+    elif state["repetitions"] == 1:
+        interval = SECOND_INTERVAL
+    elif rating == "hard":
+        interval = state["interval_days"] * HARD_FACTOR
+    else:
+        interval = state["interval_days"] * state["ease"]
+    if rating == "easy":
+        interval *= EASY_BONUS
+    state["repetitions"] += 1
+    state["interval_days"] = round(interval, 4)
+    state["due_at"] = now + interval * SECONDS_PER_DAY
+    return state
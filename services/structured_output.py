@@ -0,0 +1,181 @@
+import json
+import os
+import re
+from typing import Any, List, Optional
+from pydantic import BaseModel, Field, TypeAdapter, ValidationError
+from services.ollama_api import query_ollama, get_async_client
+
+# How generation is constrained: "schema" sends the JSON schema as Ollama's format,
+# "json" sends format "json" (for Ollama versions without schema support), "none" sends nothing
+OLLAMA_STRUCTURED_FORMAT = os.getenv("OLLAMA_STRUCTURED_FORMAT", "schema")
+# Tokens allowed for the single repair call
+REPAIR_MAX_TOKENS = 1000
+
+_FENCE = re.compile(r"```(?:json)?\s*(.*?)(?:```|$)", re.DOTALL | re.IGNORECASE)
+
+
+class PracticeQuestion(BaseModel):
+    question: str = Field(min_length=1)
+    type: str = "long-answer"
+
+
+class Flashcard(BaseModel):
+    question: str = Field(min_length=1)
+    answer: str = Field(min_length=1)
+
+
+class Evaluation(BaseModel):
+    score: int = Field(ge=0, le=100)
+    feedback: str
+
+
+PRACTICE_QUESTIONS = TypeAdapter(List[PracticeQuestion])
+FLASHCARDS = TypeAdapter(List[Flashcard])
+EVALUATION = TypeAdapter(Evaluation)
+
+
+class StructuredOutputError(ValueError):
+    """
+    Raised when model output cannot be turned into valid data for the requested schema.
+    """
+
+
+def response_format(schema: TypeAdapter):
+    """
+    The Ollama format argument for schema under OLLAMA_STRUCTURED_FORMAT.
+    """
+    if OLLAMA_STRUCTURED_FORMAT == "schema":
+        return schema.json_schema()
+    if OLLAMA_STRUCTURED_FORMAT == "json":
+        return "json"
+    return None
+
+
+def _salvage_array(text: str, start: int) -> list:
+    """
+    Decode the complete items of a JSON array that starts at text[start], ignoring a truncated tail.
+    """
+    decoder = json.JSONDecoder()
+    items = []
+    position = start + 1
+    while True:
+        while position < len(text) and text[position] in " \t\r\n,":
+            position += 1
+        if position >= len(text) or text[position] == "]":
+            return items
+        try:
+            item, position = decoder.raw_decode(text, position)
+        except json.JSONDecodeError:
+            return items
+        items.append(item)
+
+
+def salvage_json(text: str) -> Any:
+    """
+    Pull the first JSON value out of model output that may be wrapped in prose or
+    markdown fences, or cut off mid-array. Raises StructuredOutputError if there is none.
+    """
+    text = text.strip()
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        pass
+    fenced = _FENCE.search(text)
+    candidates = [fenced.group(1), text] if fenced else [text]
+    decoder = json.JSONDecoder()
+    for candidate in candidates:
+        for match in re.finditer(r"[\[{]", candidate):
+            try:
+                return decoder.raw_decode(candidate, match.start())[0]
+            except json.JSONDecodeError:
+                if match.group() == "[":
+                    items = _salvage_array(candidate, match.start())
+                    if items:
+                        return items
+    raise StructuredOutputError("No JSON found in model output")
+
+
+def parse_structured(text: str, schema: TypeAdapter) -> Any:
+    """
+    Salvage and validate model output against schema. Returns plain dicts/lists.
+    Raises StructuredOutputError on failure.
+    """
+    if text.startswith("Error:"):
+        raise StructuredOutputError(text)
+    value = salvage_json(text)
+    # JSON mode makes models wrap lists in an object such as {"flashcards": [...]}
+    is_list = schema.json_schema().get("type") == "array"
+    if is_list and isinstance(value, dict):
+        lists = [item for item in value.values() if isinstance(item, list)]
+        if len(lists) == 1:
+            value = lists[0]
+        else:
+            value = [value]
+    try:
+        return schema.dump_python(schema.validate_python(value))
+    except ValidationError as e:
+        raise StructuredOutputError(f"Output does not match the expected format: {e}")
+
+
+def _build_repair_prompt(response: str, schema: TypeAdapter, error: str) -> str:
+    return f"""The following output was supposed to be JSON matching this JSON schema:
+{json.dumps(schema.json_schema())}
+
+Output:
+{response}
+
+Problem: {error}
+
+Return only the corrected JSON, with no explanation or markdown."""
+
+
+def query_structured(prompt: str, schema: TypeAdapter, temperature: float = 0.7, max_tokens: int = 500) -> Optional[Any]:
+    """
+    Generate output constrained to schema, with at most one repair call if it does not validate.
+    Returns the validated data, or None if Ollama failed or the repair did not help.
+    """
+    response = query_ollama(prompt, temperature=temperature, max_tokens=max_tokens, format=response_format(schema))
+    try:
+        return parse_structured(response, schema)
+    except StructuredOutputError as e:
+        if response.startswith("Error:"):
+            return None
+        error = str(e)
+    repaired = query_ollama(
+        _build_repair_prompt(response, schema, error), temperature=0, max_tokens=REPAIR_MAX_TOKENS,
+        format=response_format(schema)
+    )
+    try:
+        return parse_structured(repaired, schema)
+    except StructuredOutputError:
+        return None
+
+
+async def repair_structured(response: str, schema: TypeAdapter, error: str) -> Optional[Any]:
+    """
+    Ask the model once to fix output that failed validation. Returns the validated data or None.
+    """
+    if response.startswith("Error:"):
+        return None
+    repaired = await get_async_client().generate(
+        _build_repair_prompt(response, schema, error), temperature=0, max_tokens=REPAIR_MAX_TOKENS,
+        format=response_format(schema)
+    )
+    try:
+        return parse_structured(repaired, schema)
+    except StructuredOutputError:
+        return None
+
+
+async def generate_structured(prompt: str, schema: TypeAdapter, temperature: float = 0.7, max_tokens: int = 500,
+                              keep_alive=None) -> Optional[Any]:
+    """
+    Non-blocking variant of query_structured for use inside the event loop.
+    """
+    response = await get_async_client().generate(
+        prompt, temperature=temperature, max_tokens=max_tokens, keep_alive=keep_alive, format=response_format(schema)
+    )
+    try:
+        return parse_structured(response, schema)
+    except StructuredOutputError as e:
+        return await repair_structured(response, schema, str(e))
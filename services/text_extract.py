@@ -1,26 +1,112 @@
 from PyPDF2 import PdfReader
 from docx import Document
+import codecs
+from collections import deque
+import mmap
 import os
+from typing import BinaryIO, Iterator, List, Union
 
-def extract_text_from_file(file_path: str) -> str:
+# Bytes read per block from plain-text files
+TEXT_BLOCK_SIZE = 64 * 1024
+# Pages handed to one worker process when a PDF is extracted in parallel
+PDF_PAGES_PER_TASK = 25
+
+
+def _open_pdf(source: Union[str, BinaryIO]) -> PdfReader:
     """
-    Extract text from TXT, DOCX, or PDF files.
+    Open a PDF from a path (memory-mapped, so pages are paged in by the OS on demand) or a binary stream.
+    """
+    if isinstance(source, str):
+        with open(source, 'rb') as f:
+            # The mapping stays valid after the file object is closed
+            return PdfReader(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+    return PdfReader(source)
+
+
+def iter_text_blocks(source: Union[str, BinaryIO], ext: str = None) -> Iterator[str]:
+    """
+    Yield the text of a TXT, DOCX or PDF file block by block (pages for PDF,
+    paragraphs for DOCX, fixed-size reads for TXT) without building the whole string.
+    source is a file path or a readable binary stream such as an upload; pass ext for streams.
+    Joining the blocks with '' gives the full text.
     """
+    if ext is None:
+        ext = os.path.splitext(source if isinstance(source, str) else getattr(source, 'name', ''))[1]
+    ext = ext.lower()
     try:
-        ext = os.path.splitext(file_path)[1].lower()
         if ext == '.txt':
-            with open(file_path, 'r', encoding='utf-8') as f:
-                return f.read()
+            stream = open(source, 'rb') if isinstance(source, str) else source
+            try:
+                decoder = codecs.getincrementaldecoder('utf-8')()
+                while block := stream.read(TEXT_BLOCK_SIZE):
+                    text = decoder.decode(block)
+                    if text:
+                        yield text
+                tail = decoder.decode(b'', final=True)
+                if tail:
+                    yield tail
+            finally:
+                if isinstance(source, str):
+                    stream.close()
         elif ext == '.docx':
-            doc = Document(file_path)
-            return '\n'.join([para.text for para in doc.paragraphs])
+            doc = Document(source)
+            for i, para in enumerate(doc.paragraphs):
+                yield para.text if i == 0 else '\n' + para.text
         elif ext == '.pdf':
-            reader = PdfReader(file_path)
-            text = ''
+            reader = _open_pdf(source)
             for page in reader.pages:
-                text += page.extract_text() or ''
-            return text
+                yield (page.extract_text() or '') + '\n'
         else:
             raise ValueError(f"Unsupported file extension: {ext}")
     except Exception as e:
-        raise Exception(f"Failed to extract text from {file_path}: {str(e)}")
\ No newline at end of file
+        raise Exception(f"Failed to extract text from {source if isinstance(source, str) else 'upload'}: {str(e)}")
+
+
+def extract_text_from_file(file_path: str) -> str:
+    """
+    Extract text from TXT, DOCX, or PDF files.
+    """
+    return ''.join(iter_text_blocks(file_path))
+
+
+def count_pdf_pages(file_path: str) -> int:
+    """
+    Return the number of pages in a PDF without extracting any text.
+    """
+    return len(_open_pdf(file_path).pages)
+
+
+def extract_pdf_pages(file_path: str, start: int, end: int) -> List[str]:
+    """
+    Extract pages [start, end) of a PDF. Top-level so it can run in a worker process.
+    """
+    try:
+        reader = _open_pdf(file_path)
+        return [(reader.pages[i].extract_text() or '') + '\n' for i in range(start, min(end, len(reader.pages)))]
+    except Exception as e:
+        raise Exception(f"Failed to extract pages {start}-{end} from {file_path}: {str(e)}")
+
+
+def iter_pdf_pages_parallel(file_path: str, executor, pages_per_task: int = PDF_PAGES_PER_TASK, max_pending: int = None) -> Iterator[str]:
+    """
+    Yield a PDF's page texts in order while page ranges are extracted concurrently on executor
+    (typically a ProcessPoolExecutor shared with other ingestion work). At most max_pending
+    ranges are in flight, which bounds how much extracted text waits in memory.
+    """
+    num_pages = count_pdf_pages(file_path)
+    max_pending = max_pending or os.cpu_count() or 2
+    starts = iter(range(0, num_pages, pages_per_task))
+    pending = deque()
+    try:
+        while True:
+            while len(pending) < max_pending:
+                start = next(starts, None)
+                if start is None:
+                    break
+                pending.append(executor.submit(extract_pdf_pages, file_path, start, start + pages_per_task))
+            if not pending:
+                return
+            yield from pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
@@ -1,6 +1,7 @@
 import requests
 import os
 import json
+import time
 
 # FastAPI endpoint
 BASE_URL = "http://localhost:8001"
@@ -20,6 +21,15 @@ with open(file_path, "rb") as f:
     )
 print("Upload Response:", response.json())
 
+# Ingestion runs in the background; wait for the job to finish before querying the notes
+job_id = response.json()["id"]
+while True:
+    job = requests.get(f"{BASE_URL}/jobs/{job_id}").json()
+    if job["finished_at"] is not None:
+        break
+    time.sleep(0.5)
+print("Ingestion Job:", job)
+
 # Test get subjects
 response = requests.get(f"{BASE_URL}/subjects")
 print("Subjects:", response.json())
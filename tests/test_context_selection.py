@@ -0,0 +1,49 @@
+import random
+import numpy as np
+from utils.context_selection import RRF_K, reciprocal_rank_fusion, select_diverse_passages
+from utils.text_preprocessing import estimate_tokens
+
+
+def passages(count, seed=0):
+    rng = np.random.default_rng(seed)
+    documents = ["word " * int(rng.integers(10, 400)) for _ in range(count)]
+    return documents, rng.normal(size=(count, 16)).astype(np.float32)
+
+
+def test_selection_fits_budget():
+    documents, embeddings = passages(500)
+    for rng in (None, random.Random(1)):
+        indices = select_diverse_passages(documents, embeddings, 1000, rng=rng)
+        assert indices == sorted(set(indices))
+        assert sum(estimate_tokens(documents[i]) for i in indices) <= 1000
+        # Nothing left out would still have fit
+        spare = 1000 - sum(estimate_tokens(documents[i]) for i in indices)
+        assert all(estimate_tokens(documents[i]) > spare for i in set(range(500)) - set(indices))
+
+
+def test_selection_skips_redundant_passages():
+    documents = ["alpha " * 50] * 3 + ["beta " * 50]
+    embeddings = [[1.0, 0.0], [1.0, 0.0], [1.0, 0.0], [0.0, 1.0]]
+    budget = 2 * estimate_tokens(documents[0])
+    indices = select_diverse_passages(documents, embeddings, budget, mmr_lambda=0.3)
+    assert 3 in indices and len(indices) == 2
+
+
+def test_selection_with_nothing_affordable():
+    documents, embeddings = passages(10)
+    assert select_diverse_passages(documents, embeddings, 1) == []
+    assert select_diverse_passages([], [], 1000) == []
+
+
+def test_reciprocal_rank_fusion():
+    # b is second in both rankings, which beats being first in one only
+    assert reciprocal_rank_fusion([["a", "b", "c"], ["d", "b", "e"]])[0] == "b"
+    assert reciprocal_rank_fusion([["a", "b"], []]) == ["a", "b"]
+    assert reciprocal_rank_fusion([]) == []
+
+
+def test_reciprocal_rank_fusion_scores():
+    fused = reciprocal_rank_fusion([["x", "y"], ["y", "x"], ["x"]], k=RRF_K)
+    assert fused == ["x", "y"]
+    # With a small k, top ranks dominate
+    assert reciprocal_rank_fusion([["a", "b", "c"], ["c", "b", "a"], ["a"]], k=0)[0] == "a"
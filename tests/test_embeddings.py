@@ -0,0 +1,85 @@
+import threading
+import time
+import pytest
+from services.embeddings import EmbeddingBatcher
+
+
+class StubEncoder:
+    """
+    Encodes each text as [its number], recording the size of every batch.
+    """
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.batches = []
+
+    def __call__(self, texts):
+        self.batches.append(len(texts))
+        time.sleep(self.delay)
+        return [[float(text.split("-")[1])] for text in texts]
+
+
+def texts(prefix, count, start=0):
+    return [f"{prefix}-{i}" for i in range(start, start + count)]
+
+
+def test_concurrent_callers_get_their_own_slices():
+    encoder = StubEncoder(delay=0.001)
+    batcher = EmbeddingBatcher(encoder, window_ms=5, max_batch=16)
+    sizes = [1, 3, 16, 40, 100, 7]
+    results = {}
+
+    def call(n, size):
+        results[n] = batcher.encode(texts(f"c{n}", size, start=n * 1000))
+
+    threads = [threading.Thread(target=call, args=(n, size)) for n, size in enumerate(sizes)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    batcher.close()
+
+    for n, size in enumerate(sizes):
+        assert results[n] == [[float(n * 1000 + i)] for i in range(size)]
+    stats = batcher.stats()
+    assert max(encoder.batches) <= 16
+    assert stats["max_batch_size"] <= 16
+    assert stats["batched_texts"] == sum(sizes) == sum(encoder.batches)
+    assert stats["queue_depth"] == 0
+
+
+def test_small_request_does_not_wait_for_a_large_one():
+    encoder = StubEncoder(delay=0.01)
+    batcher = EmbeddingBatcher(encoder, window_ms=1, max_batch=8)
+    large = batcher.submit(texts("large", 400))
+    time.sleep(0.02)
+    small = batcher.submit(texts("small", 2))
+    assert small.result(timeout=5) == [[0.0], [1.0]]
+    # The large request was sliced, so the small one finished well before it
+    assert not large.done()
+    assert len(large.result(timeout=10)) == 400
+    batcher.close()
+
+
+def test_close_finishes_queued_requests():
+    encoder = StubEncoder(delay=0.005)
+    batcher = EmbeddingBatcher(encoder, window_ms=1, max_batch=4)
+    futures = [batcher.submit(texts(f"r{n}", 10)) for n in range(3)]
+    batcher.close()
+    assert all(future.done() and len(future.result()) == 10 for future in futures)
+    # The batcher starts again on the next request
+    assert batcher.encode(["again-5"]) == [[5.0]]
+    batcher.close()
+
+
+def test_errors_reach_every_caller_in_the_batch():
+    def failing(texts):
+        raise RuntimeError("model crashed")
+
+    batcher = EmbeddingBatcher(failing, window_ms=20, max_batch=8)
+    futures = [batcher.submit(texts("x", 20)), batcher.submit(texts("y", 3))]
+    for future in futures:
+        with pytest.raises(RuntimeError, match="model crashed"):
+            future.result(timeout=5)
+    assert batcher.stats()["queue_depth"] == 0
+    batcher.close()
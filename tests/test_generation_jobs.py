@@ -0,0 +1,32 @@
+import asyncio
+from services.generation_jobs import GenerationQueue
+
+
+class QuestionGenerator:
+    async def generate_questions_async(self, subject, count):
+        await asyncio.sleep(0)
+        return [{"question": f"{subject} question {i}", "type": "long-answer"} for i in range(count)]
+
+
+def test_batch_status_is_served_from_any_process(tmp_path):
+    async def run():
+        queue = GenerationQueue(QuestionGenerator(), None, None, max_parallel=2, batches_dir=str(tmp_path))
+        # A second queue sharing the directory stands in for another worker process
+        other = GenerationQueue(QuestionGenerator(), None, None, batches_dir=str(tmp_path))
+        batch = queue.submit("practice", [("Biology", 2), ("Physics", 1)])
+        assert other.get_batch(batch["id"])["status"] == "queued"
+        while queue.get_batch(batch["id"])["finished_at"] is None:
+            await asyncio.sleep(0.01)
+        await queue.shutdown()
+        return queue.get_batch(batch["id"]), other.get_batch(batch["id"])
+
+    local, remote = asyncio.run(run())
+    assert remote == local
+    assert remote["status"] == "completed"
+    assert remote["jobs"][1]["result"] == [{"question": "Physics question 0", "type": "long-answer"}]
+
+
+def test_unknown_batch_ids(tmp_path):
+    queue = GenerationQueue(None, None, None, batches_dir=str(tmp_path))
+    assert queue.get_batch("00000000-0000-0000-0000-000000000000") is None
+    assert queue.get_batch("../../etc/passwd") is None
@@ -0,0 +1,55 @@
+from concurrent.futures import Future
+from datetime import datetime
+from backend.models import Note
+from services.ingestion import IngestionQueue
+
+
+class FailingStorage:
+    """
+    Saves notes, except that any write including a file named bad.txt fails.
+    """
+
+    def __init__(self):
+        self.writes = []
+
+    def save_notes_from_texts(self, subject, texts, replace=False):
+        self.writes.append([file_name for file_name, _ in texts])
+        if any(file_name == "bad.txt" for file_name, _ in texts):
+            raise Exception("embedding failed")
+        return [Note(id=f"note-{file_name}", subject=subject, content=text, created_at=datetime.utcnow(), file_name=file_name)
+                for file_name, text in texts]
+
+
+def extracted(queue, tmp_path, subject, file_names):
+    """
+    Register a job and return its files as the writer thread receives them after extraction.
+    """
+    job = queue.submit(subject, [])
+    entries = []
+    with queue._lock:
+        for index, file_name in enumerate(file_names):
+            queue._jobs[job["id"]]["files"].append({"file_name": file_name, "status": "queued", "note_id": None,
+                                                    "created_at": None, "replaced_note_ids": [], "error": None})
+            future = Future()
+            future.set_result(f"Text of {file_name}")
+            entries.append((job["id"], index, str(tmp_path / file_name), future))
+    return job["id"], entries
+
+
+def test_failed_write_only_fails_the_file_that_caused_it(tmp_path):
+    storage = FailingStorage()
+    queue = IngestionQueue(storage, max_workers=1, jobs_dir=str(tmp_path / "jobs"))
+    try:
+        first, first_entries = extracted(queue, tmp_path, "Biology", ["cells.txt", "bad.txt"])
+        second, second_entries = extracted(queue, tmp_path, "Biology", ["plants.txt"])
+        queue._write_batch(first_entries + second_entries)
+
+        assert storage.writes[0] == ["cells.txt", "bad.txt", "plants.txt"]
+        job = queue.get_job(first)
+        assert [entry["status"] for entry in job["files"]] == ["completed", "failed"]
+        assert job["files"][1]["error"] == "embedding failed"
+        assert job["status"] == "completed_with_errors"
+        assert queue.get_job(second)["status"] == "completed"
+        assert queue.get_job(second)["files"][0]["note_id"] == "note-plants.txt"
+    finally:
+        queue.shutdown()
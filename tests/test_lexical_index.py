@@ -0,0 +1,55 @@
+import time
+import pytest
+from data.lexical_index import LexicalIndex, tokenize
+
+
+@pytest.mark.parametrize("text, tokens", [
+    ("Use np.linalg.solve.", ["use", "np.linalg.solve"]),
+    ("Enrolled in CS-101, then CS-102!", ["enrolled", "in", "cs-101", "then", "cs-102"]),
+    ("snake_case and E=mc2", ["snake_case", "and", "e", "mc2"]),
+    ("Well-known... end-", ["well-known", "end"]),
+])
+def test_tokenize(text, tokens):
+    assert tokenize(text) == tokens
+
+
+def index_with(documents):
+    index = LexicalIndex()
+    index.build("biology", list(documents), list(documents.values()), version=len(documents))
+    return index
+
+
+def test_search_ranks_by_bm25():
+    index = index_with({
+        "a": "Solve the system with np.linalg.solve and check the residual.",
+        "b": "The cell membrane controls what enters the cell.",
+        "c": "np.linalg.solve np.linalg.solve np.linalg.solve",
+    })
+    assert [doc_id for doc_id, _ in index.search("biology", "np.linalg.solve")] == ["c", "a"]
+    assert index.search("biology", "membrane", limit=1)[0][0] == "b"
+    assert index.search("biology", "photosynthesis") == []
+    assert index.search("physics", "cell") == []
+
+
+def test_add_and_remove():
+    index = index_with({"a": "mitosis", "b": "meiosis"})
+    index.add("biology", ["c"], ["mitosis in plants"])
+    assert {doc_id for doc_id, _ in index.search("biology", "mitosis")} == {"a", "c"}
+    index.remove("biology", ["a"])
+    index.add("biology", ["c"], ["osmosis"])
+    assert index.search("biology", "mitosis") == []
+    # Adding to a subject that was never built is left to the build
+    index.add("physics", ["x"], ["force"])
+    assert not index.is_loaded("physics")
+
+
+def test_versions():
+    index = index_with({"a": "mitosis"})
+    assert index.is_current("biology", 1, max_age=60)
+    assert not index.is_current("biology", 2, max_age=60)
+    index.set_version("biology", 2)
+    assert index.is_current("biology", 2, max_age=60)
+    time.sleep(0.01)
+    assert not index.is_current("biology", 2, max_age=0.001)
+    index.invalidate("biology")
+    assert not index.is_current("biology", 2, max_age=60)
@@ -0,0 +1,101 @@
+import pytest
+from backend import memory
+from backend.memory import ConversationMemory
+from utils.text_preprocessing import estimate_tokens
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(memory, "time", clock)
+    return clock
+
+
+def test_new_session_recalls_nothing():
+    assert ConversationMemory().recall("s1", "biology", "What is ATP?") == ("", "")
+
+
+def test_recall_includes_previous_turn_and_question():
+    conversation = ConversationMemory()
+    conversation.add_turn("s1", "biology", "What is ATP?", "ATP stores energy for the cell.")
+    history, previous = conversation.recall("s1", "biology", "And why is that?")
+    assert previous == "What is ATP?"
+    assert history == "Student: What is ATP?\nYou: ATP stores energy for the cell."
+    assert conversation.recall("s1", "physics", "And why is that?") == ("", "")
+
+
+def test_older_turns_are_folded_into_a_capped_summary():
+    conversation = ConversationMemory(recent_turns=2, summary_tokens=30)
+    for number in range(6):
+        conversation.add_turn("s1", "biology", f"Question {number} about mitochondria?",
+                              f"Mitochondria answer {number}. More detail that is left out of the summary.")
+    session = conversation._sessions[("s1", "biology")]
+    assert [turn.question for turn in session.turns] == ["Question 4 about mitochondria?", "Question 5 about mitochondria?"]
+    lines = [line for line, _ in session.summary]
+    assert lines and lines[-1] == "- Asked \"Question 3 about mitochondria?\": Mitochondria answer 3."
+    assert session.summary_tokens == sum(estimate_tokens(line) for line in lines) <= 30
+    assert len(lines) < 4
+
+    history, _ = conversation.recall("s1", "biology", "Tell me about mitochondria")
+    assert history.startswith("Earlier in the conversation:\n- Asked")
+    assert "More detail" not in history.split("\n\n")[0]
+    assert history.endswith("Student: Question 5 about mitochondria?\nYou: Mitochondria answer 5. More detail that is left out of the summary.")
+
+
+def test_recall_keeps_to_token_budget():
+    conversation = ConversationMemory(token_budget=40)
+    conversation.add_turn("s1", "biology", "What do mitochondria do?", "Mitochondria make ATP. " * 20)
+    conversation.add_turn("s1", "biology", "What is ATP?", "ATP stores energy. " * 20)
+    history, _ = conversation.recall("s1", "biology", "How do mitochondria make ATP?")
+    assert estimate_tokens(history) <= 40
+    assert "mitochondria do" not in history
+
+
+def test_unrelated_older_turns_are_left_out():
+    conversation = ConversationMemory()
+    conversation.add_turn("s1", "biology", "What is photosynthesis?", "Plants turn light into sugar.")
+    conversation.add_turn("s1", "biology", "What is ATP?", "ATP stores energy.")
+    conversation.add_turn("s1", "biology", "What is osmosis?", "Water crossing a membrane.")
+    history, _ = conversation.recall("s1", "biology", "Where do plants make sugar?")
+    assert "photosynthesis" in history and "ATP" not in history and "osmosis" in history
+
+
+def test_idle_sessions_expire(clock):
+    conversation = ConversationMemory(idle_ttl=60)
+    conversation.add_turn("s1", "biology", "What is ATP?", "ATP stores energy.")
+    clock.now += 59
+    assert conversation.recall("s1", "biology", "Why?")[1] == "What is ATP?"
+    clock.now += 59
+    assert len(conversation) == 1
+    clock.now += 61
+    assert len(conversation) == 0
+    assert conversation.recall("s1", "biology", "Why?") == ("", "")
+
+
+def test_least_recently_used_sessions_are_evicted():
+    conversation = ConversationMemory(max_sessions=2)
+    conversation.add_turn("s1", "biology", "What is ATP?", "ATP stores energy.")
+    conversation.add_turn("s2", "biology", "What is DNA?", "DNA stores genes.")
+    conversation.recall("s1", "biology", "Why?")
+    conversation.add_turn("s3", "biology", "What is RNA?", "RNA carries genes.")
+    assert len(conversation) == 2
+    assert conversation.recall("s2", "biology", "Why?") == ("", "")
+    assert conversation.recall("s1", "biology", "Why?")[1] == "What is ATP?"
+
+
+def test_clear_forgets_session_in_every_subject():
+    conversation = ConversationMemory()
+    conversation.add_turn("s1", "biology", "What is ATP?", "ATP stores energy.")
+    conversation.add_turn("s1", "physics", "What is work?", "Force times distance.")
+    conversation.add_turn("s2", "biology", "What is DNA?", "DNA stores genes.")
+    assert conversation.clear("s1") == 2
+    assert conversation.clear("s1") == 0
+    assert len(conversation) == 1
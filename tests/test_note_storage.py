@@ -0,0 +1,322 @@
+import random
+import time
+import zipfile
+import pytest
+from benchmarks.run import HashingEmbedder
+from data import note_storage, subject_archive
+from data.due_index import DueIndex
+from data.flashcard_storage import FlashcardStorage
+from data.note_storage import NotesStorage
+from data.vector_store import LocalVectorClient
+from services.embeddings import EmbeddingService
+from services.registry import EMBEDDING_MODEL_NAME
+from utils.helpers import content_hash
+from test_text_preprocessing import sample_text
+
+
+@pytest.fixture
+def storage(tmp_path):
+    client = LocalVectorClient(str(tmp_path / "notes"))
+    storage = NotesStorage(db_path=str(tmp_path / "notes"), client=client,
+                           embeddings=EmbeddingService(model=HashingEmbedder(), batch_window_ms=0))
+    yield storage
+    client.close()
+
+
+def stored_hash(storage, subject, note_id):
+    results = storage._get_collection(subject).get(ids=[f"{note_id}:0"], include=["metadatas"])
+    return results["metadatas"][0]["content_hash"]
+
+
+@pytest.mark.parametrize("text", [
+    sample_text(3, paragraphs=60),
+    "\n\n  " + sample_text(4, paragraphs=30) + "\n\n",
+    "Café — naïve résumé. " * 400
+])
+@pytest.mark.parametrize("block_size", [97, 4096])
+def test_streamed_hash_matches_content_hash(storage, text, block_size):
+    blocks = [text[i:i + block_size] for i in range(0, len(text), block_size)]
+    saved = storage.save_note_from_blocks("Biology", "cells.txt", blocks)
+    assert stored_hash(storage, "Biology", saved["id"]) == content_hash(text)
+    assert storage.get_note_content("Biology", saved["id"], 0, len(text)) == text
+
+
+def test_streamed_note_is_found_as_duplicate(storage):
+    text = sample_text(5, paragraphs=60)
+    note = storage.save_notes_from_texts("Biology", [("cells.txt", text)])[0]
+    blocks = [text[i:i + 500] for i in range(0, len(text), 500)]
+    saved = storage.save_note_from_blocks("Biology", "copy.txt", blocks)
+    assert saved["id"] == note.id
+    assert len(storage.load_notes_by_subject("Biology")) == 1
+
+
+def test_sample_passages_reads_bounded_pool(storage, monkeypatch):
+    storage.save_notes_from_texts("Biology", [(f"note{i}.txt", sample_text(i, paragraphs=12)) for i in range(20)])
+    collection = storage._get_collection("Biology")
+    monkeypatch.setattr(note_storage, "SAMPLE_POOL_SIZE", 16)
+    monkeypatch.setattr(note_storage, "SAMPLE_WINDOWS", 4)
+    reads = []
+    get = collection.get
+    def get_recorded(**kwargs):
+        if "embeddings" in kwargs.get("include", []):
+            reads.append(kwargs.get("limit"))
+        return get(**kwargs)
+    monkeypatch.setattr(collection, "get", get_recorded)
+    assert collection.count() > 16
+
+    passages = storage.sample_passages("Biology", 2000, rng=random.Random(0))
+    assert passages and reads == [4, 4, 4, 4]
+    stored = set(get(include=["documents"])["documents"])
+    assert set(passages) <= stored
+
+
+class CountingEmbedder(HashingEmbedder):
+    def __init__(self):
+        super().__init__()
+        self.encoded = 0
+
+    def encode(self, texts, batch_size=32, **kwargs):
+        self.encoded += len(texts)
+        return super().encode(texts, batch_size, **kwargs)
+
+
+def test_streamed_duplicate_is_not_embedded_again(tmp_path):
+    client = LocalVectorClient(str(tmp_path / "notes"))
+    embedder = CountingEmbedder()
+    storage = NotesStorage(client=client, embeddings=EmbeddingService(model=embedder, batch_window_ms=0))
+    text = sample_text(6, paragraphs=60)
+    note = storage.save_notes_from_texts("Biology", [("cells.txt", text)])[0]
+    encoded = embedder.encoded
+    saved = storage.save_note_from_blocks("Biology", "copy.txt", [text[i:i + 700] for i in range(0, len(text), 700)])
+    assert saved["id"] == note.id
+    assert embedder.encoded == encoded
+    client.close()
+
+
+def test_streamed_passages_are_hidden_until_written(storage, monkeypatch):
+    monkeypatch.setattr(note_storage, "STREAM_FLUSH_CHUNKS", 4)
+    storage.save_notes_from_texts("Biology", [("cells.txt", "Osmosis moves water across a membrane.")])
+    storage.query_passages("Biology", "osmosis")
+    text = sample_text(7, paragraphs=40) + " Photosynthesis happens in chloroplasts."
+    seen = {}
+
+    def blocks():
+        yield text[:len(text) // 2]
+        # Passages of the first half are stored by now, but the note is unfinished
+        seen["passages"] = storage.query_passages("Biology", "photosynthesis chloroplasts section", n_results=50)
+        seen["notes"] = storage.list_notes("Biology")[0]
+        seen["count"] = storage._get_collection("Biology").count()
+        yield text[len(text) // 2:]
+
+    saved = storage.save_note_from_blocks("Biology", "plants.txt", blocks())
+    assert seen["count"] > 1
+    assert seen["passages"] == ["Osmosis moves water across a membrane."]
+    assert [note["file_name"] for note in seen["notes"]] == ["cells.txt"]
+    assert [note["id"] for note in storage.list_notes("Biology")[0]][-1] == saved["id"]
+    assert any("chloroplasts" in passage for passage in storage.query_passages("Biology", "chloroplasts"))
+
+
+def test_passages_without_pending_flag_are_upgraded(storage):
+    collection = storage._get_collection("Biology")
+    collection.add(ids=["old"], documents=["Mitochondria make ATP."], embeddings=storage.embeddings.encode(["Mitochondria make ATP."]),
+                   metadatas=[{"subject": "Biology", "created_at": "2024-01-01T00:00:00"}])
+    assert storage.query_passages("Biology", "mitochondria") == ["Mitochondria make ATP."]
+    assert [note["id"] for note in storage.list_notes("Biology")[0]] == ["old"]
+
+
+class LengthReranker:
+    """
+    Cross-encoder stand-in that prefers longer passages.
+    """
+
+    def __init__(self):
+        self.pairs = []
+
+    def predict(self, pairs):
+        self.pairs.extend(pairs)
+        return [len(passage) for _, passage in pairs]
+
+
+def test_query_passages_reranks_fused_candidates(tmp_path):
+    client = LocalVectorClient(str(tmp_path / "notes"))
+    reranker = LengthReranker()
+    storage = NotesStorage(client=client, embeddings=EmbeddingService(model=HashingEmbedder(), batch_window_ms=0), reranker=reranker)
+    texts = ["Osmosis.", "Osmosis moves water.", "Osmosis moves water across a semipermeable membrane.", "Gravity pulls."]
+    storage.save_notes_from_texts("Biology", [(f"note{i}.txt", text) for i, text in enumerate(texts)])
+    passages = storage.query_passages("Biology", "osmosis", n_results=3)
+    # Every candidate is scored, and the reranker's order wins over the fused one
+    assert sorted(passage for _, passage in reranker.pairs) == sorted(texts)
+    assert passages == sorted(texts, key=len, reverse=True)[:3]
+    assert all(query == "osmosis" for query, _ in reranker.pairs)
+    client.close()
+
+
+def test_lexical_index_follows_other_processes(tmp_path):
+    client = LocalVectorClient(str(tmp_path / "notes"))
+    embeddings = EmbeddingService(model=HashingEmbedder(), batch_window_ms=0)
+    # Two storages with their own BM25 index stand in for two worker processes
+    storage, other = NotesStorage(client=client, embeddings=embeddings), NotesStorage(client=client, embeddings=embeddings)
+    storage.save_notes_from_texts("Biology", [("cells.txt", "Mitochondria make ATP.")])
+    collection = storage._get_collection("Biology")
+    storage.query_passages("Biology", "mitochondria")
+    assert storage._lexical_search("Biology", collection, "ribosomes", 5, collection.count()) == []
+
+    other.save_notes_from_texts("Biology", [("proteins.txt", "Ribosomes build proteins.")])
+    ids = storage._lexical_search("Biology", collection, "ribosomes", 5, collection.count())
+    assert len(ids) == 1 and ids[0].endswith(":0")
+
+    # A replacement that keeps the row count is picked up once the index is older than the TTL
+    other.save_notes_from_texts("Biology", [("proteins.txt", "Golgi packages proteins.")], replace=True)
+    assert storage._lexical_search("Biology", collection, "golgi", 5, collection.count()) == []
+    storage.lexical_index._versions["biology"] = (collection.count(), time.monotonic() - note_storage.LEXICAL_INDEX_TTL - 1)
+    assert len(storage._lexical_search("Biology", collection, "golgi", 5, collection.count())) == 1
+    client.close()
+
+
+def list_all(storage, subject, limit):
+    notes, cursor = storage.list_notes(subject, limit)
+    pages = [notes]
+    while cursor:
+        notes, cursor = storage.list_notes(subject, limit, cursor)
+        pages.append(notes)
+    return pages
+
+
+def test_list_notes_pages(storage):
+    saved = [storage.save_notes_from_texts("Biology", [(f"note{i}.txt", f"Note number {i} about cells.")])[0] for i in range(7)]
+    pages = list_all(storage, "Biology", 3)
+    assert [len(page) for page in pages] == [3, 3, 1]
+    assert [note["id"] for page in pages for note in page] == [note.id for note in saved]
+    assert pages[0][0]["file_name"] == "note0.txt" and pages[0][0]["content_length"] == len("Note number 0 about cells.")
+
+
+def test_list_notes_between_pages(storage):
+    for i in range(4):
+        storage.save_notes_from_texts("Biology", [(f"note{i}.txt", f"Note number {i}.")])
+    first, cursor = storage.list_notes("Biology", 2)
+    # A replaced note moves to the end; a new note is listed after the rest
+    replaced = storage.save_notes_from_texts("Biology", [("note0.txt", "Note number 0, revised.")], replace=True)[0]
+    added = storage.save_notes_from_texts("Biology", [("note4.txt", "Note number 4.")])[0]
+    rest, cursor = storage.list_notes("Biology", 10, cursor)
+    assert cursor is None
+    assert [note["file_name"] for note in first] == ["note0.txt", "note1.txt"]
+    assert [note["id"] for note in rest][-2:] == [replaced.id, added.id]
+    assert [note["file_name"] for note in rest] == ["note2.txt", "note3.txt", "note0.txt", "note4.txt"]
+
+
+def test_list_notes_reads_one_page(storage, monkeypatch):
+    for i in range(30):
+        storage.save_notes_from_texts("Biology", [(f"note{i}.txt", f"Note number {i}.")])
+    notes, cursor = storage.list_notes("Biology", 5)
+    collection = storage._get_collection("Biology")
+    rows = []
+    get = collection.get
+
+    def get_recorded(**kwargs):
+        results = get(**kwargs)
+        rows.append(len(results["ids"]))
+        return results
+    monkeypatch.setattr(collection, "get", get_recorded)
+    notes, cursor = storage.list_notes("Biology", 5, cursor)
+    assert [note["file_name"] for note in notes] == [f"note{i}.txt" for i in range(5, 10)]
+    assert rows == [5]
+
+
+def test_list_notes_follows_other_processes(tmp_path):
+    client = LocalVectorClient(str(tmp_path / "notes"))
+    embeddings = EmbeddingService(model=HashingEmbedder(), batch_window_ms=0)
+    storage, other = NotesStorage(client=client, embeddings=embeddings), NotesStorage(client=client, embeddings=embeddings)
+    storage.save_notes_from_texts("Biology", [("cells.txt", "Cells.")])
+    assert len(storage.list_notes("Biology")[0]) == 1
+    other.save_notes_from_texts("Biology", [("plants.txt", "Plants.")])
+    assert [note["file_name"] for note in storage.list_notes("Biology")[0]] == ["cells.txt", "plants.txt"]
+    client.close()
+
+
+@pytest.fixture
+def storages(tmp_path):
+    """
+    Returns a function opening a NotesStorage and FlashcardStorage pair in their own directories.
+    """
+    clients = []
+
+    def open_storages(name, model_name=EMBEDDING_MODEL_NAME):
+        embeddings = EmbeddingService(model_name=model_name, model=HashingEmbedder(), batch_window_ms=0)
+        notes_client = LocalVectorClient(str(tmp_path / name / "notes"))
+        flashcards_client = LocalVectorClient(str(tmp_path / name / "flashcards"))
+        clients.extend([notes_client, flashcards_client])
+        return (NotesStorage(client=notes_client, embeddings=embeddings),
+                FlashcardStorage(client=flashcards_client, embeddings=embeddings, due_index=DueIndex()))
+
+    yield open_storages
+    for client in clients:
+        client.close()
+
+
+def subject_contents(notes, flashcards, subject):
+    return (sorted((note.file_name, note.content) for note in notes.load_notes_by_subject(subject)),
+            sorted((card["question"], card["answer"], card["due_at"]) for card in flashcards.get_flashcards(subject)))
+
+
+def fill_subject(notes, flashcards, subject="Biology"):
+    notes.save_notes_from_texts(subject, [("cells.txt", sample_text(8, paragraphs=20)), ("plants.txt", "Plants make sugar.")])
+    cards = flashcards.save_flashcards(subject, [{"question": "What is ATP?", "answer": "Energy"}, {"question": "Osmosis?", "answer": "Water"}])
+    flashcards.record_review(subject, cards[0]["id"], "good")
+
+
+def test_subject_archive_round_trip(storages, tmp_path):
+    notes, flashcards = storages("source")
+    fill_subject(notes, flashcards)
+    path = str(tmp_path / "biology.zip")
+    manifest = subject_archive.export_subject(notes, flashcards, "Biology", path)
+    passages = notes._get_collection("Biology").count()
+    assert (manifest["passages"], manifest["flashcards"]) == (passages, 2)
+
+    target_notes, target_flashcards = storages("target")
+    result = subject_archive.import_subject(target_notes, target_flashcards, path, "Cell Biology")
+    assert result == {"subject": "Cell Biology", "notes": 2, "passages": passages, "flashcards": 2}
+    assert subject_contents(target_notes, target_flashcards, "Cell Biology") == subject_contents(notes, flashcards, "Biology")
+    assert target_notes.query_passages("Cell Biology", "Plants sugar")[0] == "Plants make sugar."
+
+    # Importing again keeps the records already there
+    subject_archive.import_subject(target_notes, target_flashcards, path, "Cell Biology")
+    assert target_notes._get_collection("Cell Biology").count() == passages
+    assert len(target_flashcards.get_flashcards("Cell Biology")) == 2
+
+
+def test_subject_archive_rejects_other_models(storages, tmp_path):
+    notes, flashcards = storages("source")
+    fill_subject(notes, flashcards)
+    path = str(tmp_path / "biology.zip")
+    subject_archive.export_subject(notes, flashcards, "Biology", path)
+    other_notes, other_flashcards = storages("target", model_name="another-model")
+    with pytest.raises(ValueError, match=EMBEDDING_MODEL_NAME):
+        subject_archive.import_subject(other_notes, other_flashcards, path)
+    assert not other_notes.has_subject("Biology")
+
+
+def test_truncated_archive_leaves_subject_intact(storages, tmp_path):
+    notes, flashcards = storages("source")
+    fill_subject(notes, flashcards)
+    path = str(tmp_path / "biology.zip")
+    subject_archive.export_subject(notes, flashcards, "Biology", path)
+    before = subject_contents(notes, flashcards, "Biology")
+
+    # Cut the flashcard embeddings short inside an otherwise valid zip
+    truncated = str(tmp_path / "truncated.zip")
+    with zipfile.ZipFile(path) as source, zipfile.ZipFile(truncated, "w") as target:
+        for info in source.infolist():
+            data = source.read(info)
+            target.writestr(info, data[:-10] if info.filename == "flashcards.npy" else data)
+    with pytest.raises(ValueError):
+        subject_archive.import_subject(notes, flashcards, truncated, replace=True)
+    assert subject_contents(notes, flashcards, "Biology") == before
+
+    # A file cut off mid-zip is not an archive at all
+    with open(path, "rb") as f:
+        data = f.read()
+    with open(truncated, "wb") as f:
+        f.write(data[:len(data) // 2])
+    with pytest.raises((ValueError, zipfile.BadZipFile)):
+        subject_archive.import_subject(notes, flashcards, truncated, replace=True)
+    assert subject_contents(notes, flashcards, "Biology") == before
@@ -0,0 +1,52 @@
+import asyncio
+import json
+import httpx
+from services.ollama_api import AsyncOllamaClient, StreamError
+
+
+def collect(handler):
+    async def run():
+        client = AsyncOllamaClient(endpoint="http://ollama.test")
+        client._client = httpx.AsyncClient(base_url="http://ollama.test", transport=httpx.MockTransport(handler))
+        try:
+            return [item async for item in client.stream("Explain ATP")]
+        finally:
+            await client.aclose()
+
+    return asyncio.run(run())
+
+
+def lines(*chunks):
+    return "".join(chunk if isinstance(chunk, str) else json.dumps(chunk) + "\n" for chunk in chunks)
+
+
+def test_stream_yields_tokens():
+    items = collect(lambda request: httpx.Response(200, text=lines({"response": "ATP "}, {"response": "stores energy", "done": True})))
+    assert items == ["ATP ", "stores energy"]
+    assert not any(isinstance(item, StreamError) for item in items)
+
+
+def test_stream_reports_ollama_errors():
+    items = collect(lambda request: httpx.Response(200, text=lines({"response": "ATP "}, {"error": "model not found"})))
+    assert items == ["ATP ", "Error: model not found"]
+    assert isinstance(items[-1], StreamError)
+
+
+def test_stream_reports_http_errors():
+    items = collect(lambda request: httpx.Response(500, text="boom"))
+    assert len(items) == 1 and isinstance(items[0], StreamError) and items[0].startswith("Error: HTTP error occurred")
+
+
+def test_stream_reports_malformed_lines():
+    items = collect(lambda request: httpx.Response(200, text=lines({"response": "ATP "}, "not json\n")))
+    assert items[0] == "ATP "
+    assert isinstance(items[-1], StreamError) and items[-1].startswith("Error: An unexpected error occurred")
+
+
+def test_stream_reports_dropped_connections():
+    def handler(request):
+        raise httpx.ReadError("connection reset", request=request)
+
+    items = collect(handler)
+    assert len(items) == 1 and isinstance(items[0], StreamError)
+    assert items[0] == "Error: An unexpected error occurred: connection reset"
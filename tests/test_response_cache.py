@@ -0,0 +1,114 @@
+import pytest
+from backend import qa_engine
+from backend.memory import ConversationMemory
+from backend.qa_engine import QAEngine
+from benchmarks.run import HashingEmbedder
+from data.note_storage import NotesStorage
+from data.vector_store import LocalVectorClient
+from services import response_cache
+from services.embeddings import EmbeddingService
+from services.response_cache import ResponseCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(response_cache, "time", clock)
+    return clock
+
+
+def key(cache, question, subject="biology", context="notes"):
+    return cache.make_key(subject, "template", "mistral", 0.5, context, question)
+
+
+def test_key_normalizes_question():
+    cache = ResponseCache()
+    assert key(cache, "What is  ATP?") == key(cache, "what is atp?")
+    assert key(cache, "What is ATP?") != key(cache, "What is ATP?", context="other notes")
+
+
+def test_entries_expire(clock):
+    cache = ResponseCache(ttl=60)
+    cache.set(key(cache, "q"), "answer")
+    clock.now += 59
+    assert cache.get(key(cache, "q")) == "answer"
+    clock.now += 2
+    assert cache.get(key(cache, "q")) is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_least_recently_used_entries_are_evicted():
+    cache = ResponseCache(max_entries=2)
+    cache.set(key(cache, "a"), "A")
+    cache.set(key(cache, "b"), "B")
+    cache.get(key(cache, "a"))
+    cache.set(key(cache, "c"), "C")
+    assert cache.get(key(cache, "b")) is None
+    assert cache.get(key(cache, "a")) == "A" and cache.get(key(cache, "c")) == "C"
+
+
+def test_invalidate_subject():
+    cache = ResponseCache()
+    cache.set(key(cache, "q"), "biology answer")
+    cache.set(key(cache, "q", subject="physics"), "physics answer")
+    cache.invalidate_subject("biology")
+    assert cache.get(key(cache, "q")) is None
+    assert cache.get(key(cache, "q", subject="physics")) == "physics answer"
+
+
+def test_find_similar(clock):
+    cache = ResponseCache(ttl=60, similarity_threshold=0.9)
+    cache.set(key(cache, "q"), "answer", embedding=[1.0, 0.0])
+    assert cache.find_similar("biology", "template", "mistral", 0.5, [0.99, 0.1]) == "answer"
+    assert cache.find_similar("biology", "template", "mistral", 0.5, [0.5, 0.5]) is None
+    assert cache.find_similar("physics", "template", "mistral", 0.5, [1.0, 0.0]) is None
+    clock.now += 61
+    assert cache.find_similar("biology", "template", "mistral", 0.5, [1.0, 0.0]) is None
+    assert ResponseCache(similarity_threshold=0).find_similar("biology", "template", "mistral", 0.5, [1.0, 0.0]) is None
+
+
+@pytest.fixture
+def engine(tmp_path):
+    client = LocalVectorClient(str(tmp_path / "notes"))
+    cache = ResponseCache()
+    storage = NotesStorage(client=client, embeddings=EmbeddingService(model=HashingEmbedder(), batch_window_ms=0), response_cache=cache)
+    storage.save_notes_from_texts("Biology", [("cells.txt", "Mitochondria make ATP for the cell.")])
+    yield QAEngine(storage, cache=cache, memory=ConversationMemory())
+    client.close()
+
+
+def answer_with(monkeypatch, responses):
+    calls = []
+
+    def query_ollama(prompt, **kwargs):
+        calls.append(prompt)
+        return responses[min(len(calls), len(responses)) - 1]
+
+    monkeypatch.setattr(qa_engine, "query_ollama", query_ollama)
+    return calls
+
+
+def test_answers_are_cached_until_notes_change(engine, monkeypatch):
+    calls = answer_with(monkeypatch, ["ATP comes from mitochondria."])
+    assert engine.answer_question("What makes ATP?", "Biology") == "ATP comes from mitochondria."
+    assert engine.answer_question("what makes  ATP?", "Biology") == "ATP comes from mitochondria."
+    assert len(calls) == 1
+    engine.storage.save_notes_from_texts("Biology", [("plants.txt", "Chloroplasts also make ATP.")])
+    engine.answer_question("What makes ATP?", "Biology")
+    assert len(calls) == 2
+
+
+def test_error_answers_are_never_cached_or_remembered(engine, monkeypatch):
+    calls = answer_with(monkeypatch, ["Error: Ollama timed out", "ATP comes from mitochondria."])
+    assert engine.answer_question("What makes ATP?", "Biology", session_id="s1") == "Error: Ollama timed out"
+    assert engine.memory.recall("s1", "biology", "And then?") == ("", "")
+    assert engine.answer_question("What makes ATP?", "Biology", session_id="s2") == "ATP comes from mitochondria."
+    assert len(calls) == 2
@@ -0,0 +1,134 @@
+import time
+import pytest
+from benchmarks.run import HashingEmbedder
+from data.due_index import DueIndex
+from data.flashcard_storage import FlashcardStorage
+from data.vector_store import LocalVectorClient
+from services.embeddings import EmbeddingService
+from services.spaced_repetition import (
+    DEFAULT_EASE, EASY_BONUS, FIRST_INTERVAL, HARD_FACTOR, MIN_EASE, RELEARN_DELAY_SECONDS, SECOND_INTERVAL,
+    SECONDS_PER_DAY, new_card_state, schedule
+)
+
+NOW = 1_700_000_000.0
+DAY = SECONDS_PER_DAY
+
+
+def review(ratings, now=NOW):
+    state = new_card_state(now)
+    for rating in ratings:
+        now = max(now, state["due_at"])
+        state = schedule(state, rating, now)
+    return state
+
+
+def test_new_card_is_due_now():
+    state = new_card_state(NOW)
+    assert state["due_at"] == NOW
+    assert state["ease"] == DEFAULT_EASE
+    assert state["repetitions"] == state["lapses"] == 0
+
+
+def test_good_reviews_follow_sm2_intervals():
+    first = schedule(new_card_state(NOW), "good", NOW)
+    assert first["interval_days"] == FIRST_INTERVAL
+    assert first["due_at"] == NOW + FIRST_INTERVAL * DAY
+    second = schedule(first, "good", first["due_at"])
+    assert second["interval_days"] == SECOND_INTERVAL
+    third = schedule(second, "good", second["due_at"])
+    assert third["interval_days"] == pytest.approx(SECOND_INTERVAL * DEFAULT_EASE)
+    assert third["repetitions"] == 3
+    assert third["last_reviewed_at"] == second["due_at"]
+
+
+@pytest.mark.parametrize("rating, ease", [("again", 1.96), ("hard", 2.36), ("good", 2.5), ("easy", 2.6)])
+def test_ease_update(rating, ease):
+    assert schedule(new_card_state(NOW), rating, NOW)["ease"] == pytest.approx(ease)
+
+
+def test_ease_never_drops_below_minimum():
+    assert review(["again"] * 10)["ease"] == MIN_EASE
+
+
+def test_hard_and_easy_intervals():
+    state = review(["good", "good"])
+    assert schedule(state, "hard", NOW)["interval_days"] == pytest.approx(SECOND_INTERVAL * HARD_FACTOR)
+    easy = schedule(state, "easy", NOW)
+    assert easy["interval_days"] == pytest.approx(SECOND_INTERVAL * easy["ease"] * EASY_BONUS)
+    assert schedule(new_card_state(NOW), "easy", NOW)["interval_days"] == pytest.approx(FIRST_INTERVAL * EASY_BONUS)
+
+
+def test_lapse_resets_repetitions():
+    state = review(["good", "good", "good"])
+    lapsed = schedule(state, "again", NOW)
+    assert lapsed["repetitions"] == 0
+    assert lapsed["lapses"] == 1
+    assert lapsed["interval_days"] == 0.0
+    assert lapsed["due_at"] == NOW + RELEARN_DELAY_SECONDS
+    # Relearning starts again from the first interval, with the reduced ease kept
+    relearned = schedule(lapsed, "good", lapsed["due_at"])
+    assert relearned["interval_days"] == FIRST_INTERVAL
+    assert relearned["ease"] < DEFAULT_EASE
+
+
+def test_missing_fields_default_to_new_card():
+    state = schedule({"ease": 2.0}, "good", NOW)
+    assert state["ease"] == pytest.approx(2.0)
+    assert state["repetitions"] == 1
+
+
+def test_unknown_rating():
+    with pytest.raises(ValueError):
+        schedule(new_card_state(NOW), "perfect", NOW)
+
+
+@pytest.fixture
+def client(tmp_path):
+    client = LocalVectorClient(str(tmp_path / "flashcards"))
+    yield client
+    client.close()
+
+
+def flashcard_storage(client):
+    return FlashcardStorage(client=client, embeddings=EmbeddingService(model=HashingEmbedder(), batch_window_ms=0),
+                            due_index=DueIndex())
+
+
+def test_due_flashcards(client):
+    storage = flashcard_storage(client)
+    cards = storage.save_flashcards("Biology", [{"question": f"Q{i}", "answer": f"A{i}"} for i in range(5)])
+    due, total = storage.get_due_flashcards("Biology", limit=3)
+    assert len(due) == 3 and total == 5
+    storage.record_review("Biology", cards[0]["id"], "good")
+    due, total = storage.get_due_flashcards("Biology", limit=10)
+    assert total == 4
+    assert cards[0]["id"] not in {card["id"] for card in due}
+    # Due again once the interval has passed
+    due, total = storage.get_due_flashcards("Biology", limit=10, now=time.time() + 30 * DAY)
+    assert total == 5
+
+
+def test_due_flashcards_check_stored_state(client):
+    # Two storages with their own due index stand in for two worker processes
+    storage, other = flashcard_storage(client), flashcard_storage(client)
+    cards = storage.save_flashcards("Biology", [{"question": f"Q{i}", "answer": f"A{i}"} for i in range(4)])
+    assert storage.get_due_flashcards("Biology", limit=2)[1] == 4
+    other.record_review("Biology", cards[0]["id"], "easy")
+    other.record_review("Biology", cards[1]["id"], "good")
+    other.delete_flashcard("Biology", cards[2]["id"])
+    due, _ = storage.get_due_flashcards("Biology", limit=2)
+    assert [card["id"] for card in due] == [cards[3]["id"]]
+
+
+def test_subject_recreated_elsewhere(client):
+    storage, other = flashcard_storage(client), flashcard_storage(client)
+    storage.save_flashcards("Biology", [{"question": "Q", "answer": "A"}])
+    assert storage.get_due_flashcards("Biology")[1] == 1
+    other.delete_subject("Biology")
+    cards = other.save_flashcards("Biology", [{"question": "Q2", "answer": "A2"}, {"question": "Q3", "answer": "A3"}])
+    # Writes are checked against the catalog, so they land in the recreated collection
+    storage.save_flashcards("Biology", [{"question": "Q4", "answer": "A4"}])
+    due, total = storage.get_due_flashcards("Biology")
+    assert total == 3
+    assert {card["id"] for card in cards} <= {card["id"] for card in due}
+    assert len(other.get_flashcards("Biology")) == 3
@@ -0,0 +1,87 @@
+import asyncio
+import pytest
+from services import structured_output
+from services.structured_output import (
+    EVALUATION, FLASHCARDS, PRACTICE_QUESTIONS, StructuredOutputError, parse_structured, salvage_json
+)
+
+
+@pytest.mark.parametrize("text, expected", [
+    ('{"score": 80, "feedback": "Good"}', {"score": 80, "feedback": "Good"}),
+    ('Here you go:\n```json\n[{"question": "Q1"}]\n```\nHope it helps!', [{"question": "Q1"}]),
+    ('```\n{"a": 1}', {"a": 1}),
+    ('Sure! {"a": [1, 2]} is the answer.', {"a": [1, 2]}),
+    # Truncated mid-array: the complete items are kept
+    ('[{"question": "Q1"}, {"question": "Q2"}, {"question": "Q', [{"question": "Q1"}, {"question": "Q2"}]),
+    ('Cards: [{"question": "A", "answer": "B"},\n {"question": "C", "ans', [{"question": "A", "answer": "B"}]),
+])
+def test_salvage_json(text, expected):
+    assert salvage_json(text) == expected
+
+
+@pytest.mark.parametrize("text", ["", "No JSON here", '[{"question": "Q1"', "{broken"])
+def test_salvage_json_without_json(text):
+    with pytest.raises(StructuredOutputError):
+        salvage_json(text)
+
+
+def test_parse_unwraps_list_from_object():
+    text = '{"flashcards": [{"question": "What is ATP?", "answer": "Energy currency"}]}'
+    assert parse_structured(text, FLASHCARDS) == [{"question": "What is ATP?", "answer": "Energy currency"}]
+
+
+def test_parse_wraps_single_object_in_list():
+    assert parse_structured('{"question": "Why?"}', PRACTICE_QUESTIONS) == [{"question": "Why?", "type": "long-answer"}]
+
+
+@pytest.mark.parametrize("text", [
+    '{"score": 120, "feedback": "Too high"}',
+    '{"score": 50}',
+    "Error: Ollama is not running",
+])
+def test_parse_rejects_invalid_output(text):
+    with pytest.raises(StructuredOutputError):
+        parse_structured(text, EVALUATION)
+
+
+def test_query_structured_repairs_once(monkeypatch):
+    responses = ['{"score": "great", "feedback": "ok"}', '{"score": 90, "feedback": "ok"}']
+    prompts = []
+
+    def query_ollama(prompt, **kwargs):
+        prompts.append(prompt)
+        return responses[len(prompts) - 1]
+
+    monkeypatch.setattr(structured_output, "query_ollama", query_ollama)
+    assert structured_output.query_structured("Grade this", EVALUATION) == {"score": 90, "feedback": "ok"}
+    assert len(prompts) == 2
+    assert '{"score": "great", "feedback": "ok"}' in prompts[1]
+
+
+def test_query_structured_gives_up_after_failed_repair(monkeypatch):
+    calls = []
+    monkeypatch.setattr(structured_output, "query_ollama", lambda prompt, **kwargs: calls.append(prompt) or "not json")
+    assert structured_output.query_structured("Grade this", EVALUATION) is None
+    assert len(calls) == 2
+
+
+def test_query_structured_does_not_repair_errors(monkeypatch):
+    calls = []
+    monkeypatch.setattr(structured_output, "query_ollama", lambda prompt, **kwargs: calls.append(prompt) or "Error: timed out")
+    assert structured_output.query_structured("Grade this", EVALUATION) is None
+    assert len(calls) == 1
+
+
+def test_generate_structured_repairs(monkeypatch):
+    class Client:
+        def __init__(self):
+            self.responses = ['[{"question": ""}]', '[{"question": "Define osmosis"}]']
+
+        async def generate(self, prompt, **kwargs):
+            return self.responses.pop(0)
+
+    client = Client()
+    monkeypatch.setattr(structured_output, "get_async_client", lambda: client)
+    result = asyncio.run(structured_output.generate_structured("Ask", PRACTICE_QUESTIONS))
+    assert result == [{"question": "Define osmosis", "type": "long-answer"}]
+    assert not client.responses
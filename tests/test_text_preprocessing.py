@@ -0,0 +1,66 @@
+import random
+import pytest
+from utils.text_preprocessing import chunk_text, merge_chunks, split_segments, iter_chunks
+
+
+def sample_text(seed: int = 0, paragraphs: int = 40) -> str:
+    rng = random.Random(seed)
+    words = ["cell", "membrane", "enzyme", "protein", "energy", "mitochondria", "osmosis", "nucleus"]
+    parts = []
+    for p in range(paragraphs):
+        sentences = [
+            " ".join(rng.choice(words) for _ in range(rng.randint(4, 30))).capitalize() + rng.choice(".!?")
+            for _ in range(rng.randint(1, 8))
+        ]
+        heading = f"## Section {p}\n" if p % 7 == 0 else ""
+        parts.append(heading + " ".join(sentences))
+    return "\n\n".join(parts)
+
+
+def check_chunks(text, chunks, chunk_size):
+    assert chunks[0]["start"] == 0
+    assert chunks[-1]["end"] == len(text)
+    for chunk in chunks:
+        assert chunk["text"] == text[chunk["start"]:chunk["end"]]
+        assert len(chunk["text"]) <= chunk_size
+    for previous, chunk in zip(chunks, chunks[1:]):
+        # Each chunk starts inside or right at the end of the one before: nothing is skipped
+        assert previous["start"] < chunk["start"] <= previous["end"]
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_chunk_offsets_cover_text(seed):
+    text = sample_text(seed)
+    chunks = chunk_text(text, chunk_size=400, overlap=80)
+    check_chunks(text, chunks, 400)
+    assert merge_chunks(chunks) == text
+    # Merging does not depend on the order chunks come back from storage
+    assert merge_chunks(list(reversed(chunks))) == text
+
+
+def test_chunks_overlap():
+    text = sample_text(1)
+    chunks = chunk_text(text, chunk_size=400, overlap=80)
+    assert any(chunk["start"] < previous["end"] for previous, chunk in zip(chunks, chunks[1:]))
+
+
+def test_long_words_are_hard_split():
+    text = "x" * 2500 + " tail."
+    segments = split_segments(text, max_length=1000)
+    assert all(end - start <= 1000 for start, end in segments)
+    assert "".join(text[start:end] for start, end in segments) == text
+    assert merge_chunks(chunk_text(text, chunk_size=1000, overlap=200)) == text
+
+
+def test_blank_text_has_no_chunks():
+    assert chunk_text("") == []
+    assert chunk_text(" \n\n\t ") == []
+
+
+@pytest.mark.parametrize("block_size", [1, 137, 1000, 5000, 100000])
+def test_streamed_chunks_match_text(block_size):
+    text = sample_text(2, paragraphs=120)
+    blocks = [text[i:i + block_size] for i in range(0, len(text), block_size)]
+    chunks = list(iter_chunks(blocks, chunk_size=400, overlap=80))
+    check_chunks(text, chunks, 400)
+    assert merge_chunks(chunks) == text
@@ -0,0 +1,147 @@
+import os
+import numpy as np
+import pytest
+from data import vector_store
+from data.vector_store import LocalVectorClient, _matches
+
+
+def unit(*values):
+    vector = np.array(values, dtype=np.float32)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
+@pytest.fixture
+def open_client(tmp_path):
+    clients = []
+
+    def open_client(**kwargs):
+        client = LocalVectorClient(str(tmp_path / "store"), **kwargs)
+        clients.append(client)
+        return client
+
+    yield open_client
+    for client in clients:
+        client.close()
+
+
+def reopen(client, open_client, **kwargs):
+    client.close()
+    return open_client(**kwargs)
+
+
+def test_matches_operators():
+    metadata = {"subject": "bio", "chunk_index": 0, "created_ts": 10.5}
+    assert _matches(metadata, {"subject": "bio"})
+    assert not _matches(metadata, {"subject": "chem"})
+    assert _matches(metadata, {"created_ts": {"$gte": 10.5, "$lt": 11}})
+    assert not _matches(metadata, {"created_ts": {"$gt": 10.5}})
+    assert _matches(metadata, {"subject": {"$in": ["bio", "chem"]}})
+    assert _matches(metadata, {"subject": {"$nin": ["chem"]}})
+    assert _matches(metadata, {"$and": [{"chunk_index": 0}, {"subject": {"$ne": "chem"}}]})
+    assert _matches(metadata, {"$or": [{"chunk_index": 1}, {"subject": "bio"}]})
+    assert not _matches(metadata, {"$or": [{"chunk_index": 1}, {"subject": "chem"}]})
+
+
+def test_condition_on_missing_key_never_matches():
+    assert not _matches({"subject": "bio"}, {"note_id": {"$ne": "x"}})
+
+
+def test_unknown_operator_is_rejected():
+    with pytest.raises(ValueError):
+        _matches({"a": 1}, {"a": {"$regex": "x"}})
+
+
+def test_get_and_query_apply_where(open_client):
+    collection = open_client().get_or_create_collection("notes_bio")
+    collection.add(
+        ids=["a", "b", "c"],
+        embeddings=[unit(1, 0, 0), unit(0, 1, 0), unit(0, 0, 1)],
+        metadatas=[{"chunk_index": 0}, {"chunk_index": 1}, {"chunk_index": 0}],
+        documents=["A", "B", "C"]
+    )
+    assert collection.get(where={"chunk_index": 0})["ids"] == ["a", "c"]
+    assert collection.get(where={"chunk_index": 0}, limit=1, offset=1)["ids"] == ["c"]
+    found = collection.query(query_embeddings=[unit(0, 1, 0.1)], n_results=1, where={"chunk_index": 0})
+    assert found["ids"] == [["c"]]
+    collection.delete(where={"chunk_index": 1})
+    assert collection.get()["ids"] == ["a", "c"]
+
+
+def test_records_survive_reopen(open_client):
+    client = open_client()
+    collection = client.get_or_create_collection("notes_bio")
+    collection.add(ids=["a", "b"], embeddings=[unit(1, 0), unit(0, 1)], metadatas=[{"n": 1}, {"n": 2}], documents=["A", "B"])
+    collection.update(ids=["a"], metadatas=[{"n": 3}], documents=["A2"])
+    collection.delete(ids=["b"])
+
+    collection = reopen(client, open_client).get_collection("notes_bio")
+    assert collection.get(include=["documents", "metadatas"]) == {
+        "ids": ["a"], "documents": ["A2"], "metadatas": [{"n": 3}], "embeddings": None
+    }
+    assert collection.query(query_embeddings=[unit(1, 0)], n_results=1)["ids"] == [["a"]]
+
+
+@pytest.mark.parametrize("dtype", ["float16", "int8"])
+def test_embeddings_round_trip(open_client, dtype):
+    collection = open_client(dtype=dtype).get_or_create_collection("notes_bio")
+    vectors = np.random.default_rng(0).normal(size=(20, 16)).astype(np.float32)
+    collection.add(ids=[str(i) for i in range(20)], embeddings=vectors)
+    stored = np.array(collection.get(include=["embeddings"])["embeddings"])
+    expected = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    assert np.allclose(stored, expected, atol=0.02)
+    for i in range(20):
+        assert collection.query(query_embeddings=[vectors[i]], n_results=1)["ids"] == [[str(i)]]
+
+
+def test_recovers_from_interrupted_writes(open_client):
+    client = open_client()
+    collection = client.get_or_create_collection("notes_bio")
+    collection.add(ids=["a", "b"], embeddings=[unit(1, 0, 0), unit(0, 1, 0)], documents=["A", "B"])
+    path = collection._path
+    client.close()
+    # A crash mid-append leaves half a vector row and half a log line behind
+    with open(os.path.join(path, "vectors.0.bin"), "ab") as f:
+        f.write(b"\x00\x01\x02")
+    with open(os.path.join(path, "records.0.jsonl"), "a") as f:
+        f.write('{"op":"add","id":"c","row":2')
+
+    collection = open_client().get_collection("notes_bio")
+    assert collection.get()["ids"] == ["a", "b"]
+    # New rows line up with their records after the torn tail is cut off
+    collection.add(ids=["c"], embeddings=[unit(0, 0, 1)], documents=["C"])
+    assert collection.query(query_embeddings=[unit(0, 0, 1)], n_results=1)["ids"] == [["c"]]
+    assert collection.query(query_embeddings=[unit(0, 1, 0)], n_results=1)["ids"] == [["b"]]
+
+
+def test_compaction_drops_dead_rows(open_client, monkeypatch):
+    monkeypatch.setattr(vector_store, "COMPACT_MIN_DEAD_ROWS", 4)
+    client = open_client(dtype="float16")
+    collection = client.get_or_create_collection("notes_bio")
+    vectors = np.eye(8, dtype=np.float32)
+    collection.add(ids=[str(i) for i in range(8)], embeddings=vectors, documents=[f"doc {i}" for i in range(8)])
+    collection.delete(ids=["0", "1", "2", "3", "4"])
+
+    assert collection._meta["generation"] == 1
+    assert collection._rows == 3
+    assert sorted(os.listdir(collection._path)) == ["meta.json", "records.1.jsonl", "vectors.1.bin"]
+    collection = reopen(client, open_client, dtype="float16").get_collection("notes_bio")
+    assert collection.get()["ids"] == ["5", "6", "7"]
+    for i in (5, 6, 7):
+        assert collection.query(query_embeddings=[vectors[i]], n_results=1)["ids"] == [[str(i)]]
+
+
+def test_ann_search_above_threshold(open_client):
+    pytest.importorskip("hnswlib")
+    collection = open_client(ann_threshold=50).get_or_create_collection("notes_bio")
+    vectors = np.random.default_rng(1).normal(size=(200, 16)).astype(np.float32)
+    collection.add(ids=[str(i) for i in range(200)], embeddings=vectors)
+    assert collection.query(query_embeddings=[vectors[42]], n_results=1)["ids"] == [["42"]]
+    assert collection._ann is not None
+
+
+def test_store_is_locked_to_one_client(open_client):
+    client = open_client()
+    with pytest.raises(RuntimeError):
+        open_client()
+    client.close()
+    open_client()
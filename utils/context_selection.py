@@ -0,0 +1,67 @@
+import random
+from typing import List, Optional
+import numpy as np
+from utils.text_preprocessing import estimate_tokens
+
+# Upper bound on the notes sent to Mistral per generation request, in estimated tokens
+CONTEXT_TOKEN_BUDGET = 3000
+# Rank offset for reciprocal rank fusion; 60 is the value from the original RRF paper
+RRF_K = 60
+# Weight of representativeness vs. novelty in maximal marginal relevance
+DEFAULT_MMR_LAMBDA = 0.5
+
+
+def select_diverse_passages(
+    documents: List[str],
+    embeddings,
+    token_budget: int,
+    mmr_lambda: float = DEFAULT_MMR_LAMBDA,
+    rng: Optional[random.Random] = None
+) -> List[int]:
+    """
+    Pick a representative, non-redundant subset of passages that fits in token_budget.
+    Uses maximal marginal relevance against the subject centroid. When rng is given the
+    first passage is chosen at random so repeated generations see different slices.
+    Returns indices into documents in their original order.
+    """
+    if not documents:
+        return []
+    vectors = np.asarray(embeddings, dtype=np.float32)
+    vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    centroid = vectors.mean(axis=0)
+    relevance = vectors @ (centroid / max(np.linalg.norm(centroid), 1e-12))
+    costs = np.array([estimate_tokens(doc) for doc in documents])
+
+    selected = []
+    remaining_budget = token_budget
+    # Highest similarity of each passage to anything already selected
+    redundancy = np.zeros(len(documents), dtype=np.float32)
+    available = np.ones(len(documents), dtype=bool)
+
+    while True:
+        # Passages that no longer fit are dropped up front, so each pass selects one
+        available &= costs <= remaining_budget
+        if not available.any():
+            break
+        if not selected and rng is not None:
+            best = int(rng.choice(np.flatnonzero(available).tolist()))
+        else:
+            scores = mmr_lambda * relevance - (1 - mmr_lambda) * redundancy
+            scores[~available] = -np.inf
+            best = int(np.argmax(scores))
+        available[best] = False
+        selected.append(best)
+        remaining_budget -= costs[best]
+        redundancy = np.maximum(redundancy, vectors @ vectors[best])
+    return sorted(selected)
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = RRF_K) -> List[str]:
+    """
+    Merge several best-first id rankings into one using reciprocal rank fusion.
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)
@@ -0,0 +1,37 @@
+import hashlib
+import json
+import re
+from typing import Optional
+
+
+def extract_partial_int(buffer: str, key: str) -> Optional[int]:
+    """
+    Return the integer value of key from a possibly incomplete JSON object,
+    or None until the number has been fully generated.
+    """
+    match = re.search(rf'"{re.escape(key)}"\s*:\s*(-?\d+)\s*[,}}\n]', buffer)
+    return int(match.group(1)) if match else None
+
+
+def extract_partial_string(buffer: str, key: str) -> Optional[str]:
+    """
+    Return the decoded prefix of key's string value from a possibly incomplete JSON object,
+    or None if the value has not started yet.
+    """
+    match = re.search(rf'"{re.escape(key)}"\s*:\s*"((?:[^"\\]|\\.)*)', buffer)
+    if not match:
+        return None
+    raw = match.group(1)
+    # A trailing \u escape may still be incomplete
+    raw = re.sub(r'\\u[0-9a-fA-F]{0,3}$', "", raw)
+    try:
+        return json.loads(f'"{raw}"')
+    except json.JSONDecodeError:
+        return None
+
+
+def content_hash(text: str) -> str:
+    """
+    SHA-256 hex digest of text, used to detect duplicate notes and unchanged passages.
+    """
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
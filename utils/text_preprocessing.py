@@ -0,0 +1,120 @@
+import re
+from typing import Dict, Iterable, Iterator, List
+
+# all-MiniLM-L6-v2 truncates its input at 256 word pieces, which is roughly
+# 1000 characters of English prose. Chunks are sized to stay under that limit.
+DEFAULT_CHUNK_SIZE = 1000
+DEFAULT_CHUNK_OVERLAP = 200
+# Rough characters-per-token ratio for Mistral's tokenizer on English text
+CHARS_PER_TOKEN = 4
+
+# Split after sentence punctuation, on blank lines and before markdown headings
+_SEGMENT_BOUNDARY = re.compile(r"(?<=[.!?])\s+|\n\s*\n|\n(?=#{1,6}\s)")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Cheap token count estimate used for prompt budgeting.
+    """
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def split_segments(text: str, max_length: int = DEFAULT_CHUNK_SIZE) -> List[tuple]:
+    """
+    Split text into contiguous (start, end) spans at sentence, paragraph and heading boundaries.
+    Spans longer than max_length are hard-split so no segment exceeds it.
+    """
+    spans = []
+    start = 0
+    for match in _SEGMENT_BOUNDARY.finditer(text):
+        if match.end() > start:
+            spans.append((start, match.end()))
+            start = match.end()
+    if start < len(text):
+        spans.append((start, len(text)))
+
+    segments = []
+    for start, end in spans:
+        while end - start > max_length:
+            # Prefer breaking on whitespace inside the window
+            cut = text.rfind(" ", start + 1, start + max_length)
+            if cut <= start:
+                cut = start + max_length
+            segments.append((start, cut))
+            start = cut
+        segments.append((start, end))
+    return segments
+
+
+def chunk_text(text: str, chunk_size: int = DEFAULT_CHUNK_SIZE, overlap: int = DEFAULT_CHUNK_OVERLAP) -> List[Dict]:
+    """
+    Split text into overlapping passages built from whole sentences where possible.
+    Returns list of dicts with text, start and end (character offsets into the original text).
+    """
+    if not text or not text.strip():
+        return []
+
+    segments = split_segments(text, chunk_size)
+    chunks = []
+    i = 0
+    while i < len(segments):
+        start = segments[i][0]
+        j = i
+        while j + 1 < len(segments) and segments[j + 1][1] - start <= chunk_size:
+            j += 1
+        end = segments[j][1]
+        chunks.append({"text": text[start:end], "start": start, "end": end})
+        if j + 1 >= len(segments):
+            break
+
+        # Step back over trailing segments so the next chunk overlaps this one
+        next_i = j + 1
+        while next_i - 1 > i and end - segments[next_i - 1][0] <= overlap:
+            next_i -= 1
+        i = next_i
+    return chunks
+
+
+def merge_chunks(chunks: List[Dict]) -> str:
+    """
+    Rebuild the original text from chunks produced by chunk_text, dropping overlapping regions.
+    """
+    text = ""
+    position = 0
+    for chunk in sorted(chunks, key=lambda c: c["start"]):
+        if chunk["end"] <= position:
+            continue
+        text += chunk["text"][max(position - chunk["start"], 0):]
+        position = chunk["end"]
+    return text
+
+
+def iter_chunks(blocks: Iterable[str], chunk_size: int = DEFAULT_CHUNK_SIZE, overlap: int = DEFAULT_CHUNK_OVERLAP) -> Iterator[Dict]:
+    """
+    Streaming version of chunk_text: consume text blocks (e.g. PDF pages) as they arrive
+    and yield chunks with offsets into the concatenated text, holding only a few chunks in memory.
+    """
+    buffer = ""
+    buffer_start = 0
+    for block in blocks:
+        buffer += block
+        # Keep a tail of unfinished text so chunks near the end can still grow
+        if len(buffer) < chunk_size * 4:
+            continue
+        chunks = chunk_text(buffer, chunk_size, overlap)
+        if not chunks:
+            # Only whitespace so far
+            buffer_start += len(buffer)
+            buffer = ""
+            continue
+        safe_end = len(buffer) - chunk_size
+        k = 0
+        while k < len(chunks) and chunks[k]["end"] <= safe_end:
+            k += 1
+        for chunk in chunks[:k]:
+            yield {"text": chunk["text"], "start": buffer_start + chunk["start"], "end": buffer_start + chunk["end"]}
+        if k < len(chunks):
+            buffer_start += chunks[k]["start"]
+            buffer = buffer[chunks[k]["start"]:]
+    for chunk in chunk_text(buffer, chunk_size, overlap):
+        yield {"text": chunk["text"], "start": buffer_start + chunk["start"], "end": buffer_start + chunk["end"]}